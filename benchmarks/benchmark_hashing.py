@@ -0,0 +1,85 @@
+"""Benchmark the file hashing engine of DCKit
+
+Hashes all .rtdc and .tdms files in the given directories (or the
+given files) with
+
+- `dclab.util.hashfile` (the previous implementation),
+- :func:`dckit.hashing.compute_hash` (one file at a time), and
+- :func:`dckit.hashing.hash_files` (multiple files in parallel)
+
+and prints the throughput in GB/s. The disk cache is not used.
+Run the benchmark once for a directory on a local SSD and once for a
+directory on a network share (e.g. NFS) to compare them, e.g.::
+
+    python benchmark_hashing.py /data/local /mnt/nfs/data
+
+Note that the operating system caches file contents in memory. To
+measure disk throughput, the data should be larger than the memory
+or the page cache should be dropped between runs (on Linux as root:
+``sync; echo 3 > /proc/sys/vm/drop_caches``).
+"""
+import argparse
+import hashlib
+import pathlib
+import time
+
+import dclab
+
+from dckit import hashing
+
+
+def get_files(paths):
+    files = []
+    for path in paths:
+        path = pathlib.Path(path)
+        if path.is_dir():
+            files += sorted(path.rglob("*.rtdc"))
+            files += sorted(path.rglob("*.tdms"))
+        else:
+            files.append(path)
+    return files
+
+
+def measure(name, func, files):
+    size = sum(pp.stat().st_size for pp in files)
+    t0 = time.perf_counter()
+    func(files)
+    duration = time.perf_counter() - t0
+    print(f"  {name:<32s} {size / duration / 1e9:6.2f} GB/s "
+          f"({size / 1e9:.2f} GB in {duration:.1f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("paths", nargs="+",
+                        help="directories or files to hash")
+    parser.add_argument("-j", "--workers", type=int, default=4,
+                        help="number of files hashed in parallel")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        files = get_files([path])
+        if not files:
+            print(f"{path}: no files found")
+            continue
+        print(f"{path}: {len(files)} files")
+        measure("dclab.util.hashfile (sha256)",
+                lambda ff: [dclab.util.hashfile(pp,
+                                                constructor=hashlib.sha256)
+                            for pp in ff],
+                files)
+        for algorithm in sorted({"sha256", hashing.FAST_ALGORITHM}):
+            measure(f"compute_hash ({algorithm})",
+                    lambda ff: [hashing.compute_hash(pp, algorithm=algorithm)
+                                for pp in ff],
+                    files)
+            measure(f"hash_files ({algorithm}, {args.workers} workers)",
+                    lambda ff: hashing.hash_files(ff,
+                                                  algorithm=algorithm,
+                                                  num_workers=args.workers,
+                                                  cached=False),
+                    files)
+
+
+if __name__ == "__main__":
+    main()
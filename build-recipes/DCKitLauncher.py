@@ -1,4 +1,8 @@
+import multiprocessing as mp
+
 from dckit.__main__ import main
 
 if __name__ == "__main__":
+    # required for process pools in frozen applications
+    mp.freeze_support()
     main()
@@ -0,0 +1,3 @@
+#!/usr/bin/env python
+# This file was created automatically
+longversion = '2025.08.19-22-04-44'
@@ -0,0 +1,240 @@
+"""Command-line interface for processing RT-DC data in batches
+
+The `dckit-batch` command runs one of the tasks of
+:mod:`dckit.tasks` for all files listed in a manifest and
+writes a JSON report with one entry per file. A manifest is either
+a CSV file with a "path" column (optional columns are "sample" and
+metadata overrides named "section:key", e.g. "setup:medium") or a
+JSON file with a list of objects such as::
+
+    [{"path": "M1_data.rtdc",
+      "sample": "beads",
+      "metadata": {"setup": {"medium": "CellCarrier"}}}]
+
+Relative paths are relative to the directory of the manifest.
+Unless a report file is given, the report is the only output on
+stdout; progress information is written to stderr.
+"""
+import argparse
+import contextlib
+import csv
+import dataclasses
+import datetime
+import json
+import os
+import pathlib
+import sys
+import time
+
+import dclab
+
+from . import disk_cache
+from . import tasks
+from ._version import version
+
+
+#: tasks that can be run with `dckit-batch`
+BATCH_TASKS = ["compress", "tdms2rtdc", "split", "join", "metadata",
+               "integrity"]
+
+
+def batch(args=None):
+    """Entry point of the `dckit-batch` command"""
+    parser = batch_parser()
+    args = parser.parse_args(args)
+    inputs = read_manifest(args.manifest)
+    if not inputs:
+        parser.error(f"The manifest '{args.manifest}' does not list "
+                     + "any files!")
+    if args.task in ["compress", "tdms2rtdc", "split", "join"]:
+        if args.output is None:
+            parser.error(f"The task '{args.task}' requires --output!")
+    num_workers = args.workers or os.cpu_count()
+
+    def progress(done, total, result):
+        if not args.quiet:
+            print(f"[{done}/{total}] {result.status}: {result.path}",
+                  file=sys.stderr, flush=True)
+
+    kwargs = {"progress": progress,
+              "num_workers": num_workers}
+    if args.task in ["compress", "tdms2rtdc", "split"]:
+        path_out = pathlib.Path(args.output)
+        path_out.mkdir(parents=True, exist_ok=True)
+        kwargs["path_out"] = path_out
+        kwargs["repack"] = args.repack
+        kwargs["checksums"] = args.checksums
+
+    if args.task == "split":
+        if args.split_size is None and args.split_time is None:
+            kwargs["split_events"] = args.split_events or 10000
+        elif args.split_events is not None:
+            parser.error("Please specify only one of --split-events, "
+                         + "--split-size, or --split-time!")
+
+    t0 = time.perf_counter()
+    # dclab prints progress information (e.g. "Compression 0%") to
+    # stdout, which is reserved for the report.
+    with stdout_to_stderr():
+        results = run_task(args, inputs, **kwargs)
+    duration = time.perf_counter() - t0
+
+    report = {
+        "dckit": version,
+        "dclab": dclab.__version__,
+        "task": args.task,
+        "manifest": str(pathlib.Path(args.manifest).resolve()),
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "duration": duration,
+        "workers": num_workers,
+        "results": [dataclasses.asdict(res) for res in results],
+    }
+    report_dump = json.dumps(report, indent=2, sort_keys=True,
+                             default=disk_cache.json_converter)
+    if args.report:
+        pathlib.Path(args.report).write_text(report_dump, encoding="utf-8")
+    else:
+        print(report_dump)
+
+    failed = [res for res in results if res.status == "error"]
+    if not args.quiet:
+        print(f"Processed {len(results)} files in {duration:.1f}s "
+              + f"({len(failed)} errors).", file=sys.stderr)
+    return 1 if failed else 0
+
+
+@contextlib.contextmanager
+def stdout_to_stderr():
+    """Redirect stdout to stderr
+
+    This includes the output of worker processes started within
+    the context, which inherit the file descriptors.
+    """
+    sys.stdout.flush()
+    stdout_fd = os.dup(1)
+    os.dup2(2, 1)
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            yield
+    finally:
+        sys.stderr.flush()
+        os.dup2(stdout_fd, 1)
+        os.close(stdout_fd)
+
+
+def run_task(args, inputs, **kwargs):
+    """Run the task of the parsed `dckit-batch` arguments `args`"""
+    if args.task == "compress":
+        results = tasks.compress(inputs, **kwargs)
+    elif args.task == "tdms2rtdc":
+        results = tasks.tdms2rtdc(inputs, **kwargs)
+    elif args.task == "split":
+        results = tasks.split(inputs,
+                              split_size=args.split_size,
+                              split_time=args.split_time,
+                              **kwargs)
+    elif args.task == "metadata":
+        results = tasks.update_metadata(inputs, **kwargs)
+    elif args.task == "integrity":
+        results = tasks.integrity_check(inputs, **kwargs)
+    elif args.task == "join":
+        sample = args.sample
+        if sample is None:
+            sample = inputs[0].sample
+        results = [tasks.join(inputs,
+                              path_out=args.output,
+                              sample=sample,
+                              repack=args.repack,
+                              checksums=args.checksums)]
+    return results
+
+
+def batch_parser():
+    descr = "Process RT-DC data listed in a manifest file with DCKit."
+    parser = argparse.ArgumentParser(prog="dckit-batch", description=descr)
+    parser.add_argument("task", choices=BATCH_TASKS,
+                        help="task to perform")
+    parser.add_argument("manifest",
+                        help="CSV or JSON file listing the input files")
+    parser.add_argument("-o", "--output",
+                        help="output directory (output file for 'join')")
+    parser.add_argument("-r", "--report",
+                        help="path to the JSON report (default: stdout)")
+    parser.add_argument("-j", "--workers", type=int, default=0,
+                        help="number of worker processes "
+                             + "(default: number of CPUs)")
+    parser.add_argument("--repack", action="store_true",
+                        help="repack the output files and strip the logs")
+    parser.add_argument("--checksums", action="store_true",
+                        help="write the SHA-256 checksums of the output "
+                             + "files to 'SHA256SUMS' in the output "
+                             + "directory")
+    parser.add_argument("--split-events", type=int,
+                        help="number of events per file for 'split' "
+                             + "(default: 10000)")
+    parser.add_argument("--split-size", type=float,
+                        help="target file size in MB for 'split'")
+    parser.add_argument("--split-time", type=float,
+                        help="measurement time in seconds per file for "
+                             + "'split'")
+    parser.add_argument("--sample",
+                        help="sample name of the joined dataset for 'join' "
+                             + "(default: sample name of first input file)")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="do not print progress information")
+    parser.add_argument('--version', action='version',
+                        version=f'%(prog)s {version}')
+    return parser
+
+
+def read_manifest(path):
+    """Read a CSV or JSON manifest file
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to the manifest (the format is determined by the
+        suffix: ".json" for JSON, else CSV)
+
+    Returns
+    -------
+    inputs: list of dckit.tasks.TaskInput
+        Input files with their metadata overrides
+    """
+    path = pathlib.Path(path)
+    if path.suffix.lower() == ".json":
+        entries = json.loads(path.read_text(encoding="utf-8"))
+    else:
+        entries = []
+        with path.open("r", encoding="utf-8", newline="") as fd:
+            for row in csv.DictReader(fd):
+                entry = {"path": row.pop("path"),
+                         "metadata": {}}
+                for key, value in row.items():
+                    if not value:
+                        continue
+                    elif key == "sample":
+                        entry["sample"] = value
+                    elif key.count(":") == 1:
+                        sec, skey = key.split(":")
+                        entry["metadata"].setdefault(sec, {})[skey] = \
+                            parse_metadata_value(sec, skey, value)
+                    else:
+                        raise ValueError(
+                            f"Invalid column '{key}' in '{path}'!")
+                entries.append(entry)
+
+    inputs = []
+    for entry in entries:
+        metadata = entry.get("metadata", {})
+        if entry.get("sample"):
+            metadata.setdefault("experiment", {})["sample"] = entry["sample"]
+        inputs.append(tasks.TaskInput(path=path.parent / entry["path"],
+                                      metadata=metadata))
+    return inputs
+
+
+def parse_metadata_value(section, key, value):
+    """Convert a metadata string from a CSV manifest to its proper type"""
+    func = dclab.dfn.get_config_value_func(section, key)
+    return func(value)
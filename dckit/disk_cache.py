@@ -0,0 +1,200 @@
+"""Persistent cache for information derived from measurement files
+
+Entries are stored in an SQLite database in the user configuration
+directory. Each entry is keyed by the resolved path of a file and
+remembers the size, modification time, and inode of that file at the
+time the entry was written (the file fingerprint). If the fingerprint
+of a file changes, all of its entries are considered stale and are
+discarded on access.
+"""
+import json
+import numbers
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+
+import numpy as np
+
+
+#: Increment this when the layout of the stored data changes
+SCHEMA_VERSION = 1
+
+
+class DiskCache(object):
+    def __init__(self, path):
+        """Fingerprint-keyed key-value store
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Path to the SQLite database file
+
+        Notes
+        -----
+        The cache is best-effort; if the database cannot be accessed,
+        lookups are cache misses and stores are ignored. SQLite
+        connections are kept per thread, so a single instance may be
+        shared by multiple threads. Multiple processes may use the
+        same database file at the same time.
+        """
+        self.path = pathlib.Path(path)
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS entries ("
+                         "path TEXT NOT NULL, "
+                         "kind TEXT NOT NULL, "
+                         "key TEXT NOT NULL, "
+                         "size INTEGER, "
+                         "mtime_ns INTEGER, "
+                         "inode INTEGER, "
+                         "value TEXT, "
+                         "PRIMARY KEY (path, kind, key))")
+            conn.commit()
+            self._local.conn = conn
+        return conn
+
+    def clear(self):
+        """Remove all entries from the cache"""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM entries")
+        except sqlite3.Error:
+            pass
+
+    def get(self, path, kind, key=""):
+        """Return the entry for a file or None if there is none
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Path to the file the entry belongs to
+        kind: str
+            Type of information (e.g. "probe" or "config")
+        key: str
+            Additional key for `kind`, e.g. the version of the
+            software that computed the entry
+        """
+        try:
+            fp = fingerprint(path)
+        except OSError:
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT size, mtime_ns, inode, value FROM entries "
+                "WHERE path=? AND kind=? AND key=?",
+                (fp[0], kind, key)).fetchone()
+            if row is None:
+                return None
+            elif tuple(row[:3]) != fp[1:]:
+                # The file changed, all entries are stale.
+                with conn:
+                    conn.execute("DELETE FROM entries WHERE path=?",
+                                 (fp[0],))
+                return None
+        except sqlite3.Error:
+            return None
+        return json.loads(row[3])
+
+    def remove(self, path):
+        """Remove all entries of a file"""
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM entries WHERE path=?",
+                             (str(pathlib.Path(path).resolve()),))
+        except sqlite3.Error:
+            pass
+
+    def set(self, path, kind, value, key=""):
+        """Store an entry for a file
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Path to the file the entry belongs to
+        kind: str
+            Type of information (e.g. "probe" or "config")
+        value:
+            JSON-serializable object
+        key: str
+            Additional key for `kind`
+        """
+        try:
+            fp = fingerprint(path)
+        except OSError:
+            return
+        dump = json.dumps(value, default=json_converter)
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(path, kind, key, size, mtime_ns, inode, value) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (fp[0], kind, key, fp[1], fp[2], fp[3], dump))
+        except sqlite3.Error:
+            pass
+
+
+def fingerprint(path):
+    """Return (resolved path, size, mtime_ns, inode) of a file"""
+    path = pathlib.Path(path).resolve()
+    st = path.stat()
+    return str(path), st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def get_cache():
+    """Return the DCKit disk cache (shared within a process)"""
+    global _cache
+    if _cache is None:
+        _cache = DiskCache(get_cache_dir() / f"cache_v{SCHEMA_VERSION}.db")
+    return _cache
+
+
+def get_cache_dir():
+    """Return the directory in which DCKit stores its cache
+
+    This is the "DC-Analysis/DCKit" subdirectory of the user
+    configuration directory (next to the DCKit settings file).
+    It can be overridden with the environment variable
+    "DCKIT_CACHE_DIR".
+    """
+    if "DCKIT_CACHE_DIR" in os.environ:
+        return pathlib.Path(os.environ["DCKIT_CACHE_DIR"])
+    if sys.platform == "win32":
+        base = pathlib.Path(os.environ.get(
+            "APPDATA", pathlib.Path.home() / "AppData" / "Roaming"))
+    else:
+        base = pathlib.Path(os.environ.get(
+            "XDG_CONFIG_HOME", pathlib.Path.home() / ".config"))
+    return base / "DC-Analysis" / "DCKit"
+
+
+def json_converter(obj):
+    """Convert numpy data types for storing entries as JSON"""
+    if isinstance(obj, (bool, np.bool_)):
+        return bool(obj)
+    elif isinstance(obj, numbers.Integral):
+        return int(obj)
+    elif isinstance(obj, numbers.Real):
+        return float(obj)
+    elif isinstance(obj, bytes):
+        return obj.decode("utf-8")
+    elif isinstance(obj, np.ndarray):
+        return obj.tolist()
+    elif isinstance(obj, pathlib.Path):
+        return str(obj)
+    else:
+        raise TypeError(
+            "Object of type '{}' is not JSON serializable".format(type(obj)))
+
+
+_cache = None
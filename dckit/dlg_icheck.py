@@ -1,17 +1,16 @@
 import copy
 import html
 import json
-import functools
 import numbers
 
 import importlib.resources
-import warnings
 
 import dclab
 from dclab.features.emodulus.viscosity import KNOWN_MEDIA
 import numpy as np
 from PyQt5 import uic, QtWidgets
 
+from . import integrity
 from . import meta_tool
 from .wait_cursor import show_wait_cursor
 
@@ -58,28 +57,37 @@ class IntegrityCheckDialog(QtWidgets.QDialog):
 
         default_metadata is only used if the data are not present
         in user_metadata and given in editable_metadata.
+
+        If the dataset has not been checked yet, `editable_metadata`
+        and `user_metadata` are populated without creating a dialog
+        (see :func:`dckit.integrity.complete_user_metadata`).
+        """
+        if path not in cls.editable_metadata:
+            editables = integrity.get_editable_keys(path)
+            cls.update_from_check(
+                path,
+                editables=editables,
+                user_metadata=integrity.complete_user_metadata(
+                    path, editables,
+                    user_metadata=cls.user_metadata.get(path),
+                    default_metadata=cls.default_metadata))
+        return integrity.get_check_metadata(
+            editables=cls.editable_metadata[path],
+            user_metadata=cls.user_metadata.get(path),
+            default_metadata=cls.default_metadata)
+
+    @classmethod
+    def update_from_check(cls, path, editables, user_metadata):
+        """Remember the editable keys and completed metadata of a path
+
+        The dictionaries in `user_metadata` and `editable_metadata`
+        are updated in-place, because they are shared with open
+        dialogs and with the dataset registry.
         """
-        if path not in cls.user_metadata:
-            # first create the class to populate ´editable_metadata´
-            IntegrityCheckDialog(None, path)
-        editables = cls.editable_metadata[path]
-        userdata = cls.user_metadata[path]
-        defaults = cls.default_metadata
-        metadata = {}
-        # first fill up the default values (if applicable)
-        for sec in editables:
-            if sec not in metadata:
-                metadata[sec] = {}
-            for key in editables[sec]:
-                if sec in defaults and key in defaults[sec]:
-                    metadata[sec][key] = defaults[sec][key]
-        # then fill up the userdata
-        for sec in userdata:
-            if sec not in metadata:
-                metadata[sec] = {}
-            for key in userdata[sec]:
-                metadata[sec][key] = userdata[sec][key]
-        return metadata
+        cls.editable_metadata.setdefault(path, {}).update(editables)
+        metadata = cls.user_metadata.setdefault(path, {})
+        metadata.clear()
+        metadata.update(user_metadata)
 
     def populate_ui(self):
         """Run check and set missing UI elements"""
@@ -196,7 +204,8 @@ class IntegrityCheckDialog(QtWidgets.QDialog):
                                        sort_keys=True)
         else:
             metadata_dump = json.dumps({})
-        cues = check_dataset(self.path, metadata_dump, expand_section)
+        cues = integrity.check_dataset(self.path, metadata_dump,
+                                       expand_section)
         return cues
 
     @show_wait_cursor
@@ -206,13 +215,7 @@ class IntegrityCheckDialog(QtWidgets.QDialog):
             self.save_current_metadata()
         # run check again
         cues = self.check(use_metadata=True, expand_section=False)
-        levels = dclab.rtdc_dataset.check.ICue.get_level_summary(cues)
-        if levels["violation"]:
-            self.state = "failed"
-        elif levels["alert"]:
-            self.state = "tolerable"
-        else:
-            self.state = "passed"
+        self.state = integrity.get_state(cues)
 
         super(IntegrityCheckDialog, self).done(r)
 
@@ -226,21 +229,10 @@ class IntegrityCheckDialog(QtWidgets.QDialog):
         2. dataset on disk (using meta_tool)
         3. self.default_metadata
         """
-        value = None
-        # Try user-defined values
-        if sec in self.metadata and key in self.metadata[sec]:
-            value = self.metadata[sec][key]
-        # Try dataset
-        if value is None:
-            config = meta_tool.get_rtdc_config(self.path)
-            if sec in config and key in config[sec]:
-                value = config[sec][key]
-        # Try default/global metadata
-        if (value is None
-            and sec in self.default_metadata
-                and key in self.default_metadata[sec]):
-            value = self.default_metadata[sec][key]
-        return value
+        return integrity.get_metadata_value(
+            self.path, sec, key,
+            user_metadata=self.metadata,
+            default_metadata=self.default_metadata)
 
     def on_global(self):
         """Use the current metadata as default metadata"""
@@ -303,46 +295,3 @@ class IntegrityCheckDialog(QtWidgets.QDialog):
                     # remove the value from the metadata
                     if sec in self.metadata and key in self.metadata[sec]:
                         self.metadata[sec].pop(key)
-
-
-@functools.lru_cache(maxsize=1000)
-def check_dataset(path, metadata_dump, expand_section):
-    """Caching wrapper for integrity checks"""
-    metadata = json.loads(metadata_dump)
-    with warnings.catch_warnings(record=True) as ws:
-        warnings.simplefilter("always")
-        # ignore "ResourceWarning: unclosed file <_io.BufferedReader name=29"
-        warnings.simplefilter("ignore", ResourceWarning)
-
-        with dclab.new_dataset(path) as ds:
-            ds.config.update(metadata)
-            ic = dclab.rtdc_dataset.check.IntegrityChecker(ds)
-            cues = ic.check(expand_section=expand_section)
-
-            # Also check for medium "other" and offer to edit it
-            for cue in cues:
-                if cue.identifier == "Shape-In issue #3":
-                    warnings.warn("DCKit attempted to fix '[setup]: medium'! "
-                                  "(Shape-In issue #3)",
-                                  meta_tool.MetadataEditedWarning)
-                if (cue.category in ["metadata missing", "metadata wrong"]
-                    and cue.cfg_section == "setup"
-                        and cue.cfg_key == "medium"):
-                    # The cue already exists.
-                    break
-            else:
-                # The cue does not exist - add it.
-                medium = ds.config.get("setup", {}).get("medium", "")
-                if medium in ["other", ""]:
-                    cues.append(dclab.rtdc_dataset.check.ICue(
-                        msg="User might want to edit 'medium'",
-                        level="alert",
-                        category="metadata missing",
-                        cfg_section="setup",
-                        cfg_key="medium"))
-        for ww in ws:
-            cues.append(dclab.rtdc_dataset.check.ICue(
-                msg="{}: {}".format(ww.category.__name__, ww.message),
-                level="alert",
-                category="warning"))
-    return cues
@@ -0,0 +1,262 @@
+"""Cached hashes of measurement files
+
+The SHA-256 hash of an input file is part of the output file names
+of DCKit (see :func:`dckit.tasks.get_rtdc_output_name`). Computing it
+requires reading the entire file, so hashes are stored in the disk
+cache (:mod:`dckit.disk_cache`, keyed by the file fingerprint) and
+the :class:`BackgroundHasher` computes them when files are added to
+DCKit, before the user starts a task.
+
+Files are read in large blocks in a separate thread, so that reading
+the next block overlaps with hashing the current one (hashlib releases
+the GIL). Multiple files are hashed in parallel with :func:`hash_files`.
+For change detection, :func:`get_fingerprint` uses a fast
+non-cryptographic hash if xxhash is installed.
+"""
+import concurrent.futures
+import hashlib
+import os
+import pathlib
+import queue
+import threading
+
+from . import disk_cache
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+
+#: Size of the blocks in bytes that are read for hashing a file
+BLOCK_SIZE = 8 * 1024**2
+
+#: Number of blocks that are read ahead of hashing
+NUM_BUFFERS = 3
+
+#: Algorithm used by :func:`get_fingerprint` (without xxhash, SHA-256
+#: is used, because it is the fastest algorithm of hashlib on CPUs with
+#: SHA extensions)
+FAST_ALGORITHM = "xxh3_128" if xxhash is not None else "sha256"
+
+
+class HashingAbortedError(Exception):
+    """Raised when computing a hash was aborted"""
+    pass
+
+
+class BackgroundHasher(object):
+    def __init__(self):
+        """Compute the hashes of files in a background thread
+
+        The hashes are stored in the disk cache, from where
+        :func:`get_sha256` retrieves them. Files whose hash is
+        already cached are skipped.
+        """
+        self._queue = queue.Queue()
+        self._running = threading.Event()
+        self._running.set()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def pause(self):
+        """Pause hashing (e.g. while a task accesses the disk)"""
+        self._running.clear()
+
+    def resume(self):
+        """Resume hashing"""
+        self._running.set()
+
+    def stop(self):
+        """Stop hashing (the current file is discarded)"""
+        self._stopped.set()
+        self._running.set()
+        self._queue.put(None)
+
+    def submit(self, paths):
+        """Add files to the hashing queue"""
+        if self._stopped.is_set():
+            return
+        for path in paths:
+            self._queue.put(pathlib.Path(path))
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run,
+                                            name="BackgroundHasher",
+                                            daemon=True)
+            self._thread.start()
+
+    def wait(self):
+        """Block until all submitted files are processed"""
+        self._queue.join()
+
+    def run(self):
+        while True:
+            path = self._queue.get()
+            try:
+                if path is None or self._stopped.is_set():
+                    break
+                get_sha256(path, abort=self._should_abort)
+            except (OSError, HashingAbortedError):
+                pass
+            finally:
+                self._queue.task_done()
+        # do not block :func:`wait` with remaining items
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            else:
+                self._queue.task_done()
+
+    def _should_abort(self):
+        self._running.wait()
+        return self._stopped.is_set()
+
+
+def compute_hash(path, algorithm="sha256", abort=None):
+    """Compute the hash of a file
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to the file
+    algorithm: str
+        Name of the hashing algorithm, any algorithm of :mod:`hashlib`
+        or of xxhash (e.g. "xxh3_128", if installed)
+    abort: callable
+        Called after each block that was hashed; if it returns True,
+        :class:`HashingAbortedError` is raised
+
+    Returns
+    -------
+    hexdigest: str
+        Hash of the file
+
+    Notes
+    -----
+    Blocks are read with `readinto` into preallocated buffers instead
+    of memory-mapping the file, because page faults are slow on network
+    file systems and mapping does not allow reading ahead of hashing.
+    """
+    hasher = get_hasher(algorithm)
+    with open(path, "rb", buffering=0) as fd:
+        if os.fstat(fd.fileno()).st_size <= BLOCK_SIZE:
+            # not worth starting a thread
+            hasher.update(fd.readall())
+            if abort is not None and abort():
+                raise HashingAbortedError(f"Hashing aborted: {path}")
+            return hasher.hexdigest()
+
+        free = queue.Queue()
+        full = queue.Queue()
+        for _ in range(NUM_BUFFERS):
+            free.put(bytearray(BLOCK_SIZE))
+        stop = threading.Event()
+        reader = threading.Thread(target=_read_blocks,
+                                  args=(fd, free, full, stop),
+                                  name="HashReader",
+                                  daemon=True)
+        reader.start()
+        try:
+            while True:
+                buf, nbytes = full.get()
+                if isinstance(buf, BaseException):
+                    raise buf
+                elif not nbytes:
+                    break
+                hasher.update(memoryview(buf)[:nbytes])
+                free.put(buf)
+                if abort is not None and abort():
+                    raise HashingAbortedError(f"Hashing aborted: {path}")
+        finally:
+            stop.set()
+            # wake up the reader in case it waits for a buffer
+            free.put(bytearray(1))
+            reader.join()
+    return hasher.hexdigest()
+
+
+def _read_blocks(fd, free, full, stop):
+    """Read blocks from `fd` into the buffers from the `free` queue"""
+    try:
+        while not stop.is_set():
+            buf = free.get()
+            if stop.is_set():
+                break
+            nbytes = fd.readinto(buf)
+            full.put((buf, nbytes))
+            if not nbytes:
+                break
+    except BaseException as exc:
+        full.put((exc, 0))
+
+
+def compute_sha256(path, abort=None):
+    """Compute the SHA-256 hash of a file (see :func:`compute_hash`)"""
+    return compute_hash(path, algorithm="sha256", abort=abort)
+
+
+def get_fingerprint(path, abort=None):
+    """Return a fast hash of a file for change detection (cached on disk)
+
+    The algorithm (:const:`FAST_ALGORITHM`) depends on whether xxhash
+    is installed, so fingerprints should not be stored elsewhere.
+    """
+    return get_hash(path, algorithm=FAST_ALGORITHM, abort=abort)
+
+
+def get_hash(path, algorithm="sha256", abort=None):
+    """Return the hash of a file (cached on disk)
+
+    See :func:`compute_hash` for a description of the parameters.
+    """
+    cache = disk_cache.get_cache()
+    hexdigest = cache.get(path, "hash", key=algorithm)
+    if hexdigest is None:
+        hexdigest = compute_hash(path, algorithm=algorithm, abort=abort)
+        cache.set(path, "hash", hexdigest, key=algorithm)
+    return hexdigest
+
+
+def get_hasher(algorithm):
+    """Return a new hash object for `algorithm`"""
+    if algorithm in hashlib.algorithms_available:
+        return hashlib.new(algorithm)
+    elif xxhash is not None and algorithm in xxhash.algorithms_available:
+        return getattr(xxhash, algorithm)()
+    else:
+        raise ValueError(f"Unknown or unavailable hash algorithm "
+                         f"'{algorithm}'!")
+
+
+def get_sha256(path, abort=None):
+    """Return the SHA-256 hash of a file (cached on disk)"""
+    return get_hash(path, algorithm="sha256", abort=abort)
+
+
+def hash_files(paths, algorithm="sha256", num_workers=4, cached=True):
+    """Hash multiple files in parallel
+
+    Parameters
+    ----------
+    paths: list of str or pathlib.Path
+        Paths to the files
+    algorithm: str
+        See :func:`compute_hash`
+    num_workers: int
+        Number of files that are hashed at the same time
+    cached: bool
+        Whether to use (and populate) the disk cache
+
+    Returns
+    -------
+    hexdigests: list of str
+        Hashes in the order of `paths`
+    """
+    func = get_hash if cached else compute_hash
+    with concurrent.futures.ThreadPoolExecutor(
+            max_workers=num_workers) as pool:
+        futures = [pool.submit(func, pp, algorithm=algorithm)
+                   for pp in paths]
+        return [fut.result() for fut in futures]
@@ -1,25 +1,56 @@
+"""DCKit history of .rtdc files
+
+Every task DCKit performs on an .rtdc file is recorded in the
+"dckit-history" log of that file (see :func:`append_history`).
+For auditing large archives, :func:`history_table` and
+:func:`iter_history_table` read the histories of many files in
+parallel and return them as a columnar table.
+"""
+import concurrent.futures
+import contextlib
+import itertools
 import json
+import multiprocessing as mp
 import numbers
+import os
 import pathlib
+import traceback
 
-import dclab
 import h5py
+import numpy as np
+
+
+#: Columns of a history table that are always present; in addition,
+#: there is one column per library with the library version
+HISTORY_COLUMNS = ["path", "index", "task", "timestamp", "error"]
 
 
 def append_history(path, hdict):
     """Append DCKit history to an .rtdc file
 
+    The history element is appended to the history log as a single
+    line, i.e. the existing history is neither read nor rewritten
+    (except once, if the log is still in the format of DCKit 0.17,
+    see :func:`write_history`). Only the closing bracket of the
+    JSON list is replaced.
+
     Parameters
     ----------
-    path: str or pathlib.Path
-        Path to .rtdc file
+    path: str, pathlib.Path, or h5py.Group
+        Path to .rtdc file or .rtdc file opened for writing
     hdict: dict
         History element (not the full history)
     """
-    path = pathlib.Path(path)
-    hlist = read_history(path)
-    hlist.append(hdict)
-    write_history(path, hlist)
+    with h5file_session(path, "a") as h5:
+        dset = require_history_dataset(h5)
+        size = dset.shape[0]
+        line = dump_history_element(hdict)
+        if size > 2:
+            # not the first element
+            line = "," + line
+        dset.resize(size + 1, axis=0)
+        dset[size - 1] = line
+        dset[size] = "]"
 
 
 def default_json_converter(obj):
@@ -35,50 +66,262 @@ def default_json_converter(obj):
             "Object of type '{}' is not JSON serializable".format(type(obj)))
 
 
+def dump_history_element(hdict):
+    """Return a history element as a single line of compact JSON"""
+    return json.dumps(hdict,
+                      sort_keys=True,
+                      separators=(",", ":"),
+                      default=default_json_converter)
+
+
+@contextlib.contextmanager
+def h5file_session(path, mode="r"):
+    """Open an .rtdc file unless it is already open
+
+    Parameters
+    ----------
+    path: str, pathlib.Path, or h5py.Group
+        Path to .rtdc file or open .rtdc file (which is not closed)
+    mode: str
+        Mode for opening the file with :class:`h5py.File`
+    """
+    if isinstance(path, h5py.Group):
+        yield path
+    else:
+        with h5py.File(pathlib.Path(path), mode) as h5:
+            yield h5
+
+
+def history_table(paths, num_workers=None):
+    """Read the histories of many .rtdc files into a columnar table
+
+    Parameters
+    ----------
+    paths: iterable of str or pathlib.Path
+        Paths to .rtdc files
+    num_workers: int
+        Number of worker processes; if set to one, the files are read
+        in the calling process; if set to None, the number of CPUs is
+        used.
+
+    Returns
+    -------
+    table: dict of numpy.ndarray
+        One row per history element with the columns "path",
+        "index" (position in the history of the file), "task"
+        (task name), "timestamp" (UTC, numpy.datetime64), "error"
+        (traceback if the history of the file could not be read,
+        in which case the file has a single row with index -1), and
+        one column for each library (e.g. "dclab" or "dckit")
+        containing the version strings. The table can be filtered
+        with boolean masks, e.g.
+        ``table["path"][table["task"] == "compress HDF5 data"]``.
+
+    See Also
+    --------
+    iter_history_table: streaming version for very large archives
+    """
+    tables = list(iter_history_table(paths, num_workers=num_workers))
+    return _concatenate_tables(tables)
+
+
+def iter_history_table(paths, num_workers=None, batch_size=1000):
+    """Yield history tables for batches of files
+
+    Histories are read in parallel, but at most a few batches are
+    kept in memory at once. The batches are yielded in the order of
+    `paths`. See :func:`history_table` for a description of the
+    parameters and the table.
+
+    Parameters
+    ----------
+    batch_size: int
+        Number of files per table
+    """
+    batches = _iter_batches(paths, batch_size)
+    if num_workers == 1:
+        for batch in batches:
+            yield _read_history_batch(batch)
+        return
+    num_workers = num_workers or os.cpu_count()
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_workers,
+            mp_context=mp.get_context("spawn")) as pool:
+        # keep the workers busy, but do not read everything at once
+        max_pending = 2 * num_workers
+        pending = []
+        for batch in batches:
+            pending.append(pool.submit(_read_history_batch, batch))
+            if len(pending) >= max_pending:
+                yield pending.pop(0).result()
+        while pending:
+            yield pending.pop(0).result()
+
+
+def _concatenate_tables(tables):
+    """Combine history tables (missing library columns are filled)"""
+    columns = list(HISTORY_COLUMNS)
+    for tab in tables:
+        columns += [col for col in tab if col not in columns]
+    table = {}
+    for col in columns:
+        parts = []
+        for tab in tables:
+            if col in tab:
+                parts.append(tab[col])
+            else:
+                parts.append(np.full(len(tab["path"]), "", dtype=object))
+        if parts:
+            table[col] = np.concatenate(parts)
+        elif col == "index":
+            table[col] = np.zeros(0, dtype=int)
+        elif col == "timestamp":
+            table[col] = np.zeros(0, dtype="datetime64[s]")
+        else:
+            table[col] = np.zeros(0, dtype=object)
+    return table
+
+
+def _iter_batches(paths, batch_size):
+    paths = iter(paths)
+    while True:
+        batch = list(itertools.islice(paths, batch_size))
+        if not batch:
+            break
+        yield batch
+
+
+def _read_history_batch(paths):
+    """Read the histories of `paths` into a history table"""
+    rows = []
+    for path in paths:
+        try:
+            hlist = read_history(path)
+        except BaseException:
+            rows.append({"path": str(path), "index": -1,
+                         "error": traceback.format_exc()})
+            continue
+        for ii, hdict in enumerate(hlist):
+            row = {"path": str(path),
+                   "index": ii,
+                   "task": hdict.get("task", {}).get("name", ""),
+                   }
+            utc = hdict.get("utc", {})
+            if "date" in utc:
+                row["timestamp"] = "{}T{}".format(utc["date"],
+                                                  utc.get("time", "00:00:00"))
+            row.update(hdict.get("libraries", {}))
+            rows.append(row)
+    columns = list(HISTORY_COLUMNS)
+    for row in rows:
+        columns += [col for col in row if col not in columns]
+    table = {}
+    for col in columns:
+        if col == "index":
+            table[col] = np.array([row[col] for row in rows], dtype=int)
+        elif col == "timestamp":
+            table[col] = np.array([row.get(col, "NaT") for row in rows],
+                                  dtype="datetime64[s]")
+        else:
+            table[col] = np.array([row.get(col, "") for row in rows],
+                                  dtype=object)
+    return table
+
+
+def parse_history(lines):
+    """Parse the lines of a history log
+
+    The log is a JSON list, either with one history element per line
+    (see :func:`write_history`) or indented (DCKit 0.17 and earlier).
+    Logs with one JSON object per line (without list brackets) are
+    supported as well.
+    """
+    lines = [ll for ll in lines if ll.strip()]
+    if lines and lines[0].lstrip().startswith("["):
+        hlist = json.loads("\n".join(lines))
+    else:
+        hlist = [json.loads(ll) for ll in lines]
+    return hlist
+
+
 def read_history(path):
     """Read DCKit history from an .rtdc file
 
     Parameters
     ----------
-    path: str or pathlib.Path
-        Path to .rtdc file
+    path: str, pathlib.Path, or h5py.Group
+        Path to .rtdc file or open .rtdc file
 
     Returns
     -------
     hlist: list of dicts
         Full history (containing history elements)
     """
-    path = pathlib.Path(path)
-    with dclab.new_dataset(path) as ds:
-        if "dckit-history" in ds.logs:
-            hdump = ds.logs["dckit-history"]
-            hlist = json.loads("\n".join(hdump))
+    with h5file_session(path) as h5:
+        if "dckit-history" in h5.get("logs", {}):
+            lines = [ll.decode("utf-8") if isinstance(ll, bytes) else ll
+                     for ll in h5["logs"]["dckit-history"]]
         else:
-            hlist = []
-    return hlist
+            lines = []
+    return parse_history(lines)
+
+
+def require_history_dataset(h5):
+    """Return the history log dataset of an .rtdc file opened for writing
+
+    The dataset is created if it does not exist. If the history is
+    not stored in the format of :func:`write_history` (e.g.
+    fixed-length strings with an indented JSON list), it is converted.
+    """
+    dset = h5.get("logs", {}).get("dckit-history")
+    if dset is not None:
+        sinfo = h5py.check_string_dtype(dset.dtype)
+        if (sinfo is not None and sinfo.length is None
+                and dset.maxshape[0] is None
+                and dset.shape[0] >= 2
+                and dset[0] in [b"[", "["]
+                and dset[-1] in [b"]", "]"]):
+            # variable-length strings, resizable, one element per line
+            return dset
+        hlist = read_history(h5)
+    else:
+        hlist = []
+    write_history(h5, hlist)
+    return h5["logs"]["dckit-history"]
 
 
 def write_history(path, hlist):
     """Write DCKit history to .rtdc file
 
+    The history is stored in the "dckit-history" log as a resizable
+    dataset of variable-length strings. The log is a JSON list with
+    one history element per line (compact JSON)::
+
+        [
+        {"task": ...}
+        ,{"task": ...}
+        ]
+
+    Joining the lines yields valid JSON, so previous versions of
+    DCKit can read the log, and :func:`append_history` can add
+    elements without rewriting the log.
+
     Parameters
     ----------
-    path: str or pathlib.Path
-        Path to .rtdc file
+    path: str, pathlib.Path, or h5py.Group
+        Path to .rtdc file or .rtdc file opened for writing
     hlist: list of dicts
         Full history (containing history elements)
     """
-    path = pathlib.Path(path)
-    # remove previous log
-    with h5py.File(path, "a") as h5:
-        if "dckit-history" in h5["logs"]:
-            del h5["logs"]["dckit-history"]
-    # dump json log
-    hlog = json.dumps(hlist,
-                      sort_keys=True,
-                      indent=2,
-                      default=default_json_converter,
-                      ).split("\n")
-    # write dump as log
-    with dclab.RTDCWriter(path) as hw:
-        hw.store_log("dckit-history", hlog)
+    lines = [dump_history_element(hdict) for hdict in hlist]
+    lines = ["["] + lines[:1] + ["," + ll for ll in lines[1:]] + ["]"]
+    with h5file_session(path, "a") as h5:
+        logs = h5.require_group("logs")
+        # remove previous log
+        if "dckit-history" in logs:
+            del logs["dckit-history"]
+        logs.create_dataset("dckit-history",
+                            data=lines,
+                            maxshape=(None,),
+                            dtype=h5py.string_dtype(),
+                            chunks=(64,))
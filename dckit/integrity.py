@@ -0,0 +1,521 @@
+"""Qt-free integrity checks of RT-DC datasets
+
+The functions in this module carry out the integrity check of the
+integrity check dialog (:mod:`dckit.dlg_icheck`) without any widgets,
+so that they can be run in worker processes (see
+:func:`dckit.tasks.integrity_check`). :func:`check_file` is equivalent
+to opening the dialog for a dataset and confirming it without edits.
+
+The results are stored in the disk cache (:mod:`dckit.disk_cache`),
+so that a dataset is not checked again in a later session unless the
+dataset, its companion files, the metadata, the registered temporary
+features, or the version of dclab or DCKit changed.
+"""
+import copy
+import hashlib
+import json
+import warnings
+
+import dclab
+from dclab.rtdc_dataset import config as rt_config, feat_temp
+from dclab.rtdc_dataset.check import ICue, IntegrityChecker
+import numpy as np
+
+from . import disk_cache
+from . import memory_cache
+from . import meta_tool
+from . import sidecar
+from ._version import version
+
+
+#: Kind of the integrity check entries in the disk cache
+CACHE_KIND = "integrity"
+
+#: Checks of :class:`dclab.rtdc_dataset.check.IntegrityChecker` that
+#: depend on the metadata. The metadata checks may only access the
+#: features that are listed in :const:`METADATA_CHECK_FEATURES` (see
+#: :class:`DatasetSnapshot`).
+METADATA_CHECKS = [
+    "check_fl_metadata_channel_names",
+    "check_fl_num_channels",
+    "check_fl_num_lasers",
+    "check_fl_samples_per_event",
+    "check_flow_rate",
+    "check_metadata_bad",
+    "check_metadata_bad_greater_zero",
+    "check_metadata_choices",
+    "check_metadata_missing",
+    "check_metadata_online_filter_polygon_points_shape",
+    "check_shapein_issue3_bad_medium",
+    "check_temperature_zero_zmd",
+]
+
+#: Checks of :class:`dclab.rtdc_dataset.check.IntegrityChecker` that
+#: only depend on the dataset file and are run once per dataset (see
+#: :func:`get_dataset_snapshot`)
+FEATURE_CHECKS = [
+    "check_basin_features_internal",
+    "check_compression",
+    "check_empty",
+    "check_external_links",
+    "check_feat_index",
+    "check_feature_size",
+    "check_features_unknown_hdf5",
+    "check_fl_max_ctc_positive",
+    "check_fl_max_positive",
+    "check_fmt_hdf5",
+    "check_fmt_hdf5_swmr_mode",
+    "check_info",
+    "check_metadata_hdf5_type",
+    "check_ml_class",
+]
+
+#: Features the metadata checks look up in a dataset
+METADATA_CHECK_FEATURES = ["fl1_max", "fl2_max", "fl3_max", "fluorescence",
+                           "image", "image_bg", "mask", "temp", "trace"]
+
+
+class DatasetSnapshot(object):
+    def __init__(self, snapshot, config):
+        """Stand-in for a dataset in the metadata checks
+
+        Parameters
+        ----------
+        snapshot: dict
+            Snapshot of the dataset (see :func:`get_dataset_snapshot`)
+        config: dclab.rtdc_dataset.config.Configuration
+            Configuration of the dataset including the metadata
+            that are checked
+        """
+        self.config = config
+        self.format = snapshot["format"]
+        self.snapshot = snapshot
+        #: innate features (for :class:`SnapshotChecker`)
+        self._events = snapshot["innate features"]
+
+    def __contains__(self, feat):
+        return feat in self.snapshot["features"]
+
+    def __getitem__(self, feat):
+        """Return empty data with the properties used by the checks"""
+        if feat not in self:
+            raise KeyError(f"Feature '{feat}' not in snapshot!")
+        elif feat == "trace":
+            return {key: np.empty((1, size))
+                    for key, size in self.snapshot["trace samples"].items()}
+        elif feat == "temp":
+            # only used for checking whether the feature is all-zero
+            return np.zeros(1) if self.snapshot["temp zero"] else np.ones(1)
+        else:
+            return np.empty([0] + self.snapshot["shapes"][feat][1:])
+
+    def __len__(self):
+        return self.snapshot["length"]
+
+
+class SnapshotChecker(IntegrityChecker):
+    def __init__(self, snapshot):
+        """Run the metadata checks for a :class:`DatasetSnapshot`
+
+        The checks access the dataset only via the attributes of
+        :class:`DatasetSnapshot`. If a check of a future version of
+        dclab accesses anything else, :func:`_check_dataset` falls
+        back to checking the dataset itself.
+        """
+        # The parent class only accepts paths or RTDCBase instances.
+        self.ds = snapshot
+        self.warn_cues = []
+        self.finally_close = False
+
+    def check_metadata(self, **kwargs):
+        """Run all checks in :const:`METADATA_CHECKS`"""
+        return _run_checks(self, METADATA_CHECKS, **kwargs)
+
+
+def check_dataset(path, metadata_dump, expand_section):
+    """Caching wrapper for integrity checks
+
+    The cues are cached in memory (:mod:`dckit.memory_cache`) and on
+    disk. Registering temporary features does not invalidate the
+    entries, because the temporary features are part of the keys.
+    """
+    return _check_dataset_cached(path, metadata_dump, expand_section,
+                                 get_temporary_features())
+
+
+@memory_cache.cached("integrity", maxsize=1000)
+def _check_dataset_cached(path, metadata_dump, expand_section, features):
+    cache = disk_cache.get_cache()
+    key = get_cache_key(path, "cues", metadata_dump, expand_section)
+    data = cache.get(path, CACHE_KIND, key=key)
+    if data is None:
+        cues = _check_dataset(path, metadata_dump, expand_section)
+        cache.set(path, CACHE_KIND, [cue.__dict__ for cue in cues], key=key)
+    else:
+        cues = [ICue(**cdict) for cdict in data]
+    return cues
+
+
+def _check_dataset(path, metadata_dump, expand_section):
+    """Run the integrity checks (see :func:`check_dataset`)
+
+    Only the checks that depend on the metadata are run; the results
+    of all other checks are taken from the snapshot of the dataset
+    (see :func:`get_dataset_snapshot`). If dclab has checks that are
+    neither in :const:`METADATA_CHECKS` nor in :const:`FEATURE_CHECKS`,
+    all checks are run on the dataset (see :func:`_check_dataset_full`).
+    """
+    if get_unknown_checks():
+        return _check_dataset_full(path, metadata_dump, expand_section)
+    snapshot = get_dataset_snapshot(path)
+    metadata = json.loads(metadata_dump)
+    with warnings.catch_warnings():
+        # the warnings were recorded when the snapshot was created
+        warnings.simplefilter("ignore")
+        config = rt_config.Configuration(cfg=snapshot["config"])
+    cues = [ICue(**cdict) for cdict in snapshot["cues"]]
+    with warnings.catch_warnings(record=True) as ws:
+        warnings.simplefilter("always")
+        # ignore "ResourceWarning: unclosed file <_io.BufferedReader name=29"
+        warnings.simplefilter("ignore", ResourceWarning)
+
+        config.update(metadata)
+        ic = SnapshotChecker(DatasetSnapshot(snapshot, config))
+        try:
+            cues += ic.check_metadata(expand_section=expand_section)
+        except (AttributeError, KeyError):
+            # A check accessed something that is not in the snapshot.
+            return _check_dataset_full(path, metadata_dump, expand_section)
+        cues.sort()
+        cues += _medium_cues(cues, config)
+    cues += [ICue(**cdict) for cdict in snapshot["warnings"]]
+    cues += _warning_cues(ws)
+    return cues
+
+
+def _check_dataset_full(path, metadata_dump, expand_section):
+    """Run all integrity checks on the dataset (no snapshot)"""
+    metadata = json.loads(metadata_dump)
+    with warnings.catch_warnings(record=True) as ws:
+        warnings.simplefilter("always")
+        # ignore "ResourceWarning: unclosed file <_io.BufferedReader name=29"
+        warnings.simplefilter("ignore", ResourceWarning)
+
+        with dclab.new_dataset(path) as ds:
+            ds.config.update(metadata)
+            ic = IntegrityChecker(ds)
+            cues = ic.check(expand_section=expand_section)
+            cues += _medium_cues(cues, ds.config)
+    cues += _warning_cues(ws)
+    return cues
+
+
+def _medium_cues(cues, config):
+    """Return a cue for editing the medium if there is none in `cues`"""
+    for cue in cues:
+        if cue.identifier == "Shape-In issue #3":
+            warnings.warn("DCKit attempted to fix '[setup]: medium'! "
+                          "(Shape-In issue #3)",
+                          meta_tool.MetadataEditedWarning)
+        if (cue.category in ["metadata missing", "metadata wrong"]
+            and cue.cfg_section == "setup"
+                and cue.cfg_key == "medium"):
+            # The cue already exists.
+            return []
+    # The cue does not exist - add it.
+    medium = config.get("setup", {}).get("medium", "")
+    if medium in ["other", ""]:
+        return [ICue(msg="User might want to edit 'medium'",
+                     level="alert",
+                     category="metadata missing",
+                     cfg_section="setup",
+                     cfg_key="medium")]
+    return []
+
+
+def _warning_cues(ws):
+    return [ICue(msg="{}: {}".format(ww.category.__name__, ww.message),
+                 level="alert",
+                 category="warning")
+            for ww in ws]
+
+
+def check_file(path, user_metadata=None, default_metadata=None):
+    """Check a dataset and complete its user-defined metadata
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to the dataset
+    user_metadata: dict of dicts
+        Metadata previously defined by the user for this dataset
+    default_metadata: dict of dicts
+        Global metadata defaults (only used for editable keys)
+
+    Returns
+    -------
+    state: str
+        Integrity state ("passed", "tolerable", "failed")
+    cues: list of dclab.rtdc_dataset.check.ICue
+        Cues of the integrity check with the completed metadata
+    editables: dict of lists
+        Metadata keys the user may edit (see :func:`get_editable_keys`)
+    user_metadata: dict of dicts
+        User-defined metadata completed with the values from the
+        dataset and from `default_metadata` for all editable keys
+    """
+    cached = get_cached_check(path, user_metadata, default_metadata)
+    if cached is not None:
+        return cached
+    editables = get_editable_keys(path)
+    completed = complete_user_metadata(path, editables,
+                                       user_metadata, default_metadata)
+    metadata = get_check_metadata(editables, completed, default_metadata)
+    cues = check_dataset(path, json.dumps(metadata, sort_keys=True), False)
+    state = get_state(cues)
+    disk_cache.get_cache().set(
+        path, CACHE_KIND,
+        {"state": state,
+         "cues": [cue.__dict__ for cue in cues],
+         "editable": editables,
+         "user metadata": completed},
+        key=_get_check_file_key(path, user_metadata, default_metadata))
+    return state, cues, editables, completed
+
+
+def complete_user_metadata(path, editables, user_metadata=None,
+                           default_metadata=None):
+    """Return the user-defined metadata for all editable keys
+
+    For every key in `editables`, the value is determined with
+    :func:`get_metadata_value`. Empty values are removed.
+    """
+    completed = copy.deepcopy(user_metadata or {})
+    for sec in editables:
+        for key in editables[sec]:
+            value = get_metadata_value(path, sec, key,
+                                       user_metadata=completed,
+                                       default_metadata=default_metadata)
+            # -1337 is the placeholder of the spin boxes in the dialog
+            if value and value != -1337:
+                completed.setdefault(sec, {})[key] = value
+            elif key in completed.get(sec, {}):
+                completed[sec].pop(key)
+    return completed
+
+
+def get_cache_key(path, *args):
+    """Return the key of an integrity check entry in the disk cache
+
+    The key is a digest of `args` (JSON-serializable), the registered
+    temporary features, the versions of dclab and DCKit, and the
+    fingerprint of the companion files of the dataset (see
+    :func:`dckit.sidecar.get_companion_fingerprint`). The fingerprint
+    of the dataset itself is part of every disk cache entry.
+    """
+    dump = json.dumps([args,
+                       get_temporary_features(),
+                       dclab.__version__,
+                       version,
+                       sidecar.get_companion_fingerprint(path)],
+                      sort_keys=True,
+                      default=disk_cache.json_converter)
+    return hashlib.md5(dump.encode("utf-8")).hexdigest()
+
+
+def get_cached_check(path, user_metadata=None, default_metadata=None):
+    """Return the result of :func:`check_file` from the disk cache
+
+    Returns None if the dataset was not checked with the given
+    metadata before (or if it changed in the meantime). The dataset
+    is not accessed.
+    """
+    data = disk_cache.get_cache().get(
+        path, CACHE_KIND,
+        key=_get_check_file_key(path, user_metadata, default_metadata))
+    if data is None:
+        return None
+    cues = [ICue(**cdict)
+            for cdict in data["cues"]]
+    return data["state"], cues, data["editable"], data["user metadata"]
+
+
+def _get_check_file_key(path, user_metadata, default_metadata):
+    return get_cache_key(path, "file", user_metadata or {},
+                         default_metadata or {})
+
+
+def get_dataset_snapshot(path):
+    """Return the metadata-independent part of the integrity check
+
+    The snapshot contains the cues of the checks in
+    :const:`FEATURE_CHECKS`, the configuration of the dataset, and
+    the feature properties required by the metadata checks. It is
+    stored in the disk cache, so that a dataset is opened only once,
+    no matter how often its metadata are edited.
+    """
+    return _get_dataset_snapshot(path, get_temporary_features())
+
+
+@memory_cache.cached("integrity snapshot", maxsize=1000)
+def _get_dataset_snapshot(path, features):
+    cache = disk_cache.get_cache()
+    key = get_cache_key(path, "snapshot")
+    snapshot = cache.get(path, CACHE_KIND, key=key)
+    if snapshot is None:
+        snapshot = _create_dataset_snapshot(path)
+        cache.set(path, CACHE_KIND, snapshot, key=key)
+    return snapshot
+
+
+def _create_dataset_snapshot(path):
+    with warnings.catch_warnings(record=True) as ws:
+        warnings.simplefilter("always")
+        # ignore "ResourceWarning: unclosed file <_io.BufferedReader name=29"
+        warnings.simplefilter("ignore", ResourceWarning)
+
+        with dclab.new_dataset(path) as ds:
+            ic = IntegrityChecker(ds)
+            features = [feat for feat in METADATA_CHECK_FEATURES
+                        if feat in ds]
+            snapshot = {
+                "config": ds.config.as_dict(),
+                "cues": [cue.__dict__
+                         for cue in _run_checks(ic, FEATURE_CHECKS)],
+                "features": features,
+                "innate features": [feat for feat in features
+                                    if feat in ds._events],
+                "format": ds.format,
+                "length": len(ds),
+                "shapes": {feat: list(ds[feat].shape)
+                           for feat in ["image", "image_bg", "mask"]
+                           if feat in features},
+                "trace samples": {},
+                "temp zero": False,
+            }
+            if "trace" in features:
+                for key in ds["trace"].keys():
+                    snapshot["trace samples"][key] = \
+                        ds["trace"][key][0].size
+            if "temp" in features:
+                temp = ds["temp"]
+                snapshot["temp zero"] = bool(np.allclose(temp[:10], 0)
+                                             and np.allclose(temp, 0))
+    snapshot["warnings"] = [cue.__dict__ for cue in _warning_cues(ws)]
+    return snapshot
+
+
+def get_check_metadata(editables, user_metadata=None, default_metadata=None):
+    """Return the metadata with which a dataset is checked
+
+    `default_metadata` is only used for keys that are in `editables`
+    and not in `user_metadata`.
+    """
+    user_metadata = user_metadata or {}
+    default_metadata = default_metadata or {}
+    metadata = {}
+    # first fill up the default values (if applicable)
+    for sec in editables:
+        metadata.setdefault(sec, {})
+        for key in editables[sec]:
+            if key in default_metadata.get(sec, {}):
+                metadata[sec][key] = default_metadata[sec][key]
+    # then fill up the userdata
+    for sec in user_metadata:
+        metadata.setdefault(sec, {}).update(user_metadata[sec])
+    return metadata
+
+
+def get_editable_keys(path):
+    """Return the metadata keys of a dataset that the user may edit
+
+    These are the keys of the cues in the categories "metadata
+    missing" and "metadata wrong" (dict of lists, section -> keys).
+    """
+    editables = {}
+    for cue in check_dataset(path, json.dumps({}), True):
+        if cue.category in ["metadata missing", "metadata wrong"]:
+            keys = editables.setdefault(cue.cfg_section, [])
+            if cue.cfg_key not in keys:
+                keys.append(cue.cfg_key)
+    return editables
+
+
+def get_unknown_checks():
+    """Return the checks of dclab that DCKit does not know
+
+    These are the checks of
+    :class:`dclab.rtdc_dataset.check.IntegrityChecker` that are
+    neither in :const:`METADATA_CHECKS` nor in :const:`FEATURE_CHECKS`
+    (e.g. checks added in a newer version of dclab). Since they might
+    depend on the metadata, datasets are not checked with snapshots
+    if there are unknown checks.
+    """
+    return sorted(name for name in IntegrityChecker.__dict__
+                  if name.startswith("check_")
+                  and name not in METADATA_CHECKS
+                  and name not in FEATURE_CHECKS)
+
+
+def get_metadata_value(path, section, key, user_metadata=None,
+                       default_metadata=None):
+    """Return the metadata value for a specific section and key
+
+    The metadata are taken from three sources with the following
+    priority:
+
+    1. `user_metadata` (previously saved by the user)
+    2. dataset on disk (using meta_tool)
+    3. `default_metadata`
+    """
+    value = None
+    # Try user-defined values
+    if user_metadata:
+        value = user_metadata.get(section, {}).get(key)
+    # Try dataset
+    if value is None:
+        config = meta_tool.get_rtdc_config(path)
+        if section in config and key in config[section]:
+            value = config[section][key]
+    # Try default/global metadata
+    if value is None and default_metadata:
+        value = default_metadata.get(section, {}).get(key)
+    return value
+
+
+def _run_checks(ic, names, **kwargs):
+    """Run the checks `names` of an IntegrityChecker `ic`
+
+    As in :func:`IntegrityChecker.check`, the fluorescence checks
+    are skipped for datasets without fluorescence data.
+    """
+    cues = []
+    for name in sorted(names):
+        if name.startswith("check_fl_") and not ic.has_fluorescence:
+            continue
+        elif hasattr(ic, name):
+            cues += getattr(ic, name)(**kwargs)
+    return cues
+
+
+def get_temporary_features():
+    """Return the registered temporary features
+
+    Returns
+    -------
+    temporary_features: tuple of (str, bool)
+        Sorted feature names and whether they are scalar features
+    """
+    return tuple(sorted((feat, dclab.dfn.scalar_feature_exists(feat))
+                        for feat in feat_temp._registered_temporary_features))
+
+
+def get_state(cues):
+    """Return the integrity state ("passed", "tolerable", "failed")"""
+    levels = dclab.rtdc_dataset.check.ICue.get_level_summary(cues)
+    if levels["violation"]:
+        return "failed"
+    elif levels["alert"]:
+        return "tolerable"
+    else:
+        return "passed"
@@ -0,0 +1,315 @@
+"""Background job queue for DCKit tasks
+
+Tasks from :mod:`dckit.tasks` are wrapped in a :class:`Job` and
+submitted to a :class:`JobQueue`, which runs one job at a time in a
+separate thread, so that the user interface stays responsive.
+The :class:`JobPanel` displays the progress of the current job and
+allows to pause, resume, and cancel it.
+"""
+import time
+import traceback
+
+from PyQt5 import QtCore, QtWidgets
+
+from . import tasks
+
+
+class Job(QtCore.QObject):
+    #: emitted (in the GUI thread) when the job is done
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, name, func, inputs, on_done=None, on_result=None,
+                 **kwargs):
+        """A task to be run by a :class:`JobQueue`
+
+        Parameters
+        ----------
+        name: str
+            Human-readable name of the job
+        func: callable
+            Task function from :mod:`dckit.tasks` which is called
+            with `inputs`, the keyword arguments `progress` and
+            `control`, and `kwargs`; it must return a list of
+            :class:`dckit.tasks.TaskResult`
+        inputs: list of dckit.tasks.TaskInput
+            Input files of the task
+        on_done: callable
+            Called with the list of results (in the GUI thread) when
+            the job is done; its return value is stored in `report`
+        on_result: callable
+            Called with every result (in the GUI thread) as soon as
+            the input file is processed
+        """
+        super(Job, self).__init__()
+        self.name = name
+        self.func = func
+        self.inputs = inputs
+        self.on_done = on_done
+        self.on_result = on_result
+        self.kwargs = kwargs
+        #: pause, resume, or cancel the job
+        self.control = tasks.TaskControl()
+        #: one of "queued", "running", "done"
+        self.state = "queued"
+        #: list of TaskResult (available when the job is done)
+        self.results = None
+        #: return value of `on_done`
+        self.report = None
+        #: input file sizes in bytes
+        self.sizes = {}
+        for item in inputs:
+            try:
+                self.sizes[item.path] = item.path.stat().st_size
+            except OSError:
+                self.sizes[item.path] = 0
+
+    def wait(self):
+        """Wait for the job to finish and return `report`
+
+        Qt events are processed while waiting.
+        """
+        if self.state != "done":
+            loop = QtCore.QEventLoop()
+            self.finished.connect(loop.quit)
+            loop.exec_()
+        return self.report
+
+
+class JobWorker(QtCore.QObject):
+    #: files done, total number of files, bytes of the files done
+    progress = QtCore.pyqtSignal(int, int, int)
+    #: result of a single input file
+    result = QtCore.pyqtSignal(object)
+    #: list of results
+    done = QtCore.pyqtSignal(object)
+
+    def __init__(self, job, *args, **kwargs):
+        """Runs a job (move this object to a separate thread)"""
+        super(JobWorker, self).__init__(*args, **kwargs)
+        self.job = job
+        self.bytes_done = 0
+
+    def get_result_bytes(self, result):
+        """Return the size of the input files a result belongs to
+
+        Results of tasks that combine several input files (e.g. join)
+        list the input files in the "inputs" entry of `details`.
+        """
+        paths = result.details.get("inputs", [result.path])
+        return sum(self.job.sizes.get(pp, 0) for pp in paths)
+
+    def on_progress(self, done, total, result):
+        self.bytes_done += self.get_result_bytes(result)
+        self.progress.emit(done, total, self.bytes_done)
+        self.result.emit(result)
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        job = self.job
+        try:
+            results = job.func(job.inputs,
+                               progress=self.on_progress,
+                               control=job.control,
+                               **job.kwargs)
+        except BaseException:
+            tb = traceback.format_exc()
+            results = [tasks.TaskResult(path=item.path, status="error",
+                                        message=tb)
+                       for item in job.inputs]
+        self.done.emit(results)
+
+
+class JobQueue(QtCore.QObject):
+    #: a job was started
+    job_started = QtCore.pyqtSignal(object)
+    #: job, files done, total number of files, bytes of the files done
+    job_progress = QtCore.pyqtSignal(object, int, int, int)
+    #: a job is done
+    job_finished = QtCore.pyqtSignal(object)
+
+    def __init__(self, *args, **kwargs):
+        """Run jobs one after another in a separate thread"""
+        super(JobQueue, self).__init__(*args, **kwargs)
+        #: jobs that have not been started yet
+        self.queue = []
+        #: the job that is currently running
+        self.current = None
+        self._thread = None
+        self._worker = None
+
+    def cancel_all(self):
+        """Cancel the current job and remove all queued jobs"""
+        queued = self.queue
+        self.queue = []
+        for job in queued:
+            job.control.cancel()
+            self._finalize(job, [tasks.TaskResult(path=item.path,
+                                                  status="cancelled")
+                                 for item in job.inputs])
+        if self.current is not None:
+            self.current.control.cancel()
+
+    def shutdown(self):
+        """Cancel all jobs and wait for the current job to finish"""
+        self.cancel_all()
+        if self._thread is not None:
+            self._thread.quit()
+            self._thread.wait()
+
+    def submit(self, job):
+        """Add a job to the queue and return it"""
+        self.queue.append(job)
+        if self.current is None:
+            self._start_next()
+        return job
+
+    def _finalize(self, job, results):
+        job.results = results
+        job.state = "done"
+        if job.on_done is not None:
+            job.report = job.on_done(results)
+        job.finished.emit()
+        self.job_finished.emit(job)
+
+    @QtCore.pyqtSlot(object)
+    def _on_done(self, results):
+        job = self.current
+        self._thread.quit()
+        self._thread.wait()
+        self._thread = None
+        self._worker = None
+        self.current = None
+        self._finalize(job, results)
+        if self.queue and self.current is None:
+            self._start_next()
+
+    @QtCore.pyqtSlot(object)
+    def _on_result(self, result):
+        job = self.current
+        if job is not None and job.on_result is not None:
+            job.on_result(result)
+
+    @QtCore.pyqtSlot(int, int, int)
+    def _on_progress(self, done, total, bytes_done):
+        self.job_progress.emit(self.current, done, total, bytes_done)
+
+    def _start_next(self):
+        job = self.queue.pop(0)
+        job.state = "running"
+        self.current = job
+        self._thread = QtCore.QThread()
+        self._worker = JobWorker(job)
+        self._worker.moveToThread(self._thread)
+        self._worker.progress.connect(self._on_progress)
+        self._worker.result.connect(self._on_result)
+        self._worker.done.connect(self._on_done)
+        self._thread.started.connect(self._worker.run)
+        self.job_started.emit(job)
+        self._thread.start()
+
+
+class JobPanel(QtWidgets.QWidget):
+    def __init__(self, queue, *args, **kwargs):
+        """Status bar widget showing the progress of a JobQueue"""
+        super(JobPanel, self).__init__(*args, **kwargs)
+        self.queue = queue
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.label = QtWidgets.QLabel(self)
+        self.progressBar = QtWidgets.QProgressBar(self)
+        self.progressBar.setMaximumWidth(200)
+        self.pushButton_pause = QtWidgets.QPushButton("Pause", self)
+        self.pushButton_pause.setCheckable(True)
+        self.pushButton_cancel = QtWidgets.QPushButton("Cancel", self)
+        for wid in [self.label, self.progressBar, self.pushButton_pause,
+                    self.pushButton_cancel]:
+            layout.addWidget(wid)
+        self.pushButton_pause.toggled.connect(self.on_pause)
+        self.pushButton_cancel.clicked.connect(self.on_cancel)
+        queue.job_started.connect(self.on_job_started)
+        queue.job_progress.connect(self.on_job_progress)
+        queue.job_finished.connect(self.on_job_finished)
+        # time measurement for throughput and ETA
+        self._time_start = 0
+        self._time_paused = 0
+        self._pause_start = None
+        self.hide()
+
+    def get_elapsed(self):
+        """Return the time in seconds the current job was running"""
+        now = time.monotonic()
+        paused = self._time_paused
+        if self._pause_start is not None:
+            paused += now - self._pause_start
+        return now - self._time_start - paused
+
+    @QtCore.pyqtSlot()
+    def on_cancel(self):
+        self.queue.cancel_all()
+        self.pushButton_pause.setChecked(False)
+        self.label.setText("Cancelling...")
+
+    @QtCore.pyqtSlot(object)
+    def on_job_finished(self, job):
+        if self.queue.current is None and not self.queue.queue:
+            self.hide()
+
+    @QtCore.pyqtSlot(object, int, int, int)
+    def on_job_progress(self, job, done, total, bytes_done):
+        self.progressBar.setMaximum(total)
+        self.progressBar.setValue(done)
+        bytes_total = sum(job.sizes.values())
+        elapsed = self.get_elapsed()
+        # progress is reported per completed file
+        text = f"{job.name}: {done}/{total} files"
+        if bytes_total:
+            text += " ({} / {})".format(format_bytes(bytes_done),
+                                        format_bytes(bytes_total))
+        text += " done"
+        if elapsed > 0 and bytes_done:
+            rate = bytes_done / elapsed
+            eta = (bytes_total - bytes_done) / rate
+            text += ", {}/s, ETA {}".format(
+                format_bytes(rate),
+                time.strftime("%H:%M:%S", time.gmtime(eta)))
+        if self.queue.queue:
+            text += f" ({len(self.queue.queue)} more jobs queued)"
+        self.label.setText(text)
+
+    @QtCore.pyqtSlot(object)
+    def on_job_started(self, job):
+        self._time_start = time.monotonic()
+        self._time_paused = 0
+        self._pause_start = None
+        self.pushButton_pause.setChecked(False)
+        self.progressBar.setMaximum(len(job.inputs))
+        self.progressBar.setValue(0)
+        self.label.setText(f"{job.name}: starting...")
+        self.show()
+
+    @QtCore.pyqtSlot(bool)
+    def on_pause(self, paused):
+        job = self.queue.current
+        if job is None:
+            return
+        if paused:
+            job.control.pause()
+            self._pause_start = time.monotonic()
+            self.pushButton_pause.setText("Resume")
+        else:
+            job.control.resume()
+            if self._pause_start is not None:
+                self._time_paused += time.monotonic() - self._pause_start
+                self._pause_start = None
+            self.pushButton_pause.setText("Pause")
+
+
+def format_bytes(size):
+    """Return a human-readable representation of a number of bytes"""
+    for unit in ["B", "kB", "MB", "GB"]:
+        if size < 1000:
+            break
+        size /= 1000
+    else:
+        unit = "TB"
+    return f"{size:.1f} {unit}"
@@ -1,4 +1,4 @@
-import hashlib
+import copy
 import pathlib
 import importlib.resources
 import signal
@@ -7,8 +7,6 @@ import traceback
 import warnings
 
 import dclab
-from dclab.cli import repack
-from dclab.cli import common
 
 import h5py
 import hdf5plugin
@@ -18,14 +16,19 @@ import nptdms
 import numpy
 from PyQt5 import uic, QtCore, QtWidgets
 
-from . import dlg_icheck
 from .dlg_icheck import IntegrityCheckDialog
-from . import history
+from . import hashing
+from . import integrity
+from . import jobs
+from . import memory_cache
 from . import message_box
-from . import meta_tool
 from . import preferences
+from . import registry
+from . import scanner
+from . import table_model
+from . import tasks
 from . import update
-from .wait_cursor import show_wait_cursor, ShowWaitCursor
+from .wait_cursor import ShowWaitCursor
 from ._version import version
 
 
@@ -63,7 +66,6 @@ class DCKit(QtWidgets.QMainWindow):
         self.pushButton_split.clicked.connect(self.on_task_split)
         self.pushButton_tdms2rtdc.clicked.connect(self.on_task_tdms2rtdc)
         self.pushButton_join.clicked.connect(self.on_task_join)
-        self.tableWidget.itemChanged.connect(self.on_table_text_changed)
         self.checkBox_repack.clicked.connect(self.on_repack)
         # File menu
         self.action_add.triggered.connect(self.on_action_add_measurements)
@@ -74,10 +76,63 @@ class DCKit(QtWidgets.QMainWindow):
         # Help menu
         self.actionSoftware.triggered.connect(self.on_action_software)
         self.actionAbout.triggered.connect(self.on_action_about)
-        #: contains all imported paths (index is DCKit-id)
-        self.pathlist = []
-        # contains all integrity buttons (keys are DCKit-ids)
-        self.integrity_buttons = {}
+        #: contains all imported datasets (index is DCKit-id)
+        self.registry = registry.DatasetRegistry(
+            user_metadata=IntegrityCheckDialog.user_metadata)
+        self.table_model = table_model.DatasetTableModel(self.registry, self)
+        self.table_proxy = QtCore.QSortFilterProxyModel(self)
+        self.table_proxy.setSortRole(table_model.SortRole)
+        self.table_proxy.setSourceModel(self.table_model)
+        self.tableView.setModel(self.table_proxy)
+        self.tableView.sortByColumn(0, QtCore.Qt.AscendingOrder)
+        # render integrity check buttons
+        self.integrity_delegate = table_model.IntegrityDelegate(self)
+        self.integrity_delegate.clicked.connect(self.on_integrity_check)
+        self.tableView.setItemDelegateForColumn(
+            table_model.COLUMN_INDEX["integrity"], self.integrity_delegate)
+        self.tableView.setMouseTracking(True)
+        # same height for all rows (no need to compute each row height)
+        self.tableView.verticalHeader().setSectionResizeMode(
+            QtWidgets.QHeaderView.Fixed)
+        # set header widths
+        for key, width in [["DCKit-id", 10],
+                           ["integrity", 100],
+                           ["path", 180],
+                           ["run index", 80],
+                           ["flow rate", 100],
+                           ["event count", 80],
+                           ["sample", 300]]:
+            self.tableView.setColumnWidth(table_model.COLUMN_INDEX[key],
+                                          width)
+        # rows from scanning are added in batches
+        self._pending_rows = []
+        self._pending_rows_timer = QtCore.QTimer(self)
+        self._pending_rows_timer.setSingleShot(True)
+        self._pending_rows_timer.setInterval(100)
+        self._pending_rows_timer.timeout.connect(self.flush_pending_rows)
+        # background scanning of paths added by the user
+        self._scan_thread = None
+        self._scan_worker = None
+        self._scan_queue = []
+        self._scan_errors = []
+        self.progressBar_scan = QtWidgets.QProgressBar(self)
+        self.progressBar_scan.setMaximumWidth(200)
+        self.progressBar_scan.setFormat("Scanning %v/%m")
+        self.pushButton_scan_cancel = QtWidgets.QPushButton("Cancel", self)
+        self.pushButton_scan_cancel.clicked.connect(self.on_scan_cancel)
+        self.statusbar.addPermanentWidget(self.progressBar_scan)
+        self.statusbar.addPermanentWidget(self.pushButton_scan_cancel)
+        self.progressBar_scan.hide()
+        self.pushButton_scan_cancel.hide()
+        # tasks are run in the background
+        self.job_queue = jobs.JobQueue(self)
+        self.job_panel = jobs.JobPanel(self.job_queue, self)
+        self.statusbar.addPermanentWidget(self.job_panel)
+        # hashes of the datasets (for the output file names) are
+        # computed in the background while no job is running
+        self.hasher = hashing.BackgroundHasher()
+        self.job_queue.job_started.connect(self.hasher.pause)
+        self.job_queue.job_finished.connect(self.on_job_finished)
         # if "--version" was specified, print the version and exit
         if "--version" in sys.argv:
             print(version)
@@ -92,74 +147,56 @@ class DCKit(QtWidgets.QMainWindow):
         self.activateWindow()
         self.setWindowState(QtCore.Qt.WindowState.WindowActive)
 
-    @show_wait_cursor
-    def append_paths(self, pathlist):
-        """Append selected paths to table"""
-        datas = []
-        # get meta data for all paths
-        for path in pathlist:
-            try:  # avoid any errors
-                info = {"DCKit-id": (0, len(self.pathlist)),
-                        "integrity": (1, None),
-                        "path": (2, path),
-                        "sample": (3, meta_tool.get_sample_name(path)),
-                        "run index": (4, meta_tool.get_run_index(path)),
-                        "event count": (5, meta_tool.get_event_count(path)),
-                        "flow rate": (6, meta_tool.get_flow_rate(path)),
-                        "chip region": (None, meta_tool.get_chip_region(path)),
-                        }
-            except BaseException:
-                warnings.warn("Could not append dataset {} ".format(path)
-                              + "(traceback follows)!\n"
-                              + "{}".format(traceback.format_exc()))
-                # stop doing anything
-                continue
-            self.pathlist.append(pathlib.Path(path))
-            datas.append(info)
-        # populate table widget
-        for info in datas:
-            row = self.tableWidget.rowCount()
-            self.tableWidget.insertRow(row)
-            for key in info:
-                col, val = info[key]
-                if col is None:
-                    continue
-                if key == "integrity":
-                    # button
-                    btn = QtWidgets.QToolButton(self)
-                    btn.setText("run check")
-                    self.tableWidget.setCellWidget(row, col, btn)
-                    btn.clicked.connect(self.on_integrity_check)
-                    self.integrity_buttons[info["DCKit-id"][1]] = btn
-                else:
-                    # text
-                    item = QtWidgets.QTableWidgetItem("{}".format(val))
-                    if key == "sample":
-                        # allow editing sample name
-                        item.setFlags(QtCore.Qt.ItemIsEnabled
-                                      | QtCore.Qt.ItemIsEditable)
-                    elif key == "path":
-                        item.setText(pathlib.Path(val).name)
-                        item.setToolTip(str(val))
-                        item.setFlags(QtCore.Qt.ItemIsEnabled)
-                    elif key == "flow rate":
-                        if info["chip region"][1] == "channel":
-                            item.setText("{:.5f}".format(val))
-                        else:
-                            item.setText("reservoir")
-                        item.setFlags(QtCore.Qt.ItemIsEnabled)
-                    else:
-                        item.setFlags(QtCore.Qt.ItemIsEnabled)
-                    self.tableWidget.setItem(row, col, item)
-        if datas:
-            # set header widths
-            self.tableWidget.setColumnWidth(info["DCKit-id"][0], 10)
-            self.tableWidget.setColumnWidth(info["integrity"][0], 100)
-            self.tableWidget.setColumnWidth(info["path"][0], 180)
-            self.tableWidget.setColumnWidth(info["run index"][0], 80)
-            self.tableWidget.setColumnWidth(info["flow rate"][0], 100)
-            self.tableWidget.setColumnWidth(info["event count"][0], 80)
-            self.tableWidget.setColumnWidth(info["sample"][0], 300)
+    def append_paths(self, pathlist, background=False):
+        """Append selected paths to table
+
+        The metadata of all paths are probed concurrently and rows
+        are added to the table as soon as the metadata are available.
+
+        Parameters
+        ----------
+        pathlist: list of str or pathlib.Path
+            Paths to .rtdc or .tdms files or to directories that
+            are searched for such files
+        background: bool
+            If set to True, the paths are scanned in a separate thread
+            and this method returns immediately. Otherwise, this method
+            returns once all rows have been added.
+        """
+        if not pathlist:
+            return
+        if background:
+            self._scan_queue.append(list(pathlist))
+            if self._scan_thread is None:
+                self.scan_next()
+        else:
+            with ShowWaitCursor():
+                worker = scanner.ScanWorker(pathlist)
+                worker.probed.connect(self.on_scan_probed)
+                worker.failed.connect(self.on_scan_failed)
+                worker.run()
+                self.flush_pending_rows()
+            self.report_scan_errors()
+
+    def flush_pending_rows(self):
+        """Add probed datasets that are waiting to be displayed"""
+        self._pending_rows_timer.stop()
+        rows = self._pending_rows
+        self._pending_rows = []
+        first = len(self.registry)
+        self.table_model.append_rows(rows)
+        self.prefill_integrity(range(first, len(self.registry)))
+        self.hasher.submit([path for path, _ in rows])
+
+    def closeEvent(self, event):
+        self.hasher.stop()
+        self.job_queue.shutdown()
+        self._scan_queue.clear()
+        if self._scan_worker is not None:
+            self._scan_worker.cancel()
+            self._scan_thread.quit()
+            self._scan_thread.wait()
+        super(DCKit, self).closeEvent(event)
 
     def dragEnterEvent(self, e):
         """Whether files are accepted"""
@@ -174,30 +211,56 @@ class DCKit(QtWidgets.QMainWindow):
         pathlist = []
         for ff in urls:
             pp = pathlib.Path(ff.toLocalFile())
-            if pp.is_dir():
-                pathlist += meta_tool.find_data(pp)
-            elif pp.suffix in [".rtdc", ".tdms"]:
+            if pp.is_dir() or pp.suffix in [".rtdc", ".tdms"]:
+                # directories are searched while scanning
                 pathlist.append(pp)
-        self.append_paths(pathlist)
+        self.append_paths(pathlist, background=True)
 
     def get_metadata(self, row):
         path = self.get_path(row)
         metadata = IntegrityCheckDialog.metadata_from_path(path)
         # update sample name
-        newname = self.tableWidget.item(row, 3).text()
+        newname = self.get_record(row).sample
         if "experiment" not in metadata:
             metadata["experiment"] = {}
         metadata["experiment"]["sample"] = newname
         return metadata
 
-    def get_path(self, row):
-        """Return dataset path from a given row
+    def get_task_inputs(self, metadata=True):
+        """Return the inputs for a task in the order shown in the table
+
+        If `metadata` is False, the metadata of the inputs are
+        not populated. Otherwise, the inputs contain the sample name
+        and the user-defined metadata; the metadata of the integrity
+        check are determined by the task in the worker (see
+        :func:`dckit.tasks.get_output_metadata`), because they might
+        require checking the datasets.
+        """
+        inputs = []
+        for row in range(self.table_proxy.rowCount()):
+            rec = self.get_record(row)
+            item = tasks.TaskInput(path=rec.path)
+            if metadata:
+                item.metadata = {"experiment": {"sample": rec.sample}}
+                item.user_metadata = copy.deepcopy(rec.user_metadata)
+            inputs.append(item)
+        return inputs
+
+    def get_dckit_id(self, row):
+        """Return the DCKit-id of a row in the table
 
         This is necessary, because the user can sort columns
         """
-        path_index = int(self.tableWidget.item(row, 0).text())
-        path = self.pathlist[path_index]
-        return path
+        index = self.table_proxy.index(row, 0)
+        return self.table_proxy.mapToSource(index).row()
+
+    def get_path(self, row):
+        """Return dataset path from a given row in the table"""
+        return self.get_record(row).path
+
+    def get_record(self, row):
+        """Return the registry record of a given row in the table"""
+        return self.registry[self.get_dckit_id(row)]
 
     @QtCore.pyqtSlot()
     def on_action_add_folder(self):
@@ -206,12 +269,8 @@ class DCKit(QtWidgets.QMainWindow):
         path = QtWidgets.QFileDialog.getExistingDirectory(self)
         if not path:
             return
-        # find RT-DC data
-        pathlist = meta_tool.find_data(path)
-        if not pathlist:
-            raise ValueError("No RT-DC data found in {}!".format(path))
-        # add to list
-        self.append_paths(pathlist)
+        # find RT-DC data and add to list
+        self.append_paths([path], background=True)
 
     @QtCore.pyqtSlot()
     def on_action_add_measurements(self):
@@ -224,7 +283,7 @@ class DCKit(QtWidgets.QMainWindow):
             'RT-DC data (*.tdms *.rtdc)')
         if pathlist:
             # add to list
-            self.append_paths(pathlist)
+            self.append_paths(pathlist, background=True)
 
     @QtCore.pyqtSlot()
     def on_action_about(self):
@@ -280,13 +339,9 @@ class DCKit(QtWidgets.QMainWindow):
     @QtCore.pyqtSlot()
     def on_action_clear_measurements(self):
         """Clear the table"""
-        for _ in range(len(self.pathlist)):
-            self.tableWidget.removeRow(0)
-        self.pathlist.clear()
-        self.integrity_buttons.clear()
-        # clear lru_cache
-        meta_tool.get_rtdc_meta.cache_clear()
-        dlg_icheck.check_dataset.cache_clear()
+        self.on_scan_cancel()
+        self._pending_rows.clear()
+        self.table_model.clear()
 
     @QtCore.pyqtSlot()
     def on_action_preferences(self):
@@ -315,32 +370,16 @@ class DCKit(QtWidgets.QMainWindow):
             sw_text += "\nThis executable has been created using PyInstaller."
         QtWidgets.QMessageBox.information(self, "Software", sw_text)
 
-    @QtCore.pyqtSlot()
-    def on_integrity_check(self, button=None):
-        if button is None:
-            button = self.sender()
-            skip_ui = False
-        else:
-            skip_ui = True
-        # find DCKit-id
-        for did in self.integrity_buttons:
-            if button is self.integrity_buttons[did]:
-                break
-        else:
-            raise ValueError("Could not find button {}".format(button))
-        # get path
-        path = self.pathlist[did]
-        with ShowWaitCursor():
-            dlg = IntegrityCheckDialog(self, path)
-        if skip_ui:
-            dlg.done(True)
-        else:
-            dlg.exec_()
-        button.setText(dlg.state)
-        colors = {"failed": "#A50000",
-                  "tolerable": "#7A6500",
-                  "passed": "#007A04"}
-        button.setStyleSheet("color: {}".format(colors[dlg.state]))
+    @QtCore.pyqtSlot(QtCore.QModelIndex)
+    def on_integrity_check(self, index):
+        """The user clicked an integrity button in the table"""
+        dckit_id = self.table_proxy.mapToSource(index).row()
+        self.run_integrity_check(dckit_id, skip_ui=False)
+
+    @QtCore.pyqtSlot(object)
+    def on_job_finished(self, job):
+        if self.job_queue.current is None and not self.job_queue.queue:
+            self.hasher.resume()
 
     @QtCore.pyqtSlot()
     def on_repack(self):
@@ -363,55 +402,66 @@ class DCKit(QtWidgets.QMainWindow):
             self.pushButton_metadata.setEnabled(True)
 
     @QtCore.pyqtSlot()
-    def on_table_text_changed(self):
-        """Reset sample name if set to empty string"""
-        curit = self.tableWidget.currentItem()
-        if curit is not None and curit.text() == "":
-            row = self.tableWidget.currentRow()
-            path = self.get_path(row)
-            sample = meta_tool.get_sample_name(path)
-            self.tableWidget.item(row, 3).setText(sample)
+    def on_scan_cancel(self):
+        """Cancel the current and all pending background scans"""
+        self._scan_queue.clear()
+        if self._scan_worker is not None:
+            self._scan_worker.cancel()
+
+    @QtCore.pyqtSlot(object, str)
+    def on_scan_failed(self, path, tb):
+        warnings.warn("Could not append dataset {} ".format(path)
+                      + "(traceback follows)!\n"
+                      + "{}".format(tb))
+        self._scan_errors.append([path, tb])
+        self.progressBar_scan.setValue(self.progressBar_scan.value() + 1)
+
+    @QtCore.pyqtSlot()
+    def on_scan_finished(self):
+        if self._scan_thread is not None:
+            self._scan_thread.quit()
+            self._scan_thread.wait()
+            self._scan_thread = None
+            self._scan_worker = None
+        self.flush_pending_rows()
+        if self._scan_queue:
+            self.scan_next()
+            return
+        self.progressBar_scan.hide()
+        self.pushButton_scan_cancel.hide()
+        self.report_scan_errors()
+
+    @QtCore.pyqtSlot(object, object)
+    def on_scan_probed(self, path, info):
+        self._pending_rows.append((path, info))
+        if not self._pending_rows_timer.isActive():
+            self._pending_rows_timer.start()
+        self.progressBar_scan.setValue(self.progressBar_scan.value() + 1)
 
     @QtCore.pyqtSlot()
     def on_task_compress(self):
         """Compress .rtdc data losslessly"""
         # Open the target directory
         pout = QtWidgets.QFileDialog.getExistingDirectory(self)
-        details = []
-        invalid = []
-        paths_compressed = []
-        if pout:
-            with ShowWaitCursor():
-                pout = pathlib.Path(pout)
-                for row in range(self.tableWidget.rowCount()):
-                    path = self.get_path(row)
-                    metadata = self.get_metadata(row)
-                    name = metadata["experiment"]["sample"]
-                    prtdc = pout / get_rtdc_output_name(origin_path=path,
-                                                        sample_name=name)
-                    if path.suffix == ".rtdc":
-                        task_dict = {
-                            "name": "compress HDF5 data",
-                        }
-                        dclab.cli.compress(path_in=path, path_out=prtdc)
-                        append_execution_log(prtdc, task_dict)
-                        task_dict_meta = self.write_metadata(prtdc, metadata)
-                        if task_dict_meta:
-                            append_execution_log(prtdc, task_dict_meta)
-                        # write any warnings to separate log files
-                        extract_warning_logs(prtdc)
-                        # update list for UI
-                        details.append("{} -> {}".format(path, prtdc))
-                        paths_compressed.append(prtdc)
-                        # repack if checked
-                        # (we still did the compression in case dclab needed
-                        # to fix things)
-                        self.repack(prtdc)
-                    else:
-                        # do not do anything with .rtdc files
-                        invalid.append(path)
-        else:
+        if not pout:
             return
+        return self.job_queue.submit(jobs.Job(
+            name="Compress",
+            func=tasks.compress,
+            inputs=self.get_task_inputs(),
+            on_done=self.report_compress,
+            path_out=pout,
+            repack=self.checkBox_repack.isChecked(),
+            checksums=preferences.get_checksum_manifest(),
+            num_workers=preferences.get_worker_processes(),
+            default_metadata=copy.deepcopy(
+                IntegrityCheckDialog.default_metadata)))
+
+    def report_compress(self, results):
+        """Show the results of :func:`on_task_compress`"""
+        invalid = [r.path for r in results if r.status == "ignored"]
+        errors = [r for r in results if r.status == "error"]
+        done = [r for r in results if r.status == "success"]
 
         if invalid:
             message_box.ignored(
@@ -419,21 +469,60 @@ class DCKit(QtWidgets.QMainWindow):
                 details="Affected files are:\n"
                         + "\n\n".join([str(p) for p in invalid]))
 
+        if errors:
+            message_box.error(
+                message=f"{len(errors)} files could not be compressed!",
+                details="Affected files are:\n\n"
+                        + "\n\n".join([f"{r.path}:\n{r.message}"
+                                       for r in errors]))
+
         # finally, show the feedback dialog
-        if len(details):
+        if done:
             message_box.success(
-                message=f"Successfully compressed {len(details)} .rtdc files!",
-                details="\n\n".join(details))
-        elif not invalid:
+                message=f"Successfully compressed {len(done)} .rtdc files!",
+                details="\n\n".join([r.message for r in done]))
+        elif not (invalid or errors):
             message_box.nothing_todo()
+        paths_compressed = [r.paths_out[0] for r in done]
         return paths_compressed, invalid
 
-    @show_wait_cursor
     @QtCore.pyqtSlot()
     def on_task_integrity_all(self):
-        for did in self.integrity_buttons:
-            btn = self.integrity_buttons[did]
-            self.on_integrity_check(button=btn)
+        """Check the integrity of all datasets in the background"""
+        return self.run_integrity_checks(
+            [rec.dckit_id for rec in self.registry])
+
+    def prefill_integrity(self, dckit_ids):
+        """Show the integrity states of datasets that were checked before
+
+        The states are taken from the disk cache (see
+        :func:`dckit.integrity.get_cached_check`); the datasets
+        are not accessed.
+        """
+        for dckit_id in dckit_ids:
+            rec = self.registry[dckit_id]
+            cached = integrity.get_cached_check(
+                rec.path,
+                user_metadata=self.registry.user_metadata.get(rec.path),
+                default_metadata=IntegrityCheckDialog.default_metadata)
+            if cached is not None:
+                state, _, editables, user_metadata = cached
+                IntegrityCheckDialog.update_from_check(
+                    rec.path,
+                    editables=editables,
+                    user_metadata=user_metadata)
+                self.table_model.set_integrity(dckit_id, state)
+
+    def report_integrity(self, results):
+        """Show the errors of :func:`run_integrity_checks`"""
+        errors = [r for r in results if r.status == "error"]
+        if errors:
+            message_box.error(
+                message=f"{len(errors)} files could not be checked!",
+                details="Affected files are:\n\n"
+                        + "\n\n".join([f"{r.path}:\n{r.message}"
+                                       for r in errors]))
+        return [r.details.get("state", "unchecked") for r in results]
 
     @QtCore.pyqtSlot()
     def on_task_join(self):
@@ -445,66 +534,74 @@ class DCKit(QtWidgets.QMainWindow):
         with importlib.resources.as_file(ref) as path_ui:
             uic.loadUi(path_ui, dlg)
 
-        dlg.lineEdit.setText(self.get_metadata(0)["experiment"]["sample"])
+        dlg.lineEdit.setText(self.get_record(0).sample)
         ret = dlg.exec_()
         if ret == QtWidgets.QDialog.Accepted:
             sample = dlg.lineEdit.text()
-            metadata = {"experiment": {"run index": 1,
-                                       "sample": sample}}
             po, _ = QtWidgets.QFileDialog.getSaveFileName(
                 self, 'Output path', '', 'RT-DC files (*.rtdc)')
             if po:
-                po = pathlib.Path(po)
-                if not po.suffix == ".rtdc":
-                    po = po.parent / (po.name + ".rtdc")
-                pi = []
-                for row in range(self.tableWidget.rowCount()):
-                    pi.append(self.get_path(row))
-                # finally, show the feedback dialog
-                msg = QtWidgets.QMessageBox()
-                if pi:
-                    with ShowWaitCursor():
-                        dclab.cli.join(path_out=po,
-                                       paths_in=pi,
-                                       metadata=metadata)
-                    # write any warnings to separate log files
-                    extract_warning_logs(po)
-                    # repack if checked
-                    self.repack(po)
-                    # display message
-                    msg.setIcon(QtWidgets.QMessageBox.Information)
-                    msg.setText(f"Successfully joined {len(pi)} datasets!")
-                    msg.setWindowTitle("Success")
-                    msg.setDetailedText("\n".join([str(pp) for pp in pi]))
+                inputs = self.get_task_inputs(metadata=False)
+                if inputs:
+                    return self.job_queue.submit(jobs.Job(
+                        name="Join",
+                        func=join_task,
+                        inputs=inputs,
+                        on_done=lambda res: self.report_join(
+                            res, num_inputs=len(inputs)),
+                        path_out=po,
+                        sample=sample,
+                        repack=self.checkBox_repack.isChecked(),
+                        checksums=preferences.get_checksum_manifest()))
                 else:
+                    msg = QtWidgets.QMessageBox()
                     msg.setIcon(QtWidgets.QMessageBox.Warning)
                     msg.setText("Nothing to do!")
                     msg.setWindowTitle("Warning")
-                msg.exec_()
+                    msg.exec_()
+
+    def report_join(self, results, num_inputs):
+        """Show the results of :func:`on_task_join`"""
+        result = results[0]
+        if result.status == "error":
+            message_box.error(message="Could not join datasets!",
+                              details=result.message)
+        elif result.status == "success":
+            msg = QtWidgets.QMessageBox()
+            msg.setIcon(QtWidgets.QMessageBox.Information)
+            msg.setText(f"Successfully joined {num_inputs} datasets!")
+            msg.setWindowTitle("Success")
+            msg.setDetailedText(result.message)
+            msg.exec_()
 
     @QtCore.pyqtSlot()
     def on_task_metadata(self):
         """Update the metadata including the sample names of the datasets"""
-        invalid = []
-        details = []
-        with ShowWaitCursor():
-            for row in range(self.tableWidget.rowCount()):
-                path = self.get_path(row)
-                # check whether we are allowed to do this
-                if path.suffix == ".tdms":
-                    # not supported for tdms files
-                    invalid.append(path)
-                else:
-                    metadata = self.get_metadata(row)
-                    task_dict_meta = self.write_metadata(path, metadata)
-                    if task_dict_meta:
-                        append_execution_log(path, task_dict_meta)
-                        # update list for UI
-                        details.append("{}: update metadata".format(path))
-                        # remove item from check cache
-                        if path in IntegrityCheckDialog.user_metadata:
-                            IntegrityCheckDialog.user_metadata.pop(path)
-                    dlg_icheck.check_dataset.cache_clear()
+        return self.job_queue.submit(jobs.Job(
+            name="Update metadata",
+            func=tasks.update_metadata,
+            inputs=self.get_task_inputs(),
+            on_done=self.report_metadata,
+            default_metadata=copy.deepcopy(
+                IntegrityCheckDialog.default_metadata)))
+
+    def report_metadata(self, results):
+        """Show the results of :func:`on_task_metadata`"""
+        for res in results:
+            if res.status == "success":
+                # remove item from check cache
+                self.registry.reset_user_metadata(res.path)
+                memory_cache.invalidate(res.path)
+        invalid = [r.path for r in results if r.status == "ignored"]
+        errors = [r for r in results if r.status == "error"]
+        details = [r.message for r in results if r.status == "success"]
+        if errors:
+            message_box.error(
+                message=f"Could not update the metadata of {len(errors)} "
+                        + "files!",
+                details="Affected files are:\n\n"
+                        + "\n\n".join([f"{r.path}:\n{r.message}"
+                                       for r in errors]))
         if invalid:
             # show message regarding .tdms data
             message_box.ignored(
@@ -520,7 +617,7 @@ class DCKit(QtWidgets.QMainWindow):
             message_box.success(
                 message=f"Updated the metadata of {len(details)} files!",
                 details="\n\n".join(details))
-        elif not invalid:
+        elif not (invalid or errors):
             message_box.nothing_todo(
                 message="Nothing to update! You did not edit any metadata in "
                         + "the 'Sample' column or via the integrity check or "
@@ -530,47 +627,48 @@ class DCKit(QtWidgets.QMainWindow):
 
     @QtCore.pyqtSlot()
     def on_task_split(self):
-        split_events, ok_pressed = QtWidgets.QInputDialog.getInt(
-            self, "Events per output file", "Limit events to:",
-            10000, 0, 1000000, 5000)
-        details = []
-        errors = []
-        paths_split = []
-
+        """Split datasets by number of events, file size, or time"""
+        modes = ["number of events", "file size", "time window"]
+        mode, ok_pressed = QtWidgets.QInputDialog.getItem(
+            self, "Split datasets", "Split by:", modes, 0, False)
+        if not ok_pressed:
+            return
+        kwargs = {}
+        if mode == "file size":
+            kwargs["split_size"], ok_pressed = \
+                QtWidgets.QInputDialog.getDouble(
+                    self, "Size of output files", "Target size [MB]:",
+                    100, 0.1, 1e6, 1)
+        elif mode == "time window":
+            kwargs["split_time"], ok_pressed = \
+                QtWidgets.QInputDialog.getDouble(
+                    self, "Measurement time per output file",
+                    "Time window [s]:", 60, 0.001, 1e6, 3)
+        else:
+            kwargs["split_events"], ok_pressed = \
+                QtWidgets.QInputDialog.getInt(
+                    self, "Events per output file", "Limit events to:",
+                    10000, 1, 1000000, 5000)
         if ok_pressed:
             pout = QtWidgets.QFileDialog.getExistingDirectory(self)
             if pout:
-                with ShowWaitCursor():
-                    pout = pathlib.Path(pout)
-                    task_dict = {
-                        "name": "split every {} events".format(split_events),
-                    }
-                    for row in range(self.tableWidget.rowCount()):
-                        path = self.get_path(row)
-                        try:
-                            psplit = dclab.cli.split(
-                                path_in=path,
-                                path_out=pout,
-                                split_events=split_events,
-                                skip_initial_empty_image=True,
-                                skip_final_empty_image=True,
-                                ret_out_paths=True,
-                                verbose=False)
-                        except BaseException:
-                            errors.append([path, traceback.format_exc()])
-                            # remove erroneous files
-                            for pp in pout.glob(path.stem+"_*"):
-                                pp.unlink()
-                        else:
-                            for pp in psplit:
-                                append_execution_log(pp, task_dict)
-                                # write any warnings to separate log files
-                                extract_warning_logs(pp)
-                                # update list for UI
-                                details.append("created {}".format(pp))
-                                # repack if checked
-                                self.repack(pp)
-                            paths_split.append(path)
+                return self.job_queue.submit(jobs.Job(
+                    name="Split",
+                    func=tasks.split,
+                    inputs=self.get_task_inputs(metadata=False),
+                    on_done=self.report_split,
+                    path_out=pout,
+                    repack=self.checkBox_repack.isChecked(),
+                    checksums=preferences.get_checksum_manifest(),
+                    num_workers=preferences.get_worker_processes(),
+                    **kwargs))
+
+    def report_split(self, results):
+        """Show the results of :func:`on_task_split`"""
+        errors = [[r.path, r.message] for r in results if r.status == "error"]
+        done = [r for r in results if r.status == "success"]
+        details = [f"created {pp}" for r in done for pp in r.paths_out]
+        paths_split = [r.path for r in done]
         if errors:
             # Show an error dialog for the files that could not be converted
             message_box.error(
@@ -591,50 +689,26 @@ class DCKit(QtWidgets.QMainWindow):
     def on_task_tdms2rtdc(self):
         """Convert .tdms files to .rtdc files"""
         pout = QtWidgets.QFileDialog.getExistingDirectory(self)
-        details = []
-        errors = []
-        invalid = []
-        paths_converted = []
         if pout:
-            pout = pathlib.Path(pout)
-            with ShowWaitCursor():
-                for row in range(self.tableWidget.rowCount()):
-                    path = self.get_path(row)
-                    metadata = self.get_metadata(row)
-                    name = metadata["experiment"]["sample"]
-                    prtdc = pout / get_rtdc_output_name(origin_path=path,
-                                                        sample_name=name)
-                    if path.suffix == ".tdms":
-                        task_dict = {
-                            "name": "convert .tdms to .rtdc",
-                        }
-                        try:
-                            dclab.cli.tdms2rtdc(path_tdms=path,
-                                                path_rtdc=prtdc,
-                                                compute_features=False,
-                                                skip_initial_empty_image=True,
-                                                skip_final_empty_image=True,
-                                                verbose=False)
-                        except BaseException:
-                            errors.append([path, traceback.format_exc()])
-                            if prtdc.exists():
-                                prtdc.unlink()
-                        else:
-                            append_execution_log(prtdc, task_dict)
-                            task_dict_meta = self.write_metadata(prtdc,
-                                                                 metadata)
-                            if task_dict_meta:
-                                append_execution_log(prtdc, task_dict_meta)
-                            # write any warnings to separate log files
-                            extract_warning_logs(prtdc)
-                            # update list for UI
-                            details.append("{} -> {}".format(path, prtdc))
-                            paths_converted.append(prtdc)
-                            # repack if checked
-                            self.repack(prtdc)
-                    else:
-                        # do not do anything with .rtdc files
-                        invalid.append(path)
+            return self.job_queue.submit(jobs.Job(
+                name="Convert .tdms to .rtdc",
+                func=tasks.tdms2rtdc,
+                inputs=self.get_task_inputs(),
+                on_done=self.report_tdms2rtdc,
+                path_out=pout,
+                repack=self.checkBox_repack.isChecked(),
+                checksums=preferences.get_checksum_manifest(),
+                num_workers=preferences.get_worker_processes(),
+                default_metadata=copy.deepcopy(
+                    IntegrityCheckDialog.default_metadata)))
+
+    def report_tdms2rtdc(self, results):
+        """Show the results of :func:`on_task_tdms2rtdc`"""
+        invalid = [r.path for r in results if r.status == "ignored"]
+        errors = [[r.path, r.message] for r in results if r.status == "error"]
+        done = [r for r in results if r.status == "success"]
+        details = [r.message for r in done]
+        paths_converted = [r.paths_out[0] for r in done]
         if invalid:
             # Show an error dialog for the tdms files
             message_box.ignored(
@@ -658,68 +732,101 @@ class DCKit(QtWidgets.QMainWindow):
             message_box.nothing_todo()
         return paths_converted, invalid, errors
 
-    @show_wait_cursor
-    def repack(self, path):
-        """repack and strip logs if the checkbox is checked"""
-        if not self.checkBox_repack.isChecked():
-            return
-
-        path = pathlib.Path(path)
-        # rename the original file
-        path_orig = path.with_name(path.stem + "_original.rtdc")
-        path.rename(path_orig)
-        try:
-            repack(path_in=path_orig, path_out=path, strip_logs=True)
-        except BaseException:
-            path_orig.unlink()
-            if path.exists():
-                path.unlink()
-            raise
-        else:
-            path_orig.unlink()
+    def report_scan_errors(self):
+        """Show the files that could not be added to the table"""
+        if self._scan_errors:
+            errors = self._scan_errors
+            self._scan_errors = []
+            message_box.error(
+                message=f"{len(errors)} files could not be added!",
+                details="Affected files are:\n\n"
+                        + "\n\n".join(["{}:\n{}".format(*e) for e in errors]))
 
-    @show_wait_cursor
-    def write_metadata(self, path, metadata):
-        """Write metadata to an HDF5 file
+    def run_integrity_check(self, dckit_id, skip_ui=True):
+        """Run the integrity check for a dataset
 
-        Returns
-        -------
-        `task_dict` if anything changed or None
+        If `skip_ui` is False, the integrity check dialog is shown
+        and the user can edit the metadata. Otherwise, the check
+        is run in the background (see :func:`run_integrity_checks`).
         """
-        # entry for the log
-        task_dict = {
-            "name": "update metadata",
-            "old": {},
-            "new": {},
-        }
-        # update in-place
-        with h5py.File(path, "a") as h5:
-            for sec in metadata:
-                for key in metadata[sec]:
-                    h5key = "{}:{}".format(sec, key)
-                    value = metadata[sec][key]
-                    value_old = h5.attrs.get(h5key, None)
-                    if isinstance(value_old, bytes):
-                        value_old = value_old.decode("utf-8")
-                    if isinstance(value, bytes):
-                        value = value.decode("utf-8")
-                    if value != value_old:
-                        task_dict["new"][h5key] = value
-                        task_dict["old"][h5key] = value_old
-                        if isinstance(value, str):  # (after task_dict)
-                            value = numpy.bytes_(value.encode("utf-8"))
-                        h5.attrs[h5key] = value
-        if task_dict["new"]:
-            return task_dict
-        else:
-            return None
-
-
-def append_execution_log(path, task_dict):
-    info = common.get_job_info()
-    info["libraries"]["dckit"] = version
-    info["task"] = task_dict
-    history.append_history(path, info)
+        if skip_ui:
+            return self.run_integrity_checks([dckit_id])
+        path = self.registry[dckit_id].path
+        with ShowWaitCursor():
+            dlg = IntegrityCheckDialog(self, path)
+        dlg.exec_()
+        self.table_model.set_integrity(dckit_id, dlg.state)
+
+    def run_integrity_checks(self, dckit_ids):
+        """Check the integrity of datasets without showing a dialog
+
+        The datasets are checked in a pool of worker processes and
+        the integrity column is updated as soon as the result for a
+        dataset is available. The editable keys and the completed
+        user-defined metadata are stored in
+        :class:`IntegrityCheckDialog`, just as if the dialog had been
+        shown and confirmed for each dataset.
+        """
+        # the same file may be listed multiple times
+        path_ids = {}
+        for dckit_id in dckit_ids:
+            path = self.registry[dckit_id].path
+            path_ids.setdefault(path, []).append(dckit_id)
+        inputs = [tasks.TaskInput(path=path,
+                                  metadata=copy.deepcopy(
+                                      self.registry.user_metadata.get(path,
+                                                                      {})))
+                  for path in path_ids]
+
+        def on_result(result):
+            if result.status != "success":
+                return
+            IntegrityCheckDialog.update_from_check(
+                result.path,
+                editables=result.details["editable"],
+                user_metadata=result.details["user metadata"])
+            for dckit_id in path_ids[result.path]:
+                self.table_model.set_integrity(dckit_id,
+                                               result.details["state"])
+
+        return self.job_queue.submit(jobs.Job(
+            name="Integrity check",
+            func=tasks.integrity_check,
+            inputs=inputs,
+            on_done=self.report_integrity,
+            on_result=on_result,
+            default_metadata=copy.deepcopy(
+                IntegrityCheckDialog.default_metadata),
+            num_workers=preferences.get_worker_processes()))
+
+    def scan_next(self):
+        """Start scanning the next list of paths in the queue"""
+        pathlist = self._scan_queue.pop(0)
+        # The maximum is updated while directories are searched.
+        self.progressBar_scan.setMaximum(0)
+        self.progressBar_scan.setValue(0)
+        self.progressBar_scan.show()
+        self.pushButton_scan_cancel.show()
+        self._scan_thread = QtCore.QThread()
+        self._scan_worker = scanner.ScanWorker(pathlist)
+        self._scan_worker.moveToThread(self._scan_thread)
+        self._scan_worker.probed.connect(self.on_scan_probed)
+        self._scan_worker.failed.connect(self.on_scan_failed)
+        self._scan_worker.finished.connect(self.on_scan_finished)
+        self._scan_worker.submitted.connect(self.progressBar_scan.setMaximum)
+        self._scan_thread.started.connect(self._scan_worker.run)
+        self._scan_thread.start()
+
+
+def join_task(inputs, path_out, sample, repack=False, checksums=False,
+              progress=None, control=None):
+    """Wrapper around :func:`dckit.tasks.join` for the job queue"""
+    result = tasks.join(inputs=inputs, path_out=path_out, sample=sample,
+                        repack=repack, checksums=checksums)
+    if progress is not None:
+        # all input files are processed at once
+        progress(len(inputs), len(inputs), result)
+    return [result]
 
 
 def excepthook(etype, value, trace):
@@ -751,65 +858,6 @@ def excepthook(etype, value, trace):
         cb.setText(exception)
 
 
-def extract_warning_logs(path):
-    path = pathlib.Path(path)
-    logs = meta_tool.get_rtdc_logs(path)
-    for lname in logs:
-        if lname.count("warnings"):
-            plog = path.with_name(path.stem + "_" + lname + ".log")
-            plog.write_text("\r\n".join(logs[lname]))
-
-
-def get_rtdc_output_name(origin_path, sample_name):
-
-    if meta_tool.get_chip_region(origin_path) == "channel":
-        fl_or_res = "{:.4f}uls".format(meta_tool.get_flow_rate(origin_path))
-    else:
-        fl_or_res = "reservoir"
-
-    name = "{}_M{}_{}_{}_{}.rtdc".format(
-        meta_tool.get_date(origin_path),
-        meta_tool.get_run_index(origin_path),
-        fl_or_res,
-        sample_name,
-        sha256(origin_path)[:8])
-    return get_valid_filename(name)
-
-
-def get_valid_filename(value):
-    """
-    Return the given string converted to a string that can be used
-    for a clean filename.
-    """
-    ret = ""
-
-    valid = "abcdefghijklmnopqrstuvwxyz" \
-            + "ABCDEFGHIJKLMNOPQRSTUVWXYZ" \
-            + "0123456789" \
-            + "._-()"
-    replace = {
-        " ": "_",
-        "[": "(",
-        "]": ")",
-        "µ": "u",
-    }
-
-    for ch in value:
-        if ch in valid:
-            ret += ch
-        elif ch in replace:
-            ret += replace[ch]
-        else:
-            ret += "?"
-
-    ret = ret.strip(".")
-    return ret
-
-
-def sha256(path):
-    return dclab.util.hashfile(path, constructor=hashlib.sha256)
-
-
 # Make Ctr+C close the app
 signal.signal(signal.SIGINT, signal.SIG_DFL)
 # Display exception hook in separate dialog instead of crashing
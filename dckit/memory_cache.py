@@ -0,0 +1,205 @@
+"""In-memory cache for information derived from measurement files
+
+Entries are keyed by the path of a file and additional arguments and
+remember the size and modification time of the file at the time the
+entry was written. If the file changed, the entry is stale and is
+replaced on access. Thus, entries never have to be cleared globally;
+:func:`invalidate` removes the entries of a single file (e.g. after
+DCKit modified it). The cache is shared by :mod:`dckit.meta_tool` and
+:mod:`dckit.integrity` and counts hits and misses, e.g.::
+
+    from dckit import memory_cache
+
+    print(memory_cache.get_cache().info())
+
+See :mod:`dckit.disk_cache` for the persistent cache.
+"""
+import collections
+import functools
+import os
+import pathlib
+import threading
+
+
+#: Statistics of a namespace of the cache
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "invalidations", "size", "maxsize"])
+
+
+class _Namespace(object):
+    __slots__ = ["entries", "paths", "maxsize", "hits", "misses",
+                 "invalidations"]
+
+    def __init__(self, maxsize):
+        #: (path, args) -> (size, mtime_ns, value), least recently used
+        #: entries first
+        self.entries = collections.OrderedDict()
+        #: path -> set of keys in `entries`
+        self.paths = {}
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def pop(self, key):
+        self.entries.pop(key)
+        keys = self.paths[key[0]]
+        keys.discard(key)
+        if not keys:
+            self.paths.pop(key[0])
+
+
+class MemoryCache(object):
+    def __init__(self):
+        """Fingerprint-keyed in-memory store with namespaces
+
+        Each namespace (e.g. one per cached function) has its own
+        maximum size (least recently used entries are discarded)
+        and statistics. A single instance may be shared by multiple
+        threads.
+        """
+        self._namespaces = {}
+        self._lock = threading.Lock()
+
+    def _get_namespace(self, namespace):
+        if namespace not in self._namespaces:
+            self._namespaces[namespace] = _Namespace(maxsize=1000)
+        return self._namespaces[namespace]
+
+    def clear(self, namespace=None):
+        """Remove all entries (of a namespace) and reset the statistics"""
+        with self._lock:
+            if namespace is None:
+                namespaces = list(self._namespaces)
+            else:
+                namespaces = [namespace]
+            for name in namespaces:
+                maxsize = self._get_namespace(name).maxsize
+                self._namespaces[name] = _Namespace(maxsize=maxsize)
+
+    def get(self, namespace, path, args=()):
+        """Return the entry for a file or None if there is none
+
+        Parameters
+        ----------
+        namespace: str
+            Type of information (e.g. "probe")
+        path: str or pathlib.Path
+            Path to the file the entry belongs to
+        args: tuple
+            Additional (hashable) key of the entry
+        """
+        path = pathlib.Path(path)
+        key = (path, args)
+        try:
+            fp = fingerprint(path)
+        except OSError:
+            fp = None
+        with self._lock:
+            ns = self._get_namespace(namespace)
+            entry = ns.entries.get(key)
+            if entry is not None:
+                if entry[:2] == fp:
+                    ns.hits += 1
+                    ns.entries.move_to_end(key)
+                    return entry[2]
+                # The file changed or does not exist anymore.
+                ns.pop(key)
+                ns.invalidations += 1
+            ns.misses += 1
+        return None
+
+    def info(self, namespace=None):
+        """Return the statistics of a namespace or of all namespaces
+
+        Returns
+        -------
+        info: CacheInfo or dict of CacheInfo
+            Numbers of hits, misses, invalidated entries, and
+            current and maximum number of entries
+        """
+        with self._lock:
+            if namespace is not None:
+                ns = self._get_namespace(namespace)
+                return CacheInfo(ns.hits, ns.misses, ns.invalidations,
+                                 len(ns.entries), ns.maxsize)
+        return {name: self.info(name) for name in list(self._namespaces)}
+
+    def invalidate(self, path):
+        """Remove all entries of a file
+
+        Entries stored for the resolved path are removed as well.
+        """
+        path = pathlib.Path(path)
+        with self._lock:
+            for ns in self._namespaces.values():
+                for pp in {path, path.resolve()}:
+                    for key in list(ns.paths.get(pp, [])):
+                        ns.pop(key)
+                        ns.invalidations += 1
+
+    def set(self, namespace, path, value, args=()):
+        """Store an entry for a file (see :func:`get`)
+
+        If the file does not exist, nothing is stored.
+        """
+        path = pathlib.Path(path)
+        key = (path, args)
+        try:
+            fp = fingerprint(path)
+        except OSError:
+            return
+        with self._lock:
+            ns = self._get_namespace(namespace)
+            ns.entries[key] = fp + (value,)
+            ns.entries.move_to_end(key)
+            ns.paths.setdefault(path, set()).add(key)
+            while len(ns.entries) > ns.maxsize:
+                ns.pop(next(iter(ns.entries)))
+
+    def set_maxsize(self, namespace, maxsize):
+        """Set the maximum number of entries of a namespace"""
+        with self._lock:
+            self._get_namespace(namespace).maxsize = maxsize
+
+
+def cached(namespace, maxsize=1000):
+    """Decorator that caches a function of a file path in memory
+
+    The first argument of the decorated function must be the path
+    to a file and all arguments must be hashable. The decorated
+    function has the method `cache_info` (see :func:`MemoryCache.info`).
+    """
+    get_cache().set_maxsize(namespace, maxsize)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(path, *args):
+            cache = get_cache()
+            value = cache.get(namespace, path, args)
+            if value is None:
+                value = func(path, *args)
+                cache.set(namespace, path, value, args)
+            return value
+        wrapper.cache_info = functools.partial(get_cache().info, namespace)
+        return wrapper
+    return decorator
+
+
+def fingerprint(path):
+    """Return (size, mtime_ns) of a file"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def get_cache():
+    """Return the DCKit memory cache (shared within a process)"""
+    return _cache
+
+
+def invalidate(path):
+    """Remove all entries of a file from the memory cache"""
+    _cache.invalidate(path)
+
+
+_cache = MemoryCache()
@@ -1,5 +1,8 @@
+import collections
+import concurrent.futures
 import copy
-import functools
+import fnmatch
+import os
 import pathlib
 import warnings
 
@@ -9,72 +12,143 @@ from dclab.rtdc_dataset import fmt_tdms
 import h5py
 import nptdms
 
+from . import disk_cache
+from . import memory_cache
+from . import sidecar
+
 
 class MetadataEditedWarning(UserWarning):
     pass
 
 
-def find_data(path):
-    """Find tdms and rtdc data files in a directory"""
-    path = pathlib.Path(path)
+#: Metadata of a measurement as determined by :func:`probe`
+ProbeInfo = collections.namedtuple(
+    "ProbeInfo",
+    ["sample", "run_index", "event_count", "flow_rate", "chip_region",
+     "date"])
 
-    def sort_path(path):
-        """Sorting key for intuitive file sorting
 
-        This sorts a list of RT-DC files according to measurement number,
-        e.g. (M2_*.tdms is not sorted after M11_*.tdms):
+def cache_probe(path, info):
+    """Store a probe result that was determined elsewhere
 
-        /path/to/M1_*.tdms
-        /path/to/M2_*.tdms
-        /path/to/M10_*.tdms
-        /path/to/M11_*.tdms
+    This is used to populate the cache with probes carried out in
+    a different process (see :mod:`dckit.scanner`).
+    """
+    path = pathlib.Path(path).resolve()
+    memory_cache.get_cache().set("probe", path, info,
+                                 (sidecar.get_companion_fingerprint(path),))
 
-        Note that the measurement number of .rtdc files is extracted from
-        the hdf5 metadata and not from the file name.
-        """
-        try:
-            # try to get measurement number as an integer
-            idx = get_run_index(path)
-        except BaseException:
-            # just use the given path
-            name = path.name
-        else:
-            # assign new "name" for sorting
-            name = "{:09d}_{}".format(idx, path.name)
-        return path.with_name(name)
 
-    tdmsfiles = fmt_tdms.get_tdms_files(path)
-    tdmsfiles = sorted(tdmsfiles, key=sort_path)
-    rtdcfiles = [r for r in path.rglob("*.rtdc") if r.is_file()]
-    rtdcfiles = sorted(rtdcfiles, key=sort_path)
+def clear_cache():
+    """Forget all metadata cached in memory
+
+    This is not necessary for keeping the cache up-to-date (entries
+    in the memory and disk caches are invalidated automatically when
+    the file is modified), but it simulates a new session.
+    """
+    cache = memory_cache.get_cache()
+    for namespace in ["probe", "rtdc config", "rtdc meta", "sidecar"]:
+        cache.clear(namespace)
 
-    files = [pathlib.Path(ff) for ff in rtdcfiles + tdmsfiles]
-    return files
+
+def find_data(path, max_depth=None, ignore=None, num_workers=8):
+    """Find tdms and rtdc data files in a directory
+
+    The .rtdc files are returned first, followed by the .tdms files.
+    Both lists are sorted by measurement number (see
+    :func:`sort_data_files`). For the parameters, see :func:`iter_data`.
+    """
+    files = list(iter_data(path,
+                           max_depth=max_depth,
+                           ignore=ignore,
+                           num_workers=num_workers))
+    return sort_data_files(files, num_workers=num_workers)
+
+
+def iter_data(path, max_depth=None, ignore=None, num_workers=8):
+    """Yield tdms and rtdc data files in a directory while walking it
+
+    Fluorescence trace files ("*_traces.tdms") are not included.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Directory to search
+    max_depth: int or None
+        Maximum depth of subdirectories to descend into; 0 means
+        that only files in `path` are considered, None means no limit.
+    ignore: list of str
+        Glob patterns (e.g. "*_original.rtdc" or ".snapshot") of file
+        and directory names that should be skipped
+    num_workers: int
+        Number of threads for listing subdirectories concurrently
+
+    Yields
+    ------
+    path: pathlib.Path
+        Path to a data file; the order is not defined.
+    """
+    path = pathlib.Path(path)
+    ignore = list(ignore or [])
+    pool = concurrent.futures.ThreadPoolExecutor(num_workers)
+    try:
+        pending = {pool.submit(_scan_directory, path, ignore): 0}
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for fut in done:
+                depth = pending.pop(fut)
+                files, subdirs = fut.result()
+                if max_depth is None or depth < max_depth:
+                    for sd in subdirs:
+                        fsd = pool.submit(_scan_directory, sd, ignore)
+                        pending[fsd] = depth + 1
+                yield from files
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _scan_directory(path, ignore):
+    """Return data files and subdirectories of a directory"""
+    files = []
+    subdirs = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if any(fnmatch.fnmatch(name, pat) for pat in ignore):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(pathlib.Path(entry.path))
+                    elif ((name.endswith(".rtdc")
+                           or (name.endswith(".tdms")
+                               and not name.endswith("_traces.tdms")))
+                          and entry.is_file()):
+                        files.append(pathlib.Path(entry.path))
+                except OSError:
+                    # e.g. broken link or permission issue
+                    pass
+    except OSError:
+        # directory not accessible
+        pass
+    return files, subdirs
 
 
 def get_chip_region(path):
-    fname = pathlib.Path(path).resolve()
-    ext = fname.suffix
-    if ext == ".rtdc":
-        with h5py.File(fname, mode="r") as h5:
-            chip_region = h5.attrs["setup:chip region"]
-    elif ext == ".tdms":
-        name = fname.name
-        path = fname.parent
-        mx = name.split("_")[0]
-        para = path / (mx + "_para.ini")
-        if para.exists():
-            camcfg = rt_config.load_from_file(para)
-            chip_region = camcfg["general"]["region"].lower()
-        else:
-            config = get_rtdc_config(path)
-            chip_region = config["setup"]["chip region"]
+    chip_region = probe(path).chip_region
+    if chip_region is None:
+        config = get_rtdc_config(path)
+        chip_region = config["setup"]["chip region"]
     return chip_region
 
 
 def get_date(path):
-    config = get_rtdc_config(path)
-    return config["experiment"]["date"]
+    date = probe(path).date
+    if date is None:
+        config = get_rtdc_config(path)
+        date = config["experiment"]["date"]
+    return date
 
 
 def get_event_count(path):
@@ -106,36 +180,13 @@ def get_event_count_quick(fname):
     the number of events, which are used in the following order
     (according to which is faster):
     1. The MX_log.ini file "Events" tag
-    2. The tdms file (very slow, because it loads the entire tdms file)
-       The values obtained with this method are cached on disk to
-       speed up future calls with the same argument.
-    """
-    fname = pathlib.Path(fname).resolve()
-    ext = fname.suffix
-
-    if ext == ".rtdc":
-        with h5py.File(fname, mode="r") as h5:
-            event_count = h5.attrs["experiment:event count"]
-    elif ext == ".tdms":
-        mdir = fname.parent
-        mid = fname.name.split("_")[0]
-        # possible data sources
-        logf = mdir / (mid + "_log.ini")
-        if logf.exists():
-            # 1. The MX_log.ini file "Events" tag
-            with logf.open(encoding='utf-8') as fd:
-                logd = fd.readlines()
-            for ll in logd:
-                if ll.strip().startswith("Events:"):
-                    event_count = int(ll.split(":")[1])
-                    break
-        else:
-            # 2. Open the tdms file
-            with nptdms.TdmsFile.open(fname) as tdmsfd:
-                event_count = len(tdmsfd["Cell Track"]["time"])
-    else:
-        raise ValueError("`fname` must be an .rtdc or .tdms file!")
+    2. The tdms file metadata (see :func:`get_tdms_event_count`)
 
+    The value is taken from :func:`probe`.
+    """
+    event_count = probe(fname).event_count
+    if event_count is None:
+        raise ValueError(f"Could not determine event count of '{fname}'!")
     return event_count
 
 
@@ -153,41 +204,92 @@ def get_flow_rate(fname):
     flow_rate: float
         The flow rate [µL/s] of the data set
     """
-    fname = pathlib.Path(fname).resolve()
-    ext = fname.suffix
+    flow_rate = probe(fname).flow_rate
+    if flow_rate is None:
+        config = get_rtdc_config(fname)
+        flow_rate = config["setup"]["flow rate"]
+    return flow_rate
 
-    if ext == ".rtdc":
-        with h5py.File(fname, mode="r") as h5:
-            flow_rate = h5.attrs["setup:flow rate"]
-    elif ext == ".tdms":
-        name = fname.name
-        path = fname.parent
-        mx = name.split("_")[0]
-        para = path / (mx + "_para.ini")
-        if para.exists():
-            camcfg = rt_config.load_from_file(para)
-            flow_rate = camcfg["general"]["flow rate [ul/s]"]
-        else:
-            # analyze the filename
-            warnings.warn("{}: trying to manually find flow rate.".
-                          format(fname))
-            flow_rate = float(fname.split("ul_s")[0].split("_")[-1])
-    else:
-        raise ValueError("`fname` must be an .rtdc or .tdms file!")
 
-    return flow_rate
+def get_h5_logs(h5, select=None):
+    """Return the logs of an open .rtdc file
+
+    Parameters
+    ----------
+    h5: h5py.Group
+        Open .rtdc file
+    select: str
+        If given, only return logs whose name contains `select`
+
+    Returns
+    -------
+    logs: dict
+        Log names and lists of lines
+    """
+    logs = {}
+    for lname in h5.get("logs", {}):
+        if select is not None and not lname.count(select):
+            continue
+        logs[lname] = [ll.decode("utf-8") if isinstance(ll, bytes) else ll
+                       for ll in h5["logs"][lname]]
+    return logs
 
 
 def get_rtdc_config(path):
-    return get_rtdc_meta(path)[0]
+    """Return the full configuration of a dataset
+
+    The configuration is cached in memory and on disk. Edits made
+    by DCKit (see :func:`get_rtdc_meta`) are part of the cached
+    configuration and the corresponding warnings are issued again
+    when the configuration is loaded from disk. The entries are
+    invalidated when the companion files of a .tdms file change
+    (see :func:`dckit.sidecar.get_companion_fingerprint`).
+    """
+    path = pathlib.Path(path)
+    return _get_rtdc_config(path, sidecar.get_companion_fingerprint(path))
+
+
+@memory_cache.cached("rtdc config", maxsize=10000)
+def _get_rtdc_config(path, companions):
+    cache = disk_cache.get_cache()
+    key = dclab.__version__ + companions
+    data = cache.get(path, "config", key=key)
+    if data is None:
+        with warnings.catch_warnings(record=True) as ws:
+            warnings.simplefilter("always")
+            config = get_rtdc_meta(path)[0]
+        edits = []
+        for ww in ws:
+            if issubclass(ww.category, MetadataEditedWarning):
+                edits.append(str(ww.message))
+            warnings.warn(ww.message, ww.category)
+        cache.set(path, "config",
+                  {"config": config.as_dict(), "edits": edits},
+                  key=key)
+    else:
+        config = rt_config.Configuration(cfg=data["config"],
+                                         disable_checks=True)
+        for msg in data["edits"]:
+            warnings.warn(msg, MetadataEditedWarning)
+    return config
 
 
 def get_rtdc_logs(path):
     return get_rtdc_meta(path)[1]
 
 
-@functools.lru_cache(maxsize=1000)
 def get_rtdc_meta(path):
+    """Return the configuration and the logs of a dataset
+
+    The result is cached in memory until the dataset or its companion
+    files change.
+    """
+    path = pathlib.Path(path)
+    return _get_rtdc_meta(path, sidecar.get_companion_fingerprint(path))
+
+
+@memory_cache.cached("rtdc meta", maxsize=1000)
+def _get_rtdc_meta(path, companions):
     with dclab.new_dataset(path) as ds:
         config = ds.config.copy()
         logs = copy.deepcopy(dict(ds.logs))
@@ -197,8 +299,8 @@ def get_rtdc_meta(path):
             # Try to automatically determine the medium.
             swini = path.with_name(
                 path.name.split("_")[0] + "_SoftwareSettings.ini")
-            if swini.exists():
-                lines = [ll.strip() for ll in swini.read_text().split("\n")]
+            lines = sidecar.get_sidecar(path)["software settings"]
+            if lines is not None:
                 if ("Buffer_Medium_ID=0" in lines
                         and "Buffer_Medium=CellCarrierB" in lines):
                     config["setup"]["medium"] = "CellCarrier"
@@ -209,26 +311,186 @@ def get_rtdc_meta(path):
     return config, logs
 
 
+def get_tdms_event_count(fname):
+    """Get the number of events stored in a tdms file
+
+    Only the lead-in and the metadata of the tdms segments are read,
+    the channel length is computed from the number of values stated
+    therein. The raw data (which may be gigabytes) are not accessed.
+    The result is stored in the disk cache.
+    """
+    fname = pathlib.Path(fname)
+    cache = disk_cache.get_cache()
+    event_count = cache.get(fname, "tdms event count")
+    if event_count is None:
+        tdmsmeta = nptdms.TdmsFile.read_metadata(fname)
+        event_count = len(tdmsmeta["Cell Track"]["time"])
+        cache.set(fname, "tdms event count", event_count)
+    return event_count
+
+
+def sort_data_files(files, num_workers=8):
+    """Sort data files in the order of :func:`find_data`
+
+    The .rtdc files come first, followed by the .tdms files.
+    Both lists are sorted by measurement number, e.g.
+    (M2_*.tdms is not sorted after M11_*.tdms):
+
+    /path/to/M1_*.tdms
+    /path/to/M2_*.tdms
+    /path/to/M10_*.tdms
+    /path/to/M11_*.tdms
+
+    Note that the measurement number of .rtdc files is extracted from
+    the hdf5 metadata (via :func:`probe`) and not from the file name.
+    """
+    def sort_path(path):
+        """Sorting key for intuitive file sorting"""
+        try:
+            # try to get measurement number as an integer
+            idx = get_run_index(path)
+        except BaseException:
+            # just use the given path
+            name = path.name
+        else:
+            # assign new "name" for sorting
+            name = "{:09d}_{}".format(idx, path.name)
+        return path.with_name(name)
+
+    files = [pathlib.Path(ff) for ff in files]
+    # Probe the files concurrently (this also populates the probe cache).
+    with concurrent.futures.ThreadPoolExecutor(num_workers) as pool:
+        keys = dict(zip(files, pool.map(sort_path, files)))
+    rtdcfiles = sorted([ff for ff in files if ff.suffix == ".rtdc"],
+                       key=keys.get)
+    tdmsfiles = sorted([ff for ff in files if ff.suffix == ".tdms"],
+                       key=keys.get)
+    return rtdcfiles + tdmsfiles
+
+
 def get_run_index(fname):
-    fname = pathlib.Path(fname).resolve()
-    ext = fname.suffix
-    if ext == ".rtdc":
-        with h5py.File(fname, mode="r") as h5:
-            run_index = h5.attrs["experiment:run index"]
-    elif ext == ".tdms":
-        name = fname.name
-        run_index = int(name.split("_")[0].strip("Mm "))
-    return run_index
+    return probe(fname).run_index
 
 
 def get_sample_name(fname):
-    fname = pathlib.Path(fname).resolve()
+    return probe(fname).sample
+
+
+def probe(path):
+    """Collect the metadata DCKit shows for a measurement in one go
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to an experimental data file. The file format is
+        determined from the file extension (tdms or rtdc).
+
+    Returns
+    -------
+    info: ProbeInfo
+        Sample name, run index, event count, flow rate, chip region,
+        and date of the measurement. Entries that cannot be determined
+        quickly are set to None (the getters in this module then fall
+        back to the full configuration).
+
+    Notes
+    -----
+    For .rtdc files, the HDF5 file is opened only once. The result
+    is cached in memory and on disk (:mod:`dckit.disk_cache`), so
+    subsequent calls for the same file (also in later sessions)
+    do not have to access the file.
+    """
+    fname = pathlib.Path(path).resolve()
+    companions = (sidecar.get_companion_fingerprint(fname),)
+    info = memory_cache.get_cache().get("probe", fname, companions)
+    if info is None:
+        cache = disk_cache.get_cache()
+        if fname.suffix == ".tdms":
+            # the probe depends on the companion files
+            key = sidecar.get_sidecar(fname)["fingerprint"]
+        else:
+            key = ""
+        data = cache.get(fname, "probe", key=key)
+        if data is None:
+            info = _probe(fname)
+            cache.set(fname, "probe", info._asdict(), key=key)
+        else:
+            info = ProbeInfo(**data)
+        memory_cache.get_cache().set("probe", fname, info, companions)
+    return info
+
+
+def _probe(fname):
     ext = fname.suffix
     if ext == ".rtdc":
-        with h5py.File(fname, mode="r") as h5:
-            sample = h5.attrs["experiment:sample"]
+        info = _probe_rtdc(fname)
     elif ext == ".tdms":
-        sample = fmt_tdms.get_project_name_from_path(fname)
-    if isinstance(sample, bytes):
-        sample = sample.decode("utf-8")
-    return sample
+        info = _probe_tdms(fname)
+    else:
+        raise ValueError("`fname` must be an .rtdc or .tdms file!")
+    return info
+
+
+def _probe_rtdc(fname):
+    with h5py.File(fname, mode="r") as h5:
+        attrs = dict(h5.attrs)
+
+    def get_attr(key, dtype):
+        value = attrs.get(key, None)
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode("utf-8")
+        return dtype(value)
+
+    return ProbeInfo(
+        sample=get_attr("experiment:sample", str),
+        run_index=get_attr("experiment:run index", int),
+        event_count=get_attr("experiment:event count", int),
+        flow_rate=get_attr("setup:flow rate", float),
+        chip_region=get_attr("setup:chip region", str),
+        date=get_attr("experiment:date", str),
+    )
+
+
+def _probe_tdms(fname):
+    sc = sidecar.get_sidecar(fname)
+    # event count
+    if sc["events"] is not None:
+        # 1. The MX_log.ini file "Events" tag
+        event_count = sc["events"]
+    else:
+        # 2. The metadata of the tdms file
+        try:
+            event_count = get_tdms_event_count(fname)
+        except BaseException:
+            event_count = None
+    # flow rate and chip region
+    if sc["para"] is not None:
+        flow_rate = sc["para"]["general"]["flow rate [ul/s]"]
+        chip_region = sc["para"]["general"]["region"].lower()
+    else:
+        # analyze the filename
+        warnings.warn("{}: trying to manually find flow rate.".
+                      format(fname))
+        try:
+            flow_rate = float(fname.name.split("ul_s")[0].split("_")[-1])
+        except ValueError:
+            flow_rate = None
+        chip_region = None
+    # sample name
+    if sc["sample"]:
+        sample = sc["sample"]
+    else:
+        # derive the sample name from the directory structure
+        sample = fmt_tdms.get_project_name_from_path(fname.parent)
+    return ProbeInfo(
+        sample=sample,
+        run_index=int(fname.name.split("_")[0].strip("Mm ")),
+        event_count=event_count,
+        flow_rate=flow_rate,
+        chip_region=chip_region,
+        # The date of .tdms data is computed by dclab from the file
+        # modification time and the duration of the measurement.
+        date=None,
+    )
@@ -4,8 +4,6 @@ import dclab
 from dclab.rtdc_dataset import feat_temp
 from PyQt5 import uic, QtCore, QtWidgets
 
-from . import dlg_icheck
-
 
 class Preferences(QtWidgets.QDialog):
     """Preferences dialog to interact with QSettings"""
@@ -25,6 +23,10 @@ class Preferences(QtWidgets.QDialog):
         #: configuration keys, corresponding widgets, and defaults
         self.config_pairs = [
             ["check for updates", self.general_check_for_updates, "1"],
+            # number of worker processes for tasks (0 means automatic)
+            ["worker processes", self.general_worker_processes, "0"],
+            # write SHA256SUMS to output directories
+            ["checksum manifest", self.general_checksum_manifest, "0"],
             # comma-separated list of features
             ["included features", self.listWidget_features, ""],
         ]
@@ -94,6 +96,8 @@ class Preferences(QtWidgets.QDialog):
                 widget.setChecked(bool(int(value)))
             elif isinstance(widget, QtWidgets.QLineEdit):
                 widget.setText(value)
+            elif isinstance(widget, QtWidgets.QSpinBox):
+                widget.setValue(int(value))
             elif widget is self.listWidget_features:
                 # comma-separated list
                 widget.clear()
@@ -113,6 +117,8 @@ class Preferences(QtWidgets.QDialog):
                 value = int(widget.isChecked())
             elif isinstance(widget, QtWidgets.QLineEdit):
                 value = widget.text().strip()
+            elif isinstance(widget, QtWidgets.QSpinBox):
+                value = str(widget.value())
             elif widget is self.listWidget_features:
                 # comma-separated list
                 features = []
@@ -148,6 +154,18 @@ def register_temporary_features():
                 scalar = bool(int(settings.value(
                     f"feature scalar {feat}")))
                 feat_temp.register_temporary_feature(feat, is_scalar=scalar)
-    # Clear the check_dataset cache otherwise any new feature will be
-    # shown as unknown.
-    dlg_icheck.check_dataset.cache_clear()
+
+
+def get_checksum_manifest():
+    """Return whether tasks write checksum manifests"""
+    settings = QtCore.QSettings()
+    return bool(int(settings.value("checksum manifest", "0")))
+
+
+def get_worker_processes():
+    """Return the number of worker processes for tasks
+
+    Returns None if the number of CPUs should be used.
+    """
+    settings = QtCore.QSettings()
+    return int(settings.value("worker processes", "0")) or None
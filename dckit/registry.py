@@ -0,0 +1,124 @@
+"""Registry of the datasets listed in DCKit"""
+import pathlib
+
+
+class DatasetRecord(object):
+    __slots__ = ["dckit_id", "path", "info", "integrity", "_user_metadata"]
+
+    def __init__(self, dckit_id, path, info, user_metadata):
+        """A dataset in the registry
+
+        Parameters
+        ----------
+        dckit_id: int
+            DCKit-id of the dataset (position in the registry)
+        path: pathlib.Path
+            Path to the dataset
+        info: dckit.meta_tool.ProbeInfo
+            Metadata of the dataset (the sample name may be edited
+            by the user)
+        user_metadata: dict
+            Mapping of dataset paths to user-edited metadata; shared
+            by all records of a registry
+        """
+        #: DCKit-id
+        self.dckit_id = dckit_id
+        #: dataset path
+        self.path = path
+        #: probed metadata
+        self.info = info
+        #: integrity check state ("unchecked", "passed", "tolerable",
+        #: "failed")
+        self.integrity = "unchecked"
+        self._user_metadata = user_metadata
+
+    def __repr__(self):
+        return "<DatasetRecord {} '{}'>".format(self.dckit_id, self.path)
+
+    @property
+    def sample(self):
+        return self.info.sample
+
+    @sample.setter
+    def sample(self, value):
+        self.info = self.info._replace(sample=value)
+
+    @property
+    def user_metadata(self):
+        """User-edited metadata (dict of dicts) of this dataset"""
+        return self._user_metadata.setdefault(self.path, {})
+
+
+class DatasetRegistry(object):
+    def __init__(self, user_metadata=None):
+        """Datasets with O(1) lookup by DCKit-id and by path
+
+        Parameters
+        ----------
+        user_metadata: dict
+            Mapping of dataset paths to user-edited metadata that is
+            shared with other components (e.g.
+            :const:`dckit.dlg_icheck.IntegrityCheckDialog.user_metadata`).
+            If not given, the registry uses its own mapping.
+        """
+        #: all records (list index is DCKit-id)
+        self.records = []
+        #: user-edited metadata (path -> dict)
+        self.user_metadata = {} if user_metadata is None else user_metadata
+        # path -> DCKit-id of the first record with that path
+        self._path_index = {}
+
+    def __getitem__(self, dckit_id):
+        return self.records[dckit_id]
+
+    def __iter__(self):
+        return iter(self.records)
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, path, info):
+        """Add a dataset and return its record"""
+        path = pathlib.Path(path)
+        rec = DatasetRecord(dckit_id=len(self.records),
+                            path=path,
+                            info=info,
+                            user_metadata=self.user_metadata)
+        self.records.append(rec)
+        self._path_index.setdefault(path, rec.dckit_id)
+        return rec
+
+    def add_many(self, rows):
+        """Add multiple datasets
+
+        Parameters
+        ----------
+        rows: list of (pathlib.Path, dckit.meta_tool.ProbeInfo)
+            Paths and metadata of the datasets
+
+        Returns
+        -------
+        records: list of DatasetRecord
+            The new records
+        """
+        return [self.add(path, info) for path, info in rows]
+
+    def clear(self):
+        """Remove all datasets
+
+        User-edited metadata are kept, so they are still available
+        when a dataset is added again.
+        """
+        self.records.clear()
+        self._path_index.clear()
+
+    def get_by_path(self, path):
+        """Return the record of a dataset path (None if not listed)"""
+        dckit_id = self._path_index.get(pathlib.Path(path))
+        if dckit_id is None:
+            return None
+        return self.records[dckit_id]
+
+    def reset_user_metadata(self, path):
+        """Forget the user-edited metadata of a dataset path"""
+        self.user_metadata.pop(pathlib.Path(path), None)
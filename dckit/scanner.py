@@ -0,0 +1,188 @@
+"""Background scanning of measurement metadata"""
+import concurrent.futures
+import multiprocessing as mp
+import pathlib
+import threading
+import traceback
+
+from PyQt5 import QtCore
+
+from . import meta_tool
+
+
+#: Number of files that are probed in a thread pool; the remaining
+#: files are probed in a process pool. HDF5 access is serialized within
+#: a process by h5py, so only separate processes can open many .rtdc
+#: files at the same time (but starting them takes a moment).
+PROCESS_POOL_THRESHOLD = 200
+
+
+class ScanWorker(QtCore.QObject):
+    """Probe the metadata of measurements concurrently
+
+    Directories in `pathlist` are searched for data files (see
+    :func:`dckit.meta_tool.iter_data`) and files are probed while
+    the directory tree is still being walked. Results are emitted
+    in the order of `pathlist`; the files of a directory are emitted
+    once all of them are probed, in the order of
+    :func:`dckit.meta_tool.find_data`.
+    """
+    #: emitted for every successfully probed path (path, ProbeInfo)
+    probed = QtCore.pyqtSignal(object, object)
+    #: emitted for every path that could not be probed (path, traceback)
+    failed = QtCore.pyqtSignal(object, str)
+    #: emitted whenever the number of files to probe grows
+    submitted = QtCore.pyqtSignal(int)
+    #: emitted when all paths were processed or the scan was cancelled
+    finished = QtCore.pyqtSignal()
+
+    def __init__(self, pathlist, num_workers=None, max_depth=None,
+                 ignore=None, *args, **kwargs):
+        super(ScanWorker, self).__init__(*args, **kwargs)
+        self.pathlist = [pathlib.Path(pp) for pp in pathlist]
+        self.num_workers = num_workers
+        self.max_depth = max_depth
+        self.ignore = ignore
+        self._cancel_event = threading.Event()
+        #: future -> (index in `pathlist`, path) of running probes
+        self._futures = {}
+        #: index in `pathlist` -> list of (path, ProbeInfo or traceback)
+        self._finished = {}
+        #: index in `pathlist` -> number of probes submitted
+        self._pending = {}
+        #: number of entries in `pathlist` that were completely submitted
+        self._num_complete = 0
+        #: index of the next entry in `pathlist` to be emitted
+        self._next_index = 0
+        self._num_submitted = 0
+        self._thread_pool = None
+        self._process_pool = None
+
+    def cancel(self):
+        """Stop the scan (paths already being probed are discarded)"""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def iter_files(self):
+        """Yield the index in `pathlist` and the files of each entry"""
+        for index, path in enumerate(self.pathlist):
+            if path.is_dir():
+                empty = True
+                for pp in meta_tool.iter_data(path,
+                                              max_depth=self.max_depth,
+                                              ignore=self.ignore):
+                    empty = False
+                    yield index, pp
+                if empty:
+                    self.failed.emit(path,
+                                     f"No RT-DC data found in '{path}'!")
+            else:
+                yield index, path
+
+    @QtCore.pyqtSlot()
+    def run(self):
+        self._thread_pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.num_workers)
+        try:
+            for index, path in self.iter_files():
+                if self.is_cancelled():
+                    break
+                # all entries before `index` are completely submitted
+                self._num_complete = index
+                self.submit(path, index)
+                self.emit_results(wait=False)
+            self._num_complete = len(self.pathlist)
+            self.emit_results(wait=True)
+        finally:
+            for pool in [self._thread_pool, self._process_pool]:
+                if pool is not None:
+                    pool.shutdown(wait=False, cancel_futures=True)
+        self.finished.emit()
+
+    def emit_results(self, wait):
+        """Emit the results of all finished probes in order
+
+        If `wait` is True, wait until all submitted probes finished.
+        """
+        while self._futures:
+            if self.is_cancelled():
+                self._futures.clear()
+                break
+            done, _ = concurrent.futures.wait(
+                self._futures,
+                timeout=None if wait else 0,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            if not done:
+                break
+            for fut in done:
+                index, path = self._futures.pop(fut)
+                try:
+                    info = fut.result()
+                except BaseException:
+                    info = traceback.format_exc()
+                else:
+                    meta_tool.cache_probe(path, info)
+                self._finished.setdefault(index, []).append((path, info))
+            self._emit_ordered()
+        if not self.is_cancelled():
+            self._emit_ordered()
+
+    def _emit_ordered(self):
+        """Emit the results of the next entries of `pathlist`"""
+        while self._next_index < self._num_complete:
+            index = self._next_index
+            results = self._finished.get(index, [])
+            if len(results) < self._pending.get(index, 0):
+                # some files are still being probed
+                break
+            results = dict(self._finished.pop(index, []))
+            if len(results) > 1:
+                # files of a directory
+                order = meta_tool.sort_data_files(
+                    list(results), num_workers=self.num_workers or 8)
+            else:
+                order = list(results)
+            for path in order:
+                info = results[path]
+                if isinstance(info, str):
+                    self.failed.emit(path, info)
+                else:
+                    self.probed.emit(path, info)
+            self._next_index += 1
+
+    def submit(self, path, index=0):
+        """Probe `path` in the thread pool or in the process pool
+
+        `index` is the index of the entry in `pathlist` that `path`
+        belongs to.
+        """
+        if self._num_submitted < PROCESS_POOL_THRESHOLD:
+            pool = self._thread_pool
+        else:
+            if self._process_pool is None:
+                # Do not fork a process that is running a Qt event loop.
+                self._process_pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=mp.get_context("spawn"))
+            pool = self._process_pool
+        self._futures[pool.submit(probe_row, path)] = (index, path)
+        self._pending[index] = self._pending.get(index, 0) + 1
+        self._num_submitted += 1
+        self.submitted.emit(self._num_submitted)
+
+
+def probe_row(path):
+    """Return the probe of `path` with all values the table needs
+
+    Entries that :func:`dckit.meta_tool.probe` could not determine
+    quickly are filled in from the full configuration, so that the
+    GUI thread never has to open the file again.
+    """
+    info = meta_tool.probe(path)
+    return info._replace(
+        event_count=meta_tool.get_event_count(path),
+        flow_rate=meta_tool.get_flow_rate(path),
+        chip_region=meta_tool.get_chip_region(path),
+    )
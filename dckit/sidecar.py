@@ -0,0 +1,125 @@
+"""Parser for the companion files of RT-DC measurements
+
+Shape-In stores a measurement "M1_*.tdms" together with companion
+files such as "M1_para.ini" or "M1_log.ini" in the same directory.
+:func:`get_sidecar` reads all of them at once and caches the result
+(see :mod:`dckit.memory_cache`) until one of the files changes.
+"""
+import hashlib
+import pathlib
+
+from dclab.rtdc_dataset import config as rt_config
+
+from . import disk_cache
+from . import memory_cache
+
+
+#: Name suffixes of the companion files of a measurement
+SIDECAR_SUFFIXES = ["_para.ini", "_log.ini", "_SoftwareSettings.ini"]
+
+#: Name suffixes of all files that dclab reads for a .tdms measurement
+#: in addition to the .tdms file itself
+TDMS_COMPANION_SUFFIXES = SIDECAR_SUFFIXES + [
+    "_camera.ini", "_contours.txt", "_imaq.avi"]
+
+
+def get_sidecar(path):
+    """Return the parsed companion files of a measurement
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        Path to a measurement file (e.g. "M1_data.tdms"); the prefix
+        of the file name ("M1") determines the companion files.
+
+    Returns
+    -------
+    sidecar: dict
+        Dictionary with the keys
+
+        - "fingerprint": str identifying the state of the companion
+          files (changes when a file is created, modified, or removed)
+        - "para": configuration from "Mx_para.ini" (dict of dicts)
+        - "sample": "Sample Name" from "Mx_para.ini"
+        - "events": "Events" from "Mx_log.ini" (int)
+        - "software settings": lines of "Mx_SoftwareSettings.ini"
+
+        Entries are None if the information is not available.
+        The dictionary is shared, do not modify it.
+    """
+    path = pathlib.Path(path).resolve()
+    files = _get_sidecar_files(path)
+    return _read_sidecar(path, get_fingerprint(files))
+
+
+def _get_sidecar_files(path):
+    mid = path.name.split("_")[0]
+    return [path.with_name(mid + sfx) for sfx in SIDECAR_SUFFIXES]
+
+
+@memory_cache.cached("sidecar", maxsize=10000)
+def _read_sidecar(path, fpkey):
+    """Parse the companion files of `path` (cached by fingerprint)"""
+    para, log, swini = _get_sidecar_files(path)
+    sidecar = {"fingerprint": fpkey,
+               "para": None,
+               "sample": None,
+               "events": None,
+               "software settings": None,
+               }
+    if para.exists():
+        sidecar["para"] = rt_config.load_from_file(para)
+        for section in sidecar["para"].values():
+            if "sample name" in section:
+                sample = section["sample name"]
+                # dclab guesses the type of unknown keys
+                if isinstance(sample, float) and sample.is_integer():
+                    sample = int(sample)
+                sidecar["sample"] = str(sample)
+                break
+    if log.exists():
+        with log.open("r", encoding="utf-8", errors="replace") as fd:
+            for line in fd:
+                if line.strip().startswith("Events:"):
+                    try:
+                        sidecar["events"] = int(line.split(":")[1])
+                    except ValueError:
+                        pass
+                    break
+    if swini.exists():
+        sidecar["software settings"] = [
+            ll.strip() for ll in swini.read_text().split("\n")]
+    return sidecar
+
+
+def get_companion_fingerprint(path):
+    """Return a digest of the fingerprints of the companion files
+
+    For .tdms measurements, these are the files "Mx_*" with the
+    suffixes in :const:`TDMS_COMPANION_SUFFIXES`, the traces file
+    "Mx_*_traces.tdms", and "parameters.txt" in the same directory.
+    The digest changes when any of the files is created, modified,
+    or removed. The directory is not listed,
+    only the known files are accessed. .rtdc files do not have
+    companion files (an empty string is returned).
+    """
+    path = pathlib.Path(path)
+    if path.suffix != ".tdms":
+        return ""
+    mid = path.name.split("_")[0]
+    files = [path.with_name(mid + sfx) for sfx in TDMS_COMPANION_SUFFIXES]
+    files.append(path.with_name(path.stem + "_traces.tdms"))
+    files.append(path.with_name("parameters.txt"))
+    return get_fingerprint(files)
+
+
+def get_fingerprint(files):
+    """Return a digest of the fingerprints of the existing `files`"""
+    fps = []
+    for pp in files:
+        try:
+            fps.append(disk_cache.fingerprint(pp))
+        except OSError:
+            # file does not exist
+            fps.append(str(pp))
+    return hashlib.md5(repr(fps).encode("utf-8")).hexdigest()
@@ -0,0 +1,192 @@
+"""Model/view representation of the dataset table"""
+from PyQt5 import QtCore, QtGui, QtWidgets
+
+from . import meta_tool
+from . import registry
+
+
+#: Table columns (key, header)
+COLUMNS = [
+    ("DCKit-id", "ID"),
+    ("integrity", "Integrity"),
+    ("path", "Path"),
+    ("sample", "Sample"),
+    ("run index", "Run idx"),
+    ("event count", "Events"),
+    ("flow rate", "Flow rate"),
+]
+
+#: Column index for each column key
+COLUMN_INDEX = {key: ii for ii, (key, _) in enumerate(COLUMNS)}
+
+#: Text colors for the integrity check states
+INTEGRITY_COLORS = {"failed": "#A50000",
+                    "tolerable": "#7A6500",
+                    "passed": "#007A04"}
+
+#: Item data role for sorting by the underlying values
+SortRole = QtCore.Qt.UserRole + 1
+
+
+class DatasetTableModel(QtCore.QAbstractTableModel):
+    """Table model with one row per dataset
+
+    The model is a view on a :class:`dckit.registry.DatasetRegistry`.
+    Datasets are only ever appended or removed all at once, so the
+    row index of a dataset in this model is its DCKit-id.
+    """
+
+    def __init__(self, dataset_registry=None, *args, **kwargs):
+        super(DatasetTableModel, self).__init__(*args, **kwargs)
+        if dataset_registry is None:
+            dataset_registry = registry.DatasetRegistry()
+        #: datasets displayed
+        self.registry = dataset_registry
+
+    def append_rows(self, rows):
+        """Append multiple datasets to the table
+
+        Parameters
+        ----------
+        rows: list of (pathlib.Path, dckit.meta_tool.ProbeInfo)
+            Paths and metadata of the datasets
+        """
+        if not rows:
+            return
+        first = len(self.registry)
+        self.beginInsertRows(QtCore.QModelIndex(),
+                             first, first + len(rows) - 1)
+        self.registry.add_many(rows)
+        self.endInsertRows()
+
+    def clear(self):
+        """Remove all datasets"""
+        self.beginResetModel()
+        self.registry.clear()
+        self.endResetModel()
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(COLUMNS)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        rec = self.registry[index.row()]
+        key = COLUMNS[index.column()][0]
+        if role in [QtCore.Qt.DisplayRole, QtCore.Qt.EditRole]:
+            return self.get_text(rec, key)
+        elif role == SortRole:
+            if key == "DCKit-id":
+                return rec.dckit_id
+            elif key == "path":
+                return rec.path.name
+            elif key == "integrity":
+                return rec.integrity
+            else:
+                return getattr(rec.info, key.replace(" ", "_"))
+        elif role == QtCore.Qt.ToolTipRole and key == "path":
+            return str(rec.path)
+        elif role == QtCore.Qt.ForegroundRole and key == "integrity":
+            color = INTEGRITY_COLORS.get(rec.integrity)
+            if color is not None:
+                return QtGui.QColor(color)
+        return None
+
+    def flags(self, index):
+        flags = QtCore.Qt.ItemIsEnabled
+        if COLUMNS[index.column()][0] == "sample":
+            # allow editing sample name
+            flags |= QtCore.Qt.ItemIsEditable
+        return flags
+
+    def get_path(self, row):
+        return self.registry[row].path
+
+    def get_sample(self, row):
+        return self.registry[row].sample
+
+    @staticmethod
+    def get_text(rec, key):
+        """Return the text displayed in a cell of a record"""
+        if key == "DCKit-id":
+            return str(rec.dckit_id)
+        elif key == "integrity":
+            state = rec.integrity
+            return "run check" if state == "unchecked" else state
+        elif key == "path":
+            return rec.path.name
+        elif key == "flow rate":
+            if rec.info.chip_region == "channel":
+                return "{:.5f}".format(rec.info.flow_rate)
+            else:
+                return "reservoir"
+        else:
+            return "{}".format(getattr(rec.info, key.replace(" ", "_")))
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if (role == QtCore.Qt.DisplayRole
+                and orientation == QtCore.Qt.Horizontal):
+            return COLUMNS[section][1]
+        return super(DatasetTableModel, self).headerData(
+            section, orientation, role)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.registry)
+
+    def set_integrity(self, row, state):
+        """Set the integrity check state of a dataset"""
+        self.registry[row].integrity = state
+        index = self.index(row, COLUMN_INDEX["integrity"])
+        self.dataChanged.emit(index, index)
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if (not index.isValid()
+            or role != QtCore.Qt.EditRole
+                or COLUMNS[index.column()][0] != "sample"):
+            return False
+        rec = self.registry[index.row()]
+        if value == "":
+            # Reset sample name if set to empty string
+            value = meta_tool.get_sample_name(rec.path)
+        rec.sample = value
+        self.dataChanged.emit(index, index)
+        return True
+
+
+class IntegrityDelegate(QtWidgets.QStyledItemDelegate):
+    """Render the integrity column as buttons
+
+    Only the button of the cell under the mouse is actually handled;
+    the other cells are just painted, which scales to any number of
+    rows (as opposed to one widget per row).
+    """
+    #: emitted with the model index of the clicked button
+    clicked = QtCore.pyqtSignal(QtCore.QModelIndex)
+
+    def editorEvent(self, event, model, option, index):
+        if (event.type() == QtCore.QEvent.MouseButtonRelease
+            and event.button() == QtCore.Qt.LeftButton
+                and option.rect.contains(event.pos())):
+            self.clicked.emit(index)
+            return True
+        return super(IntegrityDelegate, self).editorEvent(
+            event, model, option, index)
+
+    def paint(self, painter, option, index):
+        opt = QtWidgets.QStyleOptionButton()
+        opt.rect = option.rect.adjusted(1, 1, -1, -1)
+        opt.text = index.data(QtCore.Qt.DisplayRole)
+        opt.state = QtWidgets.QStyle.State_Enabled
+        if option.state & QtWidgets.QStyle.State_MouseOver:
+            opt.state |= QtWidgets.QStyle.State_MouseOver
+        color = index.data(QtCore.Qt.ForegroundRole)
+        if color is not None:
+            opt.palette.setColor(QtGui.QPalette.ButtonText, color)
+        widget = option.widget
+        style = widget.style() if widget else QtWidgets.QApplication.style()
+        style.drawControl(QtWidgets.QStyle.CE_PushButton, opt, painter,
+                          widget)
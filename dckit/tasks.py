@@ -0,0 +1,1235 @@
+"""Qt-free task engine for processing RT-DC data
+
+The functions in this module carry out the tasks that are available
+in the DCKit user interface (compress, convert, split, join, update
+metadata, integrity check) without requiring Qt. Each task takes a list of
+:class:`TaskInput` and returns one :class:`TaskResult` per input
+file, so that the same code can be driven from the GUI or from a
+Python script, e.g.::
+
+    from dckit import tasks
+
+    inputs = [tasks.TaskInput(path=pp) for pp in paths]
+    results = tasks.compress(inputs, path_out="/path/to/output")
+    for res in results:
+        print(res.status, res.path, res.paths_out)
+"""
+import concurrent.futures
+import ctypes
+import dataclasses
+import multiprocessing as mp
+import os
+import pathlib
+import sys
+import threading
+import traceback
+import warnings
+
+import dclab
+from dclab.cli import common
+from dclab.cli import repack as dclab_repack
+from dclab.rtdc_dataset import feat_temp, fmt_tdms, rtdc_copy, RTDCWriter
+import h5py
+import hdf5plugin
+import numpy as np
+
+from . import hashing
+from . import history
+from . import integrity
+from . import memory_cache
+from . import meta_tool
+from ._version import version
+
+
+#: Name of the checksum manifest written to output directories
+CHECKSUM_MANIFEST = "SHA256SUMS"
+
+#: Memory in bytes required by a .tdms conversion in addition to the
+#: data (see :func:`get_tdms2rtdc_workers`)
+TDMS2RTDC_MEMORY_OVERHEAD = 300 * 1024**2
+
+
+@dataclasses.dataclass
+class TaskInput:
+    """Input file of a task"""
+    #: path to the input file
+    path: pathlib.Path
+    #: metadata written to the output file (dict of dicts), e.g.
+    #: ``{"experiment": {"sample": "beads"}}``
+    metadata: dict = dataclasses.field(default_factory=dict)
+    #: metadata the user defined in the integrity check dialog; if not
+    #: None, the metadata of the integrity check are written as well
+    #: (they are determined in the worker, see :func:`get_output_metadata`)
+    user_metadata: dict = None
+
+    def __post_init__(self):
+        self.path = pathlib.Path(self.path)
+
+    @property
+    def sample(self):
+        """Sample name from the metadata (falls back to the file)"""
+        sample = self.metadata.get("experiment", {}).get("sample")
+        if sample is None:
+            sample = meta_tool.get_sample_name(self.path)
+        return sample
+
+
+@dataclasses.dataclass
+class TaskResult:
+    """Outcome of a task for one input file"""
+    #: path to the input file
+    path: pathlib.Path
+    #: one of "success", "ignored" (the task does not apply to
+    #: the input file), "unchanged" (nothing to do), "cancelled",
+    #: or "error"
+    status: str
+    #: output files created
+    paths_out: list = dataclasses.field(default_factory=list)
+    #: human-readable description or traceback
+    message: str = ""
+    #: SHA-256 checksums of the output files (path string -> hex digest)
+    checksums: dict = dataclasses.field(default_factory=dict)
+    #: task-specific results (e.g. the integrity state, see
+    #: :func:`integrity_check`)
+    details: dict = dataclasses.field(default_factory=dict)
+
+
+@dataclasses.dataclass
+class SplitChunk(TaskInput):
+    """Output file of :func:`split`"""
+    #: path to the output file
+    path_chunk: pathlib.Path = None
+    #: index of the input file
+    index: int = 0
+    #: first event
+    start: int = 0
+    #: stop event (exclusive)
+    stop: int = 0
+    #: suffix for the sample name (e.g. "1/5")
+    title: str = ""
+    #: command log of the input file
+    log: list = dataclasses.field(default_factory=list)
+
+
+class TaskControl(object):
+    def __init__(self):
+        """Pause, resume, or cancel a running task from another thread
+
+        Files that are already being processed are always finished.
+        """
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+
+    def cancel(self):
+        self._cancelled.set()
+        # paused tasks must notice the cancellation
+        self._running.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def is_paused(self):
+        return not self._running.is_set()
+
+    def pause(self):
+        if not self.is_cancelled():
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def wait_if_paused(self, timeout=None):
+        """Block while the task is paused
+
+        Returns False if the task is still paused after `timeout`
+        seconds and True otherwise.
+        """
+        return self._running.wait(timeout)
+
+
+def compress(inputs, path_out, repack=False, progress=None,
+             num_workers=1, control=None, checksums=False,
+             default_metadata=None):
+    """Losslessly compress .rtdc files
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files; the metadata are written to the output files
+        and the sample name is used in the output file names.
+        Input files that are not .rtdc files are ignored.
+    path_out: str or pathlib.Path
+        Output directory
+    repack: bool
+        Whether to repack the output files and strip their logs;
+        the output files are written in a single pass (see
+        :func:`write_stripped`)
+    progress: callable
+        Called with the arguments (number of files processed, total
+        number of files, :class:`TaskResult`) after each file
+    num_workers: int
+        Number of worker processes; if set to one (default), the
+        files are processed in the calling thread; if set to None,
+        the number of CPUs is used.
+    control: TaskControl
+        Allows to pause, resume, or cancel the task from another
+        thread; files that were not processed because the task was
+        cancelled have the result status "cancelled".
+    checksums: bool
+        Whether to compute the SHA-256 checksums of the output files
+        and write them to a manifest in the output directory (see
+        :func:`write_checksum_manifests`)
+    default_metadata: dict of dicts
+        Global metadata defaults for inputs with `user_metadata`
+        (see :func:`get_output_metadata`)
+
+    Returns
+    -------
+    results: list of TaskResult
+        One result per input file
+    """
+    results = _run_per_file(compress_file, inputs, progress, num_workers,
+                            control,
+                            path_out=pathlib.Path(path_out),
+                            repack=repack,
+                            checksums=checksums,
+                            default_metadata=default_metadata)
+    if checksums:
+        write_checksum_manifests(results)
+    return results
+
+
+def compress_file(item, path_out, repack=False, checksums=False,
+                  default_metadata=None):
+    """Compress a single .rtdc file (see :func:`compress`)"""
+    path = item.path
+    if path.suffix != ".rtdc":
+        return TaskResult(path=path, status="ignored",
+                          message="not an .rtdc file")
+    prtdc = None
+    try:
+        metadata = get_output_metadata(item, default_metadata)
+        prtdc = path_out / get_rtdc_output_name(origin_path=path,
+                                                sample_name=item.sample)
+        if repack:
+            plogs = write_stripped(path_in=path,
+                                   path_out=prtdc,
+                                   metadata=metadata,
+                                   log_name="dclab-compress")
+        else:
+            dclab.cli.compress(path_in=path, path_out=prtdc)
+            plogs = finalize_output(prtdc,
+                                    task_dict={"name": "compress HDF5 data"},
+                                    metadata=metadata)
+        # the warning logs are listed in the checksum manifest as well
+        sums = get_checksums([prtdc] + plogs) if checksums else {}
+    except BaseException:
+        if prtdc is not None and prtdc.exists():
+            prtdc.unlink()
+        return TaskResult(path=path, status="error",
+                          message=traceback.format_exc())
+    return TaskResult(path=path, status="success", paths_out=[prtdc],
+                      message="{} -> {}".format(path, prtdc),
+                      checksums=sums)
+
+
+def integrity_check(inputs, progress=None, num_workers=1, control=None,
+                    default_metadata=None):
+    """Check the integrity of datasets
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files; the metadata are taken into account as if
+        they were already written to the files
+    progress: callable
+        See :func:`compress`
+    num_workers: int
+        See :func:`compress`
+    control: TaskControl
+        See :func:`compress`
+    default_metadata: dict of dicts
+        Global metadata defaults for metadata keys that are missing
+        or wrong in a dataset and not given in the input metadata
+
+    Returns
+    -------
+    results: list of TaskResult
+        One result per input file; the message contains the
+        integrity state ("passed", "tolerable", or "failed")
+        followed by the messages of the integrity checker. The
+        details contain the "state", the "editable" metadata keys,
+        and the "user metadata" (input metadata completed for all
+        editable keys, see :func:`dckit.integrity.check_file`).
+    """
+    return _run_per_file(integrity_check_file, inputs, progress,
+                         num_workers, control,
+                         default_metadata=default_metadata)
+
+
+def integrity_check_file(item, default_metadata=None):
+    """Check the integrity of a single file (see :func:`integrity_check`)"""
+    path = item.path
+    try:
+        state, cues, editables, user_metadata = integrity.check_file(
+            path,
+            user_metadata=item.metadata,
+            default_metadata=default_metadata)
+    except BaseException:
+        return TaskResult(path=path, status="error",
+                          message=traceback.format_exc())
+    lines = [state]
+    lines += ["{}: {}".format(cue.level, cue.msg) for cue in cues
+              if cue.level != "info"]
+    return TaskResult(path=path, status="success",
+                      message="\n".join(lines),
+                      details={"state": state,
+                               "editable": editables,
+                               "user metadata": user_metadata})
+
+
+def join(inputs, path_out, sample, repack=False, checksums=False):
+    """Join multiple RT-DC measurements into one .rtdc file
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files
+    path_out: str or pathlib.Path
+        Output .rtdc file (the suffix is added if missing)
+    sample: str
+        Sample name of the joined measurement
+    repack: bool
+        Whether to repack the output file and strip its logs
+    checksums: bool
+        See :func:`compress`
+
+    Returns
+    -------
+    result: TaskResult
+        Result for the output file; the message and the "inputs"
+        entry of `details` list the input files
+    """
+    path_out = pathlib.Path(path_out)
+    if not path_out.suffix == ".rtdc":
+        path_out = path_out.parent / (path_out.name + ".rtdc")
+    paths_in = [item.path for item in inputs]
+    metadata = {"experiment": {"run index": 1,
+                               "sample": sample}}
+    try:
+        dclab.cli.join(path_out=path_out,
+                       paths_in=paths_in,
+                       metadata=metadata)
+        # write any warnings to separate log files
+        plogs = extract_warning_logs(path_out)
+        if repack:
+            repack_file(path_out)
+        sums = get_checksums([path_out] + plogs) if checksums else {}
+    except BaseException:
+        if path_out.exists():
+            path_out.unlink()
+        return TaskResult(path=path_out, status="error",
+                          message=traceback.format_exc(),
+                          details={"inputs": paths_in})
+    result = TaskResult(path=path_out, status="success", paths_out=[path_out],
+                        message="\n".join([str(pp) for pp in paths_in]),
+                        checksums=sums,
+                        details={"inputs": paths_in})
+    if checksums:
+        write_checksum_manifests([result])
+    return result
+
+
+def split(inputs, path_out, split_events=None, split_size=None,
+          split_time=None, repack=False, progress=None, num_workers=1,
+          control=None, checksums=False):
+    """Split .rtdc or .tdms files into smaller .rtdc files
+
+    Exactly one of `split_events`, `split_size`, or `split_time`
+    must be given. The output files of one input are written in
+    parallel (the chunks of all inputs share the worker pool).
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files
+    path_out: str or pathlib.Path
+        Output directory
+    split_events: int
+        Number of events per output file
+    split_size: float
+        Target size of the output files in MB; the number of events
+        per file is estimated from the size of the input file
+    split_time: float
+        Duration of the measurement in seconds per output file
+        (determined from the "time" feature)
+    repack: bool
+        Whether to repack the output files and strip their logs
+    progress: callable
+        See :func:`compress`; called once per input file
+    num_workers: int
+        See :func:`compress`
+    control: TaskControl
+        See :func:`compress`
+    checksums: bool
+        See :func:`compress`
+
+    Returns
+    -------
+    results: list of TaskResult
+        One result per input file
+    """
+    if [split_events, split_size, split_time].count(None) != 2:
+        raise ValueError("Please specify exactly one of `split_events`, "
+                         "`split_size`, or `split_time`!")
+    path_out = pathlib.Path(path_out)
+    if split_events is not None:
+        task_dict = {"name": "split every {} events".format(split_events)}
+    elif split_size is not None:
+        task_dict = {"name": "split into files of {} MB".format(split_size)}
+    else:
+        task_dict = {"name": "split every {} s".format(split_time)}
+    # Determine the chunks of all input files
+    results = [None] * len(inputs)
+    chunks = []
+    for ii, item in enumerate(inputs):
+        try:
+            slices = get_split_slices(item.path,
+                                      split_events=split_events,
+                                      split_size=split_size,
+                                      split_time=split_time)
+            log = common.get_command_log(paths=[item.path])
+        except BaseException:
+            results[ii] = TaskResult(path=item.path, status="error",
+                                     message=traceback.format_exc())
+            continue
+        for jj, (start, stop) in enumerate(slices):
+            chunks.append(SplitChunk(
+                path=item.path,
+                path_chunk=path_out / f"{item.path.stem}_{jj + 1:04d}.rtdc",
+                index=ii,
+                start=start,
+                stop=stop,
+                title=f"{jj + 1}/{len(slices)}",
+                log=log))
+        if not slices:
+            results[ii] = TaskResult(path=item.path, status="unchanged",
+                                     message="no events")
+    # report results for inputs that do not need any processing
+    num_done = 0
+    for res in results:
+        if res is not None:
+            num_done += 1
+            if progress is not None:
+                progress(num_done, len(inputs), res)
+    # Write all chunks
+    remaining = {}
+    for chunk in chunks:
+        remaining[chunk.index] = remaining.get(chunk.index, 0) + 1
+    chunk_results = {ii: [] for ii in remaining}
+
+    def chunk_progress(done, total, result):
+        nonlocal num_done
+        index = getattr(result, "index", None)
+        if index is None:
+            # cancelled
+            return
+        chunk_results[index].append(result)
+        remaining[index] -= 1
+        if not remaining[index]:
+            results[index] = _merge_split_results(inputs[index],
+                                                  chunk_results[index])
+            num_done += 1
+            if progress is not None:
+                progress(num_done, len(inputs), results[index])
+
+    all_chunk_results = _run_per_file(split_chunk_file, chunks,
+                                      chunk_progress, num_workers, control,
+                                      task_dict=task_dict, repack=repack,
+                                      checksums=checksums)
+    # inputs with cancelled chunks
+    for ii in remaining:
+        if remaining[ii]:
+            results[ii] = _merge_split_results(
+                inputs[ii],
+                [res for chunk, res in zip(chunks, all_chunk_results)
+                 if chunk.index == ii])
+            num_done += 1
+            if progress is not None:
+                progress(num_done, len(inputs), results[ii])
+    if checksums:
+        write_checksum_manifests(results)
+    return results
+
+
+def split_chunk_file(chunk, task_dict, repack=False, checksums=False):
+    """Write a single chunk of an input file (see :func:`split`)
+
+    Returns a :class:`TaskResult` with the additional attribute
+    `index` (index of the input file).
+    """
+    path_temp = chunk.path_chunk.with_suffix(".rtdc~")
+    try:
+        with warnings.catch_warnings(record=True) as ws:
+            warnings.simplefilter("always")
+            # ignore ResourceWarning: unclosed file <_io.BufferedReader...>
+            warnings.simplefilter("ignore", ResourceWarning)
+            with dclab.new_dataset(chunk.path) as ds:
+                if ds.format == "tdms":
+                    warnings.simplefilter(
+                        "ignore", fmt_tdms.event_image.SlowVideoWarning)
+                    warnings.simplefilter(
+                        "ignore",
+                        fmt_tdms.event_image.InitialFrameMissingWarning)
+                ds.filter.manual[:] = False
+                ds.filter.manual[chunk.start:chunk.stop] = True
+                common.skip_empty_image_events(ds=ds,
+                                               initial=True,
+                                               final=True)
+                ds.apply_filter()
+                ds.export.hdf5(path=path_temp,
+                               features=ds.features_innate,
+                               logs=not repack,
+                               tables=True,
+                               basins=True,
+                               filtered=True,
+                               compression_kwargs=hdf5plugin.Zstd(clevel=5))
+                sample = ds.config["experiment"]["sample"]
+                logs = dict(ds.logs) if repack else {}
+        if ws:
+            logs["dclab-split-warnings"] = common.assemble_warnings(ws)
+        with RTDCWriter(path_temp,
+                        compression_kwargs=hdf5plugin.Zstd(clevel=5)) as hw:
+            if repack:
+                # remove the export log of dclab
+                if "logs" in hw.h5file:
+                    del hw.h5file["logs"]
+            else:
+                for name, value in logs.items():
+                    hw.store_log(name, value)
+                hw.store_log("dclab-split", chunk.log)
+            hw.store_metadata(
+                {"experiment": {"sample": f"{sample} {chunk.title}"}})
+        path_temp.rename(chunk.path_chunk)
+        if repack:
+            # the logs are stripped, no need for a second pass
+            plogs = write_warning_logs(chunk.path_chunk, logs)
+        else:
+            plogs = finalize_output(chunk.path_chunk, task_dict=task_dict)
+        sums = get_checksums([chunk.path_chunk] + plogs) if checksums else {}
+    except BaseException:
+        for pp in [path_temp, chunk.path_chunk]:
+            if pp.exists():
+                pp.unlink()
+        result = TaskResult(path=chunk.path, status="error",
+                            message=traceback.format_exc())
+    else:
+        result = TaskResult(path=chunk.path, status="success",
+                            paths_out=[chunk.path_chunk],
+                            checksums=sums)
+    # needed for assigning the chunk to its input in :func:`split`
+    result.index = chunk.index
+    return result
+
+
+def get_split_slices(path, split_events=None, split_size=None,
+                     split_time=None):
+    """Return the event slices for splitting a dataset
+
+    See :func:`split` for a description of the parameters.
+
+    Returns
+    -------
+    slices: list of (int, int)
+        Start and stop event indices of the output files (empty
+        for empty datasets)
+    """
+    with dclab.new_dataset(path) as ds:
+        size = len(ds)
+        if split_time is not None:
+            if "time" in ds:
+                time = ds["time"]
+            else:
+                time = ds["frame"] / ds.config["imaging"]["frame rate"]
+            if len(time) == 0:
+                # empty dataset (nothing to split, as for split_events)
+                return []
+            # binary search for the window boundaries
+            edges = np.arange(time[0], time[-1] + split_time, split_time)
+            bounds = np.searchsorted(time, edges[1:], side="left")
+            bounds = [0] + [int(b) for b in np.unique(bounds)]
+            if bounds[-1] != size:
+                bounds.append(size)
+            return [(b0, b1) for b0, b1 in zip(bounds[:-1], bounds[1:])
+                    if b1 > b0]
+        elif split_size is not None:
+            # estimate the number of events per file from the input
+            path = pathlib.Path(path)
+            bytes_in = path.stat().st_size
+            if ds.format == "tdms":
+                mid = path.name.split("_")[0]
+                pavi = path.with_name(mid + "_imaq.avi")
+                if pavi.exists():
+                    bytes_in += pavi.stat().st_size
+            bytes_per_event = bytes_in / max(size, 1)
+            split_events = max(1, int(split_size * 1024**2 // bytes_per_event))
+    return [(start, min(start + split_events, size))
+            for start in range(0, size, split_events)]
+
+
+def _merge_split_results(item, chunk_results):
+    """Combine the results of all chunks of an input file"""
+    errors = [res for res in chunk_results if res.status == "error"]
+    cancelled = [res for res in chunk_results if res.status == "cancelled"]
+    paths_out = sorted([pp for res in chunk_results for pp in res.paths_out])
+    if errors or cancelled:
+        # remove erroneous files
+        for pp in paths_out:
+            if pp.exists():
+                pp.unlink()
+        if errors:
+            return TaskResult(path=item.path, status="error",
+                              message="\n\n".join(r.message for r in errors))
+        else:
+            return TaskResult(path=item.path, status="cancelled")
+    checksums = {}
+    for res in chunk_results:
+        checksums.update(res.checksums)
+    return TaskResult(path=item.path, status="success", paths_out=paths_out,
+                      message="\n\n".join(["created {}".format(pp)
+                                           for pp in paths_out]),
+                      checksums=checksums)
+
+
+def tdms2rtdc(inputs, path_out, repack=False, progress=None,
+              num_workers=1, control=None, checksums=False,
+              default_metadata=None):
+    """Convert .tdms files to .rtdc files
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files; the metadata are written to the output files
+        and the sample name is used in the output file names.
+        Input files that are not .tdms files are ignored.
+    path_out: str or pathlib.Path
+        Output directory
+    repack: bool
+        Whether to repack the output files and strip their logs
+    progress: callable
+        See :func:`compress`
+    num_workers: int
+        See :func:`compress`; the number of workers is reduced if
+        there is not enough memory available for converting that
+        many files at once (see :func:`get_tdms2rtdc_workers`)
+    control: TaskControl
+        See :func:`compress`
+    checksums: bool
+        See :func:`compress`
+    default_metadata: dict of dicts
+        See :func:`compress`
+
+    Returns
+    -------
+    results: list of TaskResult
+        One result per input file
+    """
+    num_workers = get_tdms2rtdc_workers(inputs, num_workers)
+    results = _run_per_file(tdms2rtdc_file, inputs, progress, num_workers,
+                            control,
+                            path_out=pathlib.Path(path_out),
+                            repack=repack,
+                            checksums=checksums,
+                            default_metadata=default_metadata)
+    if checksums:
+        write_checksum_manifests(results)
+    return results
+
+
+def tdms2rtdc_file(item, path_out, repack=False, checksums=False,
+                   default_metadata=None):
+    """Convert a single .tdms file (see :func:`tdms2rtdc`)"""
+    path = item.path
+    if path.suffix != ".tdms":
+        return TaskResult(path=path, status="ignored",
+                          message="not a .tdms file")
+    prtdc = None
+    try:
+        metadata = get_output_metadata(item, default_metadata)
+        prtdc = path_out / get_rtdc_output_name(origin_path=path,
+                                                sample_name=item.sample)
+        if repack:
+            plogs = write_stripped(path_in=path,
+                                   path_out=prtdc,
+                                   metadata=metadata,
+                                   log_name="dclab-tdms2rtdc")
+        else:
+            dclab.cli.tdms2rtdc(path_tdms=path,
+                                path_rtdc=prtdc,
+                                compute_features=False,
+                                skip_initial_empty_image=True,
+                                skip_final_empty_image=True,
+                                verbose=False)
+            plogs = finalize_output(prtdc,
+                                    task_dict={
+                                        "name": "convert .tdms to .rtdc"},
+                                    metadata=metadata)
+        # the warning logs are listed in the checksum manifest as well
+        sums = get_checksums([prtdc] + plogs) if checksums else {}
+    except BaseException:
+        if prtdc is not None and prtdc.exists():
+            prtdc.unlink()
+        return TaskResult(path=path, status="error",
+                          message=traceback.format_exc())
+    return TaskResult(path=path, status="success", paths_out=[prtdc],
+                      message="{} -> {}".format(path, prtdc),
+                      checksums=sums)
+
+
+def update_metadata(inputs, progress=None, num_workers=1, control=None,
+                    default_metadata=None):
+    """Write metadata to .rtdc files in-place
+
+    Parameters
+    ----------
+    inputs: list of TaskInput
+        Input files and the metadata to write. Input files that are
+        not .rtdc files are ignored.
+    progress: callable
+        See :func:`compress`
+    num_workers: int
+        See :func:`compress`
+    control: TaskControl
+        See :func:`compress`
+    default_metadata: dict of dicts
+        See :func:`compress`
+
+    Returns
+    -------
+    results: list of TaskResult
+        One result per input file; the status is "unchanged" if the
+        file already contained the metadata.
+    """
+    return _run_per_file(update_metadata_file, inputs, progress,
+                         num_workers, control,
+                         default_metadata=default_metadata)
+
+
+def update_metadata_file(item, default_metadata=None):
+    """Write metadata to a single file (see :func:`update_metadata`)"""
+    path = item.path
+    if path.suffix != ".rtdc":
+        return TaskResult(path=path, status="ignored",
+                          message="not an .rtdc file")
+    try:
+        metadata = get_output_metadata(item, default_metadata)
+        with h5py.File(path, "a") as h5:
+            task_dict_meta = write_metadata_attrs(h5, metadata)
+            if task_dict_meta:
+                append_execution_log(h5, task_dict_meta)
+    except BaseException:
+        return TaskResult(path=path, status="error",
+                          message=traceback.format_exc())
+    finally:
+        memory_cache.invalidate(path)
+    if task_dict_meta:
+        return TaskResult(path=path, status="success", paths_out=[path],
+                          message="{}: update metadata".format(path))
+    else:
+        return TaskResult(path=path, status="unchanged")
+
+
+def _get_future_result(future, item):
+    """Return the result of a future, converting errors to a TaskResult
+
+    The task functions catch all errors themselves; this is for
+    errors in the process pool (e.g. a worker process that was
+    killed because the system ran out of memory).
+    """
+    try:
+        return future.result()
+    except BaseException:
+        return TaskResult(path=item.path, status="error",
+                          message=traceback.format_exc())
+
+
+def _init_worker(temporary_features):
+    """Initialize a worker process of :func:`_run_per_file`"""
+    for feat, is_scalar in temporary_features:
+        if not dclab.dfn.feature_exists(feat):
+            feat_temp.register_temporary_feature(feat, is_scalar=is_scalar)
+
+
+def _run_per_file(func, inputs, progress, num_workers=1, control=None,
+                  **kwargs):
+    """Call `func(item, **kwargs)` for every item in `inputs`
+
+    If `num_workers` is larger than one (and there is more than one
+    item), the items are processed in a pool of worker processes.
+    The temporary features registered in dclab are also registered
+    in the worker processes. The results are always returned in the
+    order of `inputs`, but `progress` is called in the order in which
+    the items are completed.
+    """
+    if control is None:
+        control = TaskControl()
+    results = [None] * len(inputs)
+    num_done = 0
+
+    def set_result(index, result):
+        nonlocal num_done
+        results[index] = result
+        num_done += 1
+        if progress is not None:
+            progress(num_done, len(inputs), result)
+
+    if (num_workers is None or num_workers > 1) and len(inputs) > 1:
+        num_workers = min(num_workers or os.cpu_count(), len(inputs))
+        ctx = mp.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=ctx,
+                initializer=_init_worker,
+                initargs=(get_temporary_features(),)) as pool:
+            # Only submit a few more items than there are workers,
+            # so pausing and cancelling take effect quickly.
+            pending = list(enumerate(inputs))[::-1]
+            running = {}
+            while pending or running:
+                while (pending and len(running) < 2 * num_workers
+                       and not control.is_cancelled()
+                       and control.wait_if_paused(timeout=.1)):
+                    ii, item = pending.pop()
+                    running[pool.submit(func, item, **kwargs)] = ii
+                if control.is_cancelled():
+                    break
+                if not running:
+                    continue
+                done, _ = concurrent.futures.wait(
+                    running, timeout=.1,
+                    return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    ii = running.pop(fut)
+                    set_result(ii, _get_future_result(fut, inputs[ii]))
+            for fut in concurrent.futures.as_completed(running):
+                ii = running[fut]
+                set_result(ii, _get_future_result(fut, inputs[ii]))
+    else:
+        for ii, item in enumerate(inputs):
+            control.wait_if_paused()
+            if control.is_cancelled():
+                break
+            set_result(ii, func(item, **kwargs))
+    for ii, item in enumerate(inputs):
+        if results[ii] is None:
+            set_result(ii, TaskResult(path=item.path, status="cancelled"))
+    return results
+
+
+def append_execution_log(path, task_dict):
+    """Append the job information and `task_dict` to the DCKit history
+
+    `path` may also be an .rtdc file opened for writing.
+    """
+    history.append_history(path, get_execution_info(task_dict))
+
+
+def extract_warning_logs(path):
+    """Write the warning logs of an .rtdc file to separate files
+
+    Returns the paths of the log files (see :func:`write_warning_logs`).
+    """
+    return write_warning_logs(path, meta_tool.get_rtdc_logs(path))
+
+
+def finalize_output(path, task_dict, metadata=None):
+    """Common steps after an output file was written
+
+    This appends `task_dict` to the execution log, writes
+    `metadata`, and extracts the warning logs. The output
+    file is opened only once for all of these steps. Returns the
+    paths of the log files (see :func:`write_warning_logs`).
+    """
+    with h5py.File(path, "a") as h5:
+        append_execution_log(h5, task_dict)
+        if metadata:
+            task_dict_meta = write_metadata_attrs(h5, metadata)
+            if task_dict_meta:
+                append_execution_log(h5, task_dict_meta)
+        logs = meta_tool.get_h5_logs(h5, select="warnings")
+    # write any warnings to separate log files
+    return write_warning_logs(path, logs)
+
+
+def get_available_memory():
+    """Return the available physical memory in bytes (None if unknown)"""
+    if sys.platform == "win32":
+        class MemoryStatusEx(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong),
+                        ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong),
+                        ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong),
+                        ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong),
+                        ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("sullAvailExtendedVirtual", ctypes.c_ulonglong)]
+        stat = MemoryStatusEx()
+        stat.dwLength = ctypes.sizeof(MemoryStatusEx)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(stat)):
+            return stat.ullAvailPhys
+    else:
+        try:
+            return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+        except (ValueError, OSError, AttributeError):
+            # e.g. macOS does not define SC_AVPHYS_PAGES
+            pass
+    return None
+
+
+def get_tdms2rtdc_workers(inputs, num_workers):
+    """Limit the number of workers for .tdms conversion by memory
+
+    The peak memory of a conversion is estimated as twice the size
+    of the measurement files (.tdms data and video) plus a constant
+    overhead. The number of workers is reduced such that converting
+    the largest measurements in parallel does not exceed the
+    available memory. At least one worker is always used.
+    """
+    num_workers = num_workers or os.cpu_count()
+    available = get_available_memory()
+    if num_workers == 1 or available is None:
+        return num_workers
+    estimates = []
+    for item in inputs:
+        if item.path.suffix != ".tdms":
+            continue
+        mid = item.path.name.split("_")[0]
+        size = 0
+        for pp in [item.path, item.path.with_name(mid + "_imaq.avi")]:
+            if pp.exists():
+                size += pp.stat().st_size
+        estimates.append(2 * size + TDMS2RTDC_MEMORY_OVERHEAD)
+    if not estimates:
+        return num_workers
+    # assume the largest measurements are converted at the same time
+    estimates = sorted(estimates, reverse=True)
+    num_fit = 0
+    while (num_fit < min(num_workers, len(estimates))
+           and sum(estimates[:num_fit + 1]) <= available):
+        num_fit += 1
+    return max(1, num_fit)
+
+
+def get_checksums(paths):
+    """Return the SHA-256 checksums of files (path string -> hex digest)
+
+    This is called right after an output file was written, so the
+    data are usually still in the page cache of the operating system.
+    The checksums are also stored in the disk cache.
+    """
+    return {str(pp): hashing.get_sha256(pp) for pp in paths}
+
+
+def get_execution_info(task_dict):
+    """Return the job information and `task_dict` for the history"""
+    info = common.get_job_info()
+    info["libraries"]["dckit"] = version
+    info["task"] = task_dict
+    return info
+
+
+def get_temporary_features():
+    """Return the registered temporary features
+
+    Returns
+    -------
+    temporary_features: list of (str, bool)
+        Feature names and whether they are scalar features
+    """
+    return list(integrity.get_temporary_features())
+
+
+def get_output_metadata(item, default_metadata=None):
+    """Return the metadata to write to the output file of an input
+
+    If `item.user_metadata` is None, these are the metadata of `item`.
+    Otherwise, the dataset is checked with the user-defined metadata
+    (see :func:`dckit.integrity.check_file`, usually a cache lookup)
+    and the metadata of the integrity check are combined with the
+    metadata of `item` (which take precedence). This is equivalent
+    to :func:`dckit.dlg_icheck.IntegrityCheckDialog.metadata_from_path`,
+    but runs in the worker process instead of the GUI thread.
+    """
+    if item.user_metadata is None:
+        return item.metadata
+    _, _, editables, completed = integrity.check_file(
+        item.path,
+        user_metadata=item.user_metadata,
+        default_metadata=default_metadata)
+    metadata = integrity.get_check_metadata(editables, completed,
+                                            default_metadata)
+    for sec in item.metadata:
+        metadata.setdefault(sec, {}).update(item.metadata[sec])
+    return metadata
+
+
+def get_rtdc_output_name(origin_path, sample_name):
+    """Return a descriptive output file name for an input file"""
+    if meta_tool.get_chip_region(origin_path) == "channel":
+        fl_or_res = "{:.4f}uls".format(meta_tool.get_flow_rate(origin_path))
+    else:
+        fl_or_res = "reservoir"
+
+    name = "{}_M{}_{}_{}_{}.rtdc".format(
+        meta_tool.get_date(origin_path),
+        meta_tool.get_run_index(origin_path),
+        fl_or_res,
+        sample_name,
+        sha256(origin_path)[:8])
+    return get_valid_filename(name)
+
+
+def get_valid_filename(value):
+    """
+    Return the given string converted to a string that can be used
+    for a clean filename.
+    """
+    ret = ""
+
+    valid = "abcdefghijklmnopqrstuvwxyz" \
+            + "ABCDEFGHIJKLMNOPQRSTUVWXYZ" \
+            + "0123456789" \
+            + "._-()"
+    replace = {
+        " ": "_",
+        "[": "(",
+        "]": ")",
+        "µ": "u",
+    }
+
+    for ch in value:
+        if ch in valid:
+            ret += ch
+        elif ch in replace:
+            ret += replace[ch]
+        else:
+            ret += "?"
+
+    ret = ret.strip(".")
+    return ret
+
+
+def read_checksum_manifest(path):
+    """Read a checksum manifest (file name -> hex digest)"""
+    entries = {}
+    for line in pathlib.Path(path).read_text(encoding="utf-8").splitlines():
+        if line.strip():
+            digest, name = line.split(maxsplit=1)
+            # "*" denotes binary mode in the format of `sha256sum`
+            entries[name.lstrip("*")] = digest
+    return entries
+
+
+def repack_file(path):
+    """Repack an .rtdc file in-place and strip its logs"""
+    path = pathlib.Path(path)
+    # rename the original file
+    path_orig = path.with_name(path.stem + "_original.rtdc")
+    path.rename(path_orig)
+    try:
+        dclab_repack(path_in=path_orig, path_out=path, strip_logs=True)
+    except BaseException:
+        path_orig.unlink()
+        if path.exists():
+            path.unlink()
+        raise
+    else:
+        path_orig.unlink()
+
+
+def sha256(path):
+    """Return the SHA-256 hash of a file (cached on disk)"""
+    return hashing.get_sha256(path)
+
+
+def write_checksum_manifests(results):
+    """Add the checksums of output files to the checksum manifests
+
+    The checksums in `results` are written to the file
+    :const:`CHECKSUM_MANIFEST` in each output directory, in the
+    format of `sha256sum`, so that the files can be verified
+    with ``sha256sum -c SHA256SUMS``. Existing entries for other
+    files are kept. The checksums of a task include the warning
+    log files written next to the .rtdc output files.
+
+    Parameters
+    ----------
+    results: list of TaskResult
+        Results of a task
+
+    Returns
+    -------
+    paths: list of pathlib.Path
+        Paths of the manifests that were written
+    """
+    sums_dir = {}
+    for res in results:
+        for pp, digest in res.checksums.items():
+            pp = pathlib.Path(pp)
+            sums_dir.setdefault(pp.parent, {})[pp.name] = digest
+    paths = []
+    for pdir, sums in sums_dir.items():
+        path = pdir / CHECKSUM_MANIFEST
+        entries = read_checksum_manifest(path) if path.exists() else {}
+        entries.update(sums)
+        path_temp = path.with_name(path.name + "~")
+        path_temp.write_text(
+            "".join([f"{entries[name]}  {name}\n"
+                     for name in sorted(entries)]),
+            encoding="utf-8")
+        path_temp.replace(path)
+        paths.append(path)
+    return paths
+
+
+def write_metadata_attrs(h5, metadata):
+    """Write metadata to the attributes of an open HDF5 file
+
+    Returns
+    -------
+    `task_dict` if anything changed or None
+    """
+    # entry for the log
+    task_dict = {
+        "name": "update metadata",
+        "old": {},
+        "new": {},
+    }
+    for sec in metadata:
+        for key in metadata[sec]:
+            h5key = "{}:{}".format(sec, key)
+            value = metadata[sec][key]
+            value_old = h5.attrs.get(h5key, None)
+            if isinstance(value_old, bytes):
+                value_old = value_old.decode("utf-8")
+            if isinstance(value, bytes):
+                value = value.decode("utf-8")
+            if value != value_old:
+                task_dict["new"][h5key] = value
+                task_dict["old"][h5key] = value_old
+                if isinstance(value, str):  # (after task_dict)
+                    value = np.bytes_(value.encode("utf-8"))
+                h5.attrs[h5key] = value
+    if task_dict["new"]:
+        return task_dict
+    else:
+        return None
+
+
+def write_stripped(path_in, path_out, metadata=None, log_name="dckit"):
+    """Write a compressed, repacked .rtdc file without logs in one pass
+
+    This is equivalent to compressing (or converting) `path_in`,
+    writing `metadata`, and repacking the output file with stripped
+    logs, but the data are written only once. The warning logs of
+    the input file and the warnings issued while writing are stored
+    in separate log files next to `path_out`.
+
+    Parameters
+    ----------
+    path_in: pathlib.Path
+        Input .rtdc or .tdms file
+    path_out: pathlib.Path
+        Output .rtdc file
+    metadata: dict
+        Metadata (dict of dicts) written to the output file
+    log_name: str
+        Prefix of the warnings log file name (e.g. "dclab-compress"
+        results in "dclab-compress-warnings")
+
+    Returns
+    -------
+    paths_log: list of pathlib.Path
+        Paths of the warning log files (see :func:`write_warning_logs`)
+    """
+    path_in = pathlib.Path(path_in)
+    path_out = pathlib.Path(path_out)
+    path_temp = path_out.with_suffix(".rtdc~")
+    path_temp.unlink(missing_ok=True)
+    try:
+        with warnings.catch_warnings(record=True) as ws:
+            warnings.simplefilter("always")
+            # ignore ResourceWarning: unclosed file <_io.BufferedReader...>
+            warnings.simplefilter("ignore", ResourceWarning)
+            if path_in.suffix == ".tdms":
+                warnings.simplefilter(
+                    "ignore", fmt_tdms.event_image.SlowVideoWarning)
+                warnings.simplefilter(
+                    "ignore", fmt_tdms.event_image.InitialFrameMissingWarning)
+                with dclab.new_dataset(path_in) as ds:
+                    common.skip_empty_image_events(ds=ds,
+                                                   initial=True,
+                                                   final=True)
+                    ds.export.hdf5(
+                        path=path_temp,
+                        features=ds.features_innate,
+                        filtered=True,
+                        compression_kwargs=hdf5plugin.Zstd(clevel=5))
+                    logs = dict(ds.logs)
+                with h5py.File(path_temp, "a") as h5_out:
+                    # remove the export log of dclab
+                    if "logs" in h5_out:
+                        del h5_out["logs"]
+                    write_metadata_attrs(h5_out, metadata or {})
+                    # " | dclab X.Y.Z" (as in the two-pass repack)
+                    RTDCWriter(h5_out).version_brand()
+            else:
+                with h5py.File(path_in, "r", locking=False) as h5_in, \
+                        h5py.File(path_temp, "w") as h5_out:
+                    rtdc_copy(src_h5file=h5_in,
+                              dst_h5file=h5_out,
+                              features="all",
+                              include_basins=True,
+                              include_logs=False,
+                              include_tables=True,
+                              meta_prefix="")
+                    write_metadata_attrs(h5_out, metadata or {})
+                    # " | dclab X.Y.Z" (as in the two-pass repack)
+                    RTDCWriter(h5_out).version_brand()
+                    logs = meta_tool.get_h5_logs(h5_in, select="warnings")
+        if ws:
+            logs[log_name + "-warnings"] = common.assemble_warnings(ws)
+        path_temp.rename(path_out)
+    except BaseException:
+        path_temp.unlink(missing_ok=True)
+        raise
+    return write_warning_logs(path_out, logs)
+
+
+def write_warning_logs(path, logs):
+    """Write the warning logs from `logs` to separate files
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        Path to the .rtdc file; the log files are written to the
+        same directory
+    logs: dict
+        Log names and lists of lines; only logs with "warnings"
+        in their name are written
+
+    Returns
+    -------
+    paths_log: list of pathlib.Path
+        Paths of the log files that were written
+    """
+    path = pathlib.Path(path)
+    paths_log = []
+    for lname in logs:
+        if lname.count("warnings"):
+            plog = path.with_name(path.stem + "_" + lname + ".log")
+            plog.write_text("\r\n".join(logs[lname]))
+            paths_log.append(plog)
+    return paths_log
@@ -31,8 +31,11 @@ setup(
                       "numpy>=1.21",
                       "pyqt5",
                       ],
+    extras_require={"xxhash": ["xxhash"]},
     python_requires='>=3.10, <4',
-    entry_points={"gui_scripts": ['dckit = dckit.__main__:main']},
+    entry_points={"gui_scripts": ['dckit = dckit.__main__:main'],
+                  "console_scripts": ['dckit-batch = dckit.cli:batch'],
+                  },
     keywords=["RT-DC", "deformability", "cytometry", "zellmechanik"],
     classifiers=['Operating System :: OS Independent',
                  'Programming Language :: Python :: 3',
@@ -1,3 +1,4 @@
+import os
 import shutil
 import tempfile
 import time
@@ -18,6 +19,8 @@ def pytest_configure(config):
     file after command line options have been parsed.
     """
     tempfile.tempdir = TMPDIR
+    # do not touch the cache of the user
+    os.environ["DCKIT_CACHE_DIR"] = TMPDIR
     QtCore.QCoreApplication.setOrganizationName("DC-Analysis")
     QtCore.QCoreApplication.setOrganizationDomain("dc-cosmos.org")
     QtCore.QCoreApplication.setApplicationName("DCKit")
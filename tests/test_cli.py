@@ -0,0 +1,89 @@
+import json
+import pathlib
+import shutil
+
+import dclab
+import h5py
+import pytest
+
+from dckit import cli
+
+from helper_methods import retrieve_data
+
+
+def test_batch_compress_csv(tmp_path):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path_bad = path.with_name("invalid.rtdc")
+    path_bad.write_text("no hdf5 data")
+    manifest = path.with_name("manifest.csv")
+    manifest.write_text("path,sample,setup:flow rate\n"
+                        + f"{path.name},Peter,0.08\n"
+                        + f"{path_bad.name},,\n")
+    report = tmp_path / "report.json"
+    ret = cli.batch(["compress", str(manifest),
+                     "--output", str(tmp_path / "out"),
+                     "--report", str(report),
+                     "--workers", "2",
+                     "--checksums",
+                     "--quiet"])
+    assert ret == 1, "one file is broken"
+    results = json.loads(report.read_text())["results"]
+    assert [r["status"] for r in results] == ["success", "error"]
+    path_out = results[0]["paths_out"][0]
+    digest = results[0]["checksums"][path_out]
+    assert (tmp_path / "out" / "SHA256SUMS").read_text() == \
+        f"{digest}  {pathlib.Path(path_out).name}\n"
+    with dclab.new_dataset(results[0]["paths_out"][0]) as ds:
+        assert ds.config["experiment"]["sample"] == "Peter"
+        assert ds.config["setup"]["flow rate"] == 0.08
+
+
+@pytest.mark.parametrize("workers", ["1", "2"])
+def test_batch_report_stdout(tmp_path, capfd, workers):
+    """Only the report is written to stdout"""
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = tmp_path / "other.rtdc"
+    shutil.copy2(path, path2)
+    with h5py.File(path2, "a") as h5:
+        # different output file name
+        h5.attrs["experiment:run index"] = 2
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text(f"path\n{path}\n{path2}\n")
+    ret = cli.batch(["compress", str(manifest),
+                     "--output", str(tmp_path / "out"),
+                     "--workers", workers,
+                     "--quiet"])
+    assert ret == 0
+    out, err = capfd.readouterr()
+    report = json.loads(out)
+    assert [r["status"] for r in report["results"]] == ["success"] * 2
+    assert "Compression" in err
+
+
+def test_batch_integrity_json(tmp_path):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text(json.dumps([{"path": str(path)}]))
+    report = tmp_path / "report.json"
+    ret = cli.batch(["integrity", str(manifest),
+                     "--report", str(report),
+                     "--workers", "1",
+                     "--quiet"])
+    assert ret == 0
+    results = json.loads(report.read_text())["results"]
+    assert results[0]["status"] == "success"
+    state = results[0]["message"].split("\n")[0]
+    assert state in ["passed", "tolerable", "failed"]
+
+
+@pytest.mark.parametrize("task", ["join", "compress"])
+def test_batch_empty_manifest(tmp_path, capsys, task):
+    manifest = tmp_path / "manifest.csv"
+    manifest.write_text("path,sample\n")
+    with pytest.raises(SystemExit) as exc:
+        cli.batch([task, str(manifest),
+                   "--output", str(tmp_path / "out.rtdc"),
+                   "--quiet"])
+    assert exc.value.code == 2
+    assert "does not list any files" in capsys.readouterr().err
+    assert not (tmp_path / "out.rtdc").exists()
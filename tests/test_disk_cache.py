@@ -0,0 +1,54 @@
+"""Test persistent disk cache"""
+import os
+
+import h5py
+
+from dckit import disk_cache, meta_tool
+
+from helper_methods import retrieve_data
+
+
+def test_entries_are_invalidated(tmp_path):
+    cache = disk_cache.DiskCache(tmp_path / "cache.db")
+    path = tmp_path / "data.txt"
+    path.write_text("peter")
+    cache.set(path, "probe", {"golem": 2})
+    assert cache.get(path, "probe") == {"golem": 2}
+    assert cache.get(path, "probe", key="other") is None
+    # modify the file
+    path.write_text("hans!")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert cache.get(path, "probe") is None
+
+
+def test_missing_file(tmp_path):
+    cache = disk_cache.DiskCache(tmp_path / "cache.db")
+    path = tmp_path / "data.txt"
+    cache.set(path, "probe", {"golem": 2})
+    assert cache.get(path, "probe") is None
+
+
+def test_probe_and_config_from_disk(monkeypatch):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    info = meta_tool.probe(path)
+    config = meta_tool.get_rtdc_config(path)
+    # start a new "session"
+    meta_tool.clear_cache()
+
+    def no_file_access(*args, **kwargs):
+        raise AssertionError("File should not be accessed")
+
+    monkeypatch.setattr(meta_tool, "_probe", no_file_access)
+    monkeypatch.setattr(meta_tool, "get_rtdc_meta", no_file_access)
+    assert meta_tool.probe(path) == info
+    config2 = meta_tool.get_rtdc_config(path)
+    assert config2["experiment"]["date"] == config["experiment"]["date"]
+    assert config2["setup"]["flow rate"] == config["setup"]["flow rate"]
+
+    # modifying the file invalidates the cache
+    with h5py.File(path, "a") as h5:
+        h5.attrs["experiment:sample"] = "Peter Pan"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert disk_cache.get_cache().get(path, "probe") is None
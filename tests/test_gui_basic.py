@@ -1,10 +1,15 @@
 """basic tests"""
+import shutil
+import threading
+
 import dclab
 import h5py
 import numpy as np
+import pytest
 from PyQt5.QtWidgets import QFileDialog, QDialog, QMessageBox, QInputDialog
 
 from dckit.main import DCKit
+from dckit import integrity, scanner
 
 
 from helper_methods import retrieve_data
@@ -25,6 +30,82 @@ def test_list_entries(qtbot):
     assert meta["experiment"]["sample"] == "calibration_beads"
 
 
+def test_list_entries_background(qtbot, monkeypatch):
+    monkeypatch.setattr(QMessageBox, "exec_", lambda *args: QMessageBox.Ok)
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path_bad = path.with_name("invalid.rtdc")
+    path_bad.write_text("no hdf5 data")
+    with pytest.warns(UserWarning, match="Could not append dataset"):
+        mw.append_paths([path, path_bad], background=True)
+        qtbot.waitUntil(lambda: mw._scan_thread is None, timeout=10000)
+    assert mw.table_model.rowCount() == 1
+    assert mw.get_path(0) == path
+
+
+def test_list_entries_process_pool(qtbot, monkeypatch):
+    monkeypatch.setattr(scanner, "PROCESS_POOL_THRESHOLD", 1)
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # the second path is probed in a separate process
+    mw.append_paths([path, path])
+    assert mw.table_model.rowCount() == 2
+    for row in range(2):
+        meta = mw.get_metadata(row)
+        assert meta["experiment"]["sample"] == "calibration_beads"
+
+
+def test_list_entries_folder(qtbot, monkeypatch):
+    monkeypatch.setattr(QMessageBox, "exec_", lambda *args: QMessageBox.Ok)
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([path.parent], background=True)
+    qtbot.waitUntil(lambda: mw._scan_thread is None, timeout=10000)
+    assert mw.table_model.rowCount() == 1
+    assert mw.get_path(0) == path
+
+
+def make_run_copies(path, num):
+    """Copy `path` to `num` files with reverse run indices"""
+    folder = path.parent / "runs"
+    folder.mkdir()
+    paths = []
+    for ii in range(num):
+        pp = folder / f"data_{ii:02d}.rtdc"
+        shutil.copy2(path, pp)
+        with h5py.File(pp, "a") as h5:
+            h5.attrs["experiment:run index"] = num - ii
+        paths.append(pp)
+    return paths
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_list_entries_order_folder(qtbot, background):
+    """Folders are added in the order of `meta_tool.find_data`"""
+    paths = make_run_copies(retrieve_data("rtdc_data_hdf5_rtfdc.zip"), 20)
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([paths[0].parent], background=background)
+    qtbot.waitUntil(lambda: mw._scan_thread is None, timeout=20000)
+    assert [mw.get_path(row) for row in range(20)] == paths[::-1]
+
+
+@pytest.mark.parametrize("background", [True, False])
+def test_list_entries_order_list(qtbot, monkeypatch, background):
+    """Explicit lists of files keep their order"""
+    monkeypatch.setattr(scanner, "PROCESS_POOL_THRESHOLD", 10)
+    paths = make_run_copies(retrieve_data("rtdc_data_hdf5_rtfdc.zip"), 20)
+    order = paths[1::2] + paths[::2]
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths(order, background=background)
+    qtbot.waitUntil(lambda: mw._scan_thread is None, timeout=20000)
+    assert [mw.get_path(row) for row in range(20)] == order
+
+
 def test_task_compress(qtbot, monkeypatch):
     path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
     path_out = path.with_name("compressed")
@@ -38,7 +119,7 @@ def test_task_compress(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path])
-    pouts, invalid = mw.on_task_compress()
+    pouts, invalid = mw.on_task_compress().wait()
     assert len(pouts) == 1
     assert len(invalid) == 0
     with dclab.new_dataset(pouts[0]) as ds, dclab.new_dataset(path) as ds0:
@@ -51,6 +132,39 @@ def test_task_compress(qtbot, monkeypatch):
             assert np.all(ds[feat] == ds0[feat])
 
 
+def test_task_compress_metadata_in_worker(qtbot, monkeypatch):
+    """The integrity metadata are not collected in the GUI thread"""
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path_out = path.with_name("compressed")
+    path_out.mkdir()
+    monkeypatch.setattr(QMessageBox, "exec_", lambda *args: QMessageBox.Ok)
+    monkeypatch.setattr(QFileDialog, "getExistingDirectory",
+                        lambda *args: str(path_out))
+    threads = []
+    check_file = integrity.check_file
+
+    def check_file_thread(*args, **kwargs):
+        threads.append(threading.current_thread())
+        return check_file(*args, **kwargs)
+
+    monkeypatch.setattr(integrity, "check_file", check_file_thread)
+
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([path])
+    mw.registry[0].user_metadata["setup"] = {"medium": "CellCarrier"}
+    mw.registry[0].sample = "Peter"
+    pouts, _ = mw.on_task_compress().wait()
+    assert threads
+    assert threading.main_thread() not in threads
+    with dclab.new_dataset(pouts[0]) as ds:
+        assert ds.config["setup"]["medium"] == "CellCarrier"
+        assert ds.config["experiment"]["sample"] == "Peter"
+        for sec, values in mw.get_metadata(0).items():
+            for key, value in values.items():
+                assert ds.config[sec][key] == value
+
+
 def test_task_compress_and_repack_strip_issue19(qtbot, monkeypatch):
     """Same test as above, only tests whether repack and strip logs works"""
     path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
@@ -66,7 +180,7 @@ def test_task_compress_and_repack_strip_issue19(qtbot, monkeypatch):
     qtbot.addWidget(mw)
     mw.append_paths([path])
     mw.checkBox_repack.setChecked(True)
-    pouts, invalid = mw.on_task_compress()
+    pouts, invalid = mw.on_task_compress().wait()
     assert len(pouts) == 1
     assert len(invalid) == 0
     with dclab.new_dataset(pouts[0]) as ds, dclab.new_dataset(path) as ds0:
@@ -91,7 +205,7 @@ def test_task_join(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path, path])
-    mw.on_task_join()
+    mw.on_task_join().wait()
     with dclab.new_dataset(path_out) as ds, dclab.new_dataset(path) as ds0:
         assert len(ds) == 2*len(ds0)
 
@@ -103,8 +217,8 @@ def test_task_metadata_sample(qtbot, monkeypatch):
     qtbot.addWidget(mw)
     path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
     mw.append_paths([path])
-    mw.tableWidget.item(0, 3).setText("Peter Pan")
-    mw.on_task_metadata()
+    mw.table_model.setData(mw.table_model.index(0, 3), "Peter Pan")
+    mw.on_task_metadata().wait()
     with dclab.new_dataset(path) as ds:
         assert ds.config["experiment"]["sample"] == "Peter Pan"
 
@@ -118,13 +232,15 @@ def test_task_split_trace(qtbot, monkeypatch):
     monkeypatch.setattr(QMessageBox, "exec_", lambda *args: QMessageBox.Ok)
     monkeypatch.setattr(QFileDialog, "getExistingDirectory",
                         lambda *args: str(path_out))
+    monkeypatch.setattr(QInputDialog, "getItem",
+                        lambda *args: ["number of events", True])
     monkeypatch.setattr(QInputDialog, "getInt",
                         lambda *args: [3, QMessageBox.Ok])
     # Initialize
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path])
-    paths_split, errors = mw.on_task_split()
+    paths_split, errors = mw.on_task_split().wait()
     assert not errors
     assert len(paths_split) == 1
 
@@ -147,8 +263,8 @@ def test_task_tdms2rtdc(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path])
-    assert mw.tableWidget.rowCount() == 1
-    paths_converted, invalid, errors = mw.on_task_tdms2rtdc()
+    assert mw.table_model.rowCount() == 1
+    paths_converted, invalid, errors = mw.on_task_tdms2rtdc().wait()
     assert len(errors) == 0
     assert len(invalid) == 0
     assert len(paths_converted) == 1
@@ -184,8 +300,8 @@ def test_task_tdms2rtdc_bad_online_contour_no_absdiff(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path])
-    assert mw.tableWidget.rowCount() == 1
-    paths_converted, invalid, errors = mw.on_task_tdms2rtdc()
+    assert mw.table_model.rowCount() == 1
+    paths_converted, invalid, errors = mw.on_task_tdms2rtdc().wait()
     assert len(errors) == 0
     assert len(invalid) == 0
     assert len(paths_converted) == 1
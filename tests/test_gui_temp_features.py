@@ -1,4 +1,6 @@
 from dclab.rtdc_dataset.feat_temp import deregister_all
+import shutil
+
 import h5py
 import numpy as np
 from PyQt5 import QtCore
@@ -22,6 +24,7 @@ def run_around_tests():
     deregister_all()
     settings = QtCore.QSettings()
     settings.remove("included features")
+    settings.remove("worker processes")
 
 
 def test_task_compress_with_scalar_feature(qtbot, monkeypatch):
@@ -45,7 +48,7 @@ def test_task_compress_with_scalar_feature(qtbot, monkeypatch):
 
     # Without any registered temporary features, the "peter" feature
     # will not be available.
-    paths_cmp, _ = mw.on_task_compress()
+    paths_cmp, _ = mw.on_task_compress().wait()
 
     with h5py.File(paths_cmp[0], "r") as h5:
         assert "peter" not in h5["events"]
@@ -56,7 +59,7 @@ def test_task_compress_with_scalar_feature(qtbot, monkeypatch):
     settings.setValue("feature scalar peter", "1")
     paths_cmp[0].unlink()
     register_temporary_features()
-    mw.on_task_compress()
+    mw.on_task_compress().wait()
 
     with h5py.File(paths_cmp[0], "r") as h5:
         assert "peter" in h5["events"]
@@ -85,7 +88,7 @@ def test_task_compress_with_non_scalar_feature(qtbot, monkeypatch):
 
     # Without any registered temporary features, the "hans" feature
     # will not be available.
-    paths_cmp, _ = mw.on_task_compress()
+    paths_cmp, _ = mw.on_task_compress().wait()
 
     with h5py.File(paths_cmp[0], "r") as h5:
         assert "hans" not in h5["events"]
@@ -96,8 +99,50 @@ def test_task_compress_with_non_scalar_feature(qtbot, monkeypatch):
     settings.setValue("feature scalar hans", "0")
     paths_cmp[0].unlink()
     register_temporary_features()
-    mw.on_task_compress()
+    mw.on_task_compress().wait()
 
     with h5py.File(paths_cmp[0], "r") as h5:
         assert "hans" in h5["events"]
         assert np.all(data == h5["events/hans"])
+
+
+def test_task_compress_parallel_with_scalar_feature(qtbot, monkeypatch):
+    """Temporary features must also be registered in worker processes"""
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = path.with_name("second.rtdc")
+    path_out = path.with_name("compressed")
+    path_out.mkdir()
+    # Monkeypatch
+    monkeypatch.setattr(QDialog, "exec_", lambda *args: QMessageBox.Ok)
+    monkeypatch.setattr(QMessageBox, "exec_", lambda *args: QMessageBox.Ok)
+    monkeypatch.setattr(QFileDialog, "getExistingDirectory",
+                        lambda *args: str(path_out))
+
+    # add a temporary feature to the dataset
+    with h5py.File(path, "a") as h5:
+        data = np.linspace(2, 3, len(h5["events/deform"]))
+        h5["events/peter"] = data
+        # make sure the two files are not identical
+        h5.attrs["experiment:run index"] = 1
+    shutil.copy2(path, path2)
+    with h5py.File(path2, "a") as h5:
+        h5.attrs["experiment:run index"] = 2
+
+    settings = QtCore.QSettings()
+    settings.setValue("included features", "peter")
+    settings.setValue("feature scalar peter", "1")
+    settings.setValue("worker processes", "2")
+    register_temporary_features()
+
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([path, path2])
+    paths_cmp, _ = mw.on_task_compress().wait()
+    assert len(paths_cmp) == 2
+
+    for pp in paths_cmp:
+        with h5py.File(pp, "r") as h5:
+            assert "peter" in h5["events"]
+            assert np.all(data == h5["events/peter"])
+            # metadata and logs are written in the worker processes
+            assert "dckit-history" in h5["logs"]
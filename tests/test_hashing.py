@@ -0,0 +1,88 @@
+"""Test cached file hashes"""
+import hashlib
+import os
+
+import pytest
+
+from dckit import disk_cache, hashing
+
+from helper_methods import retrieve_data
+
+
+def test_get_sha256_cached(monkeypatch):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    expected = hashlib.sha256(path.read_bytes()).hexdigest()
+    assert hashing.get_sha256(path) == expected
+
+    def no_hashing(*args, **kwargs):
+        raise AssertionError("File should not be hashed")
+
+    monkeypatch.setattr(hashing, "compute_hash", no_hashing)
+    assert hashing.get_sha256(path) == expected
+
+    # modifying the file invalidates the cache
+    monkeypatch.undo()
+    with path.open("ab") as fd:
+        fd.write(b"peter")
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert hashing.get_sha256(path) == hashlib.sha256(
+        path.read_bytes()).hexdigest()
+
+
+def test_compute_sha256_abort(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashing, "BLOCK_SIZE", 10)
+    path = tmp_path / "data.txt"
+    path.write_text("peter" * 10)
+    calls = []
+    with pytest.raises(hashing.HashingAbortedError):
+        hashing.compute_sha256(path, abort=lambda: calls.append(1) or True)
+    assert len(calls) == 1
+    assert disk_cache.get_cache().get(path, "hash", key="sha256") is None
+
+
+@pytest.mark.parametrize("algorithm", ["sha256", "md5", "blake2b"])
+def test_compute_hash_threaded(tmp_path, monkeypatch, algorithm):
+    # use multiple blocks and a partial last block
+    monkeypatch.setattr(hashing, "BLOCK_SIZE", 1000)
+    path = tmp_path / "data.bin"
+    data = os.urandom(10500)
+    path.write_bytes(data)
+    assert hashing.compute_hash(path, algorithm=algorithm) == hashlib.new(
+        algorithm, data).hexdigest()
+
+
+def test_compute_hash_unknown_algorithm(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text("peter")
+    with pytest.raises(ValueError, match="peter_hash"):
+        hashing.compute_hash(path, algorithm="peter_hash")
+
+
+def test_hash_files_parallel(tmp_path, monkeypatch):
+    monkeypatch.setattr(hashing, "BLOCK_SIZE", 1000)
+    paths = []
+    for ii in range(5):
+        pp = tmp_path / f"data_{ii}.bin"
+        pp.write_bytes(os.urandom(5000 + ii))
+        paths.append(pp)
+    assert hashing.hash_files(paths, num_workers=3) == [
+        hashlib.sha256(pp.read_bytes()).hexdigest() for pp in paths]
+    fps = hashing.hash_files(paths, algorithm=hashing.FAST_ALGORITHM)
+    assert fps == [hashing.get_fingerprint(pp) for pp in paths]
+    assert len(set(fps)) == 5
+    with pytest.raises(FileNotFoundError):
+        hashing.hash_files([tmp_path / "does_not_exist.rtdc"])
+
+
+def test_background_hasher():
+    path1 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = retrieve_data("rtdc_data_traces_video.zip")
+    hasher = hashing.BackgroundHasher()
+    hasher.submit([path1, path2, path2.with_name("does_not_exist.tdms")])
+    hasher.wait()
+    hasher.stop()
+    cache = disk_cache.get_cache()
+    for pp in [path1, path2]:
+        assert cache.get(pp, "hash", key="sha256") == hashlib.sha256(
+            pp.read_bytes()).hexdigest()
@@ -1,5 +1,11 @@
 """Test hdf5 logs history"""
+import json
+import shutil
+
 import dclab
+import h5py
+import numpy as np
+import pytest
 
 from dckit import history
 
@@ -50,6 +56,97 @@ def test_unicode():
         assert "dckit-history" in ds.logs
 
 
+def test_append_only():
+    h5path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    history.append_history(h5path, hdict={"golem": 1})
+    with h5py.File(h5path, "a") as h5:
+        dset = h5["logs"]["dckit-history"]
+        first = dset[1]
+        history.append_history(h5, hdict={"golem": 2, "peter": "hans"})
+        # one compact line per history element
+        assert dset.shape == (4,)
+        assert dset[1] == first
+        assert dset[2] == b',{"golem":2,"peter":"hans"}'
+        assert dset[3] == b"]"
+    assert history.read_history(h5path) == [{"golem": 1},
+                                            {"golem": 2, "peter": "hans"}]
+
+
+def test_old_format_compatibility():
+    h5path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    hlist = [{"peter": "hans"}, {"golem": 2}]
+    # history as written by DCKit 0.17
+    with dclab.RTDCWriter(h5path) as hw:
+        hw.store_log("dckit-history",
+                     json.dumps(hlist, sort_keys=True, indent=2).split("\n"))
+    assert history.read_history(h5path) == hlist
+    # the log is converted once when appending
+    history.append_history(h5path, hdict={"golem": 3})
+    assert history.read_history(h5path) == hlist + [{"golem": 3}]
+    with h5py.File(h5path) as h5:
+        assert h5["logs"]["dckit-history"].shape == (5,)
+
+
+@pytest.mark.parametrize("num_elements", [0, 1, 3])
+def test_readable_by_old_versions(num_elements):
+    """DCKit 0.17 reads the history by joining the lines of the log"""
+    h5path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    h5path2 = h5path.with_name("written.rtdc")
+    shutil.copy2(h5path, h5path2)
+    hlist = [{"golem": ii} for ii in range(num_elements)]
+    # appended
+    for hdict in hlist:
+        history.append_history(h5path, hdict)
+    # written at once
+    history.write_history(h5path2, hlist)
+    for pp in [h5path, h5path2]:
+        with dclab.new_dataset(pp) as ds:
+            if "dckit-history" in ds.logs:
+                # DCKit 0.17 `history.read_history`
+                hlist_old = json.loads("\n".join(ds.logs["dckit-history"]))
+            else:
+                hlist_old = []
+        assert hlist_old == hlist
+        assert history.read_history(pp) == hlist
+
+
+@pytest.mark.parametrize("num_workers", [1, 2])
+def test_history_table(tmp_path, num_workers):
+    path1 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = path1.with_name("other.rtdc")
+    shutil.copy2(path1, path2)
+    history.append_history(path1, {
+        "utc": {"date": "2024-01-02", "time": "03:04:05"},
+        "libraries": {"dclab": "0.60.0", "dckit": "0.17.0"},
+        "task": {"name": "compress HDF5 data"}})
+    history.append_history(path1, {
+        "utc": {"date": "2024-02-03", "time": "04:05:06"},
+        "libraries": {"dclab": "0.62.0"},
+        "task": {"name": "update metadata"}})
+    history.append_history(path2, {"task": {"name": "split"}})
+    path_bad = tmp_path / "invalid.rtdc"
+    path_bad.write_text("no hdf5 data")
+    paths = [path1, path_bad, path2]
+    table = history.history_table(paths, num_workers=num_workers)
+    assert list(table["path"]) == [str(path1), str(path1), str(path_bad),
+                                   str(path2)]
+    assert list(table["index"]) == [0, 1, -1, 0]
+    assert list(table["task"]) == ["compress HDF5 data", "update metadata",
+                                   "", "split"]
+    assert table["timestamp"][1] == np.datetime64("2024-02-03T04:05:06")
+    assert np.isnat(table["timestamp"][3])
+    assert list(table["dckit"]) == ["0.17.0", "", "", ""]
+    assert table["error"][2].count("Traceback")
+    # filtering
+    mask = table["dclab"] == "0.62.0"
+    assert list(table["task"][mask]) == ["update metadata"]
+    # streaming
+    batches = list(history.iter_history_table(paths,
+                                              num_workers=num_workers,
+                                              batch_size=2))
+    assert [len(b["path"]) for b in batches] == [3, 1]
+
+
 if __name__ == "__main__":
     # Run all tests
     _loc = locals()
@@ -0,0 +1,203 @@
+"""Test the Qt-free integrity check"""
+import json
+import os
+import warnings
+
+import dclab
+from dclab.rtdc_dataset import feat_temp
+from dclab.rtdc_dataset.check import ICue, IntegrityChecker
+import h5py
+import pytest
+
+from dckit import integrity, memory_cache
+
+from helper_methods import retrieve_data
+
+
+def no_check(*args, **kwargs):
+    raise AssertionError("Dataset should not be checked")
+
+
+@pytest.fixture
+def new_session():
+    """Forget all integrity checks cached in memory"""
+    def clear():
+        memory_cache.get_cache().clear()
+    clear()
+    yield clear
+    clear()
+    feat_temp.deregister_all()
+
+
+def cue_tuples(cues):
+    return [(cue.level, cue.category, cue.cfg_section, cue.cfg_key, cue.msg)
+            for cue in cues
+            if cue.category != "warning"
+            and cue.msg != "User might want to edit 'medium'"]
+
+
+def reference_check(path, metadata, expand_section):
+    """Full integrity check with dclab"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        with dclab.new_dataset(path) as ds:
+            ds.config.update(metadata)
+            return IntegrityChecker(ds).check(expand_section=expand_section)
+
+
+@pytest.mark.parametrize("metadata", [
+    {},
+    {"setup": {"medium": "CellCarrier", "identifier": "ZMD1"}},
+    {"setup": {"flow rate": -1, "flow rate sample": 0.1,
+               "flow rate sheath": 0.1}},
+    {"imaging": {"roi size x": 11, "roi size y": 12}},
+    {"fluorescence": {"channel count": 5, "samples per event": 3,
+                      "laser count": 2, "channel 2 name": "peter"}},
+    {"online_filter": {"area_um,deform polygon points": [[1, 2], [3, 4]]}},
+])
+@pytest.mark.parametrize("expand_section", [True, False])
+@pytest.mark.parametrize("name", ["rtdc_data_hdf5_rtfdc.zip",
+                                  "rtdc_data_traces_video.zip"])
+def test_metadata_check_equals_full_check(name, metadata, expand_section,
+                                          new_session):
+    path = retrieve_data(name)
+    cues = integrity.check_dataset(path, json.dumps(metadata),
+                                   expand_section)
+    assert cue_tuples(cues) == cue_tuples(
+        reference_check(path, metadata, expand_section))
+
+
+def test_known_checks():
+    """Every check of dclab must be classified (see fail-closed below)"""
+    checks = [name for name in IntegrityChecker.__dict__
+              if name.startswith("check_")]
+    assert sorted(checks) == sorted(integrity.METADATA_CHECKS
+                                    + integrity.FEATURE_CHECKS)
+    assert not set(integrity.METADATA_CHECKS) & set(integrity.FEATURE_CHECKS)
+    assert integrity.get_unknown_checks() == []
+
+
+def test_unknown_check_runs_full_check(monkeypatch, new_session):
+    """Checks unknown to DCKit might depend on the metadata"""
+    def check_peter(self, **kwargs):
+        msg = "Peter: {}".format(self.ds.config["setup"].get("medium"))
+        return [ICue(msg=msg, level="alert", category="metadata wrong",
+                     cfg_section="setup", cfg_key="medium")]
+
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # create the snapshot before dclab "learns" the new check
+    integrity.get_dataset_snapshot(path)
+    monkeypatch.setattr(IntegrityChecker, "check_peter", check_peter,
+                        raising=False)
+    assert integrity.get_unknown_checks() == ["check_peter"]
+    for medium in ["water", "CellCarrier"]:
+        metadata = {"setup": {"medium": medium}}
+        cues = integrity.check_dataset(path, json.dumps(metadata), False)
+        assert "Peter: {}".format(medium) in [cue.msg for cue in cues]
+        assert cue_tuples(cues) == cue_tuples(
+            reference_check(path, metadata, False))
+
+
+def test_snapshot_fallback(monkeypatch, new_session):
+    """Metadata checks that need more than the snapshot still work"""
+    def check_flow_rate(self, **kwargs):
+        # DatasetSnapshot does not have the `h5file` attribute
+        msg = "Peter: {}".format(self.ds.h5file.attrs["setup:medium"])
+        return [ICue(msg=msg, level="alert", category="metadata wrong")]
+
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    monkeypatch.setattr(IntegrityChecker, "check_flow_rate", check_flow_rate)
+    cues = integrity.check_dataset(path, json.dumps({}), False)
+    assert cue_tuples(cues) == cue_tuples(reference_check(path, {}, False))
+    assert [cue.msg for cue in cues if cue.msg.startswith("Peter")]
+
+
+def test_metadata_check_incremental(monkeypatch, new_session):
+    """Editing the metadata must not open the dataset again"""
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    integrity.check_file(path)
+    monkeypatch.setattr(integrity.dclab, "new_dataset", no_check)
+    state, cues, _, user_metadata = integrity.check_file(
+        path, user_metadata={"setup": {"medium": "CellCarrier"}})
+    assert user_metadata["setup"]["medium"] == "CellCarrier"
+    assert "Metadata: Missing key [setup] 'medium'" not in [
+        cue.msg for cue in cues]
+    monkeypatch.undo()
+    metadata = integrity.get_check_metadata(
+        integrity.get_editable_keys(path), user_metadata)
+    assert cue_tuples(cues) == cue_tuples(
+        reference_check(path, metadata, False))
+
+
+def test_check_file_cached_on_disk(monkeypatch, new_session):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    defaults = {"setup": {"medium": "water"}}
+    assert integrity.get_cached_check(path, None, defaults) is None
+    state, cues, editables, user_metadata = integrity.check_file(
+        path, default_metadata=defaults)
+
+    new_session()
+    monkeypatch.setattr(integrity, "_check_dataset", no_check)
+    cached = integrity.get_cached_check(path, None, defaults)
+    assert cached[0] == state
+    assert [cue.msg for cue in cached[1]] == [cue.msg for cue in cues]
+    assert cached[2] == editables
+    assert cached[3] == user_metadata
+    assert integrity.check_file(path, default_metadata=defaults)[0] == state
+    assert integrity.check_dataset(path, "{}", True)
+    # different metadata
+    assert integrity.get_cached_check(path, None, None) is None
+
+
+def test_check_file_cache_invalidated_tdms(monkeypatch, new_session):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    integrity.check_file(path)
+    new_session()
+    monkeypatch.setattr(integrity, "_check_dataset", no_check)
+    assert integrity.get_cached_check(path) is not None
+
+    # unrelated files with the same prefix are ignored
+    path.with_name("M1_notes.txt").write_text("Peter Pan")
+    path.with_name("M1_2016_export.rtdc").write_text("")
+    assert integrity.get_cached_check(path) is not None
+
+    # creating a sidecar file
+    path.with_name("M1_SoftwareSettings.ini").write_text(
+        "[General]\nBuffer_Medium_ID=0\n")
+    assert integrity.get_cached_check(path) is None
+    monkeypatch.undo()
+    integrity.check_file(path)
+    assert integrity.get_cached_check(path) is not None
+
+    # creating parameters.txt
+    path.with_name("parameters.txt").write_text("")
+    assert integrity.get_cached_check(path) is None
+
+
+def test_check_file_cache_invalidated(monkeypatch, new_session):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    integrity.check_file(path)
+    new_session()
+    monkeypatch.setattr(integrity, "_check_dataset", no_check)
+    assert integrity.get_cached_check(path) is not None
+
+    # registering a temporary feature
+    feat_temp.register_temporary_feature("peter_golem")
+    assert integrity.get_cached_check(path) is None
+    feat_temp.deregister_all()
+    assert integrity.get_cached_check(path) is not None
+
+    # .rtdc files do not have companion files
+    path.with_name(path.name.split("_")[0] + "_SoftwareSettings.ini"
+                   ).write_text("Buffer_Medium_ID=0")
+    assert integrity.get_cached_check(path) is not None
+
+    # modifying the dataset
+    monkeypatch.undo()
+    integrity.check_file(path)
+    assert integrity.get_cached_check(path) is not None
+    with h5py.File(path, "a") as h5:
+        h5.attrs["experiment:sample"] = "Peter Pan"
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    assert integrity.get_cached_check(path) is None
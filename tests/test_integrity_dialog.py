@@ -1,3 +1,4 @@
+import copy
 import pathlib
 
 import dclab
@@ -5,6 +6,7 @@ import h5py
 import pytest
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
+from dckit import integrity
 from dckit.main import DCKit
 from dckit.dlg_icheck import IntegrityCheckDialog
 from dckit.meta_tool import MetadataEditedWarning
@@ -49,7 +51,7 @@ def test_integrity_shapein_issue3(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([h5path_m])
-    assert mw.tableWidget.rowCount() == 1, "sanity check"
+    assert mw.table_model.rowCount() == 1, "sanity check"
     # Now edit the medium (create dialog manually)
     with pytest.warns(MetadataEditedWarning):
         dlg = IntegrityCheckDialog(mw, h5path_m)
@@ -68,7 +70,7 @@ def test_integrity_shapein_issue3(qtbot, monkeypatch):
     assert wid2.currentText() == "CellCarrier"
 
     # 3. Compress and check (just to be sure)
-    paths_compressed, invalid = mw.on_task_compress()
+    paths_compressed, invalid = mw.on_task_compress().wait()
     assert len(invalid) == 0
     assert len(paths_compressed) == 1
     with dclab.new_dataset(paths_compressed[0]) as ds:
@@ -101,7 +103,7 @@ def test_integrity_shapein_issue3_control(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([h5path_m])
-    assert mw.tableWidget.rowCount() == 1, "sanity check"
+    assert mw.table_model.rowCount() == 1, "sanity check"
     # Now edit the medium (create dialog manually)
     dlg = IntegrityCheckDialog(mw, h5path_m)
     assert dlg.get_metadata_value("setup", "medium") == "CellCarrierB"
@@ -114,7 +116,7 @@ def test_integrity_shapein_issue3_control(qtbot, monkeypatch):
     assert dlg2.get_metadata_value("setup", "medium") == "CellCarrierB"
 
     # 2. Compress and check (just to be sure)
-    paths_compressed, invalid = mw.on_task_compress()
+    paths_compressed, invalid = mw.on_task_compress().wait()
     assert len(invalid) == 0
     assert len(paths_compressed) == 1
     with dclab.new_dataset(paths_compressed[0]) as ds:
@@ -143,7 +145,7 @@ def test_integrity_shapein_issue3_control_2(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([h5path_m])
-    assert mw.tableWidget.rowCount() == 1, "sanity check"
+    assert mw.table_model.rowCount() == 1, "sanity check"
     # Now edit the medium (create dialog manually)
     dlg = IntegrityCheckDialog(mw, h5path_m)
     assert dlg.get_metadata_value("setup", "medium") == "CellCarrierB"
@@ -156,7 +158,7 @@ def test_integrity_shapein_issue3_control_2(qtbot, monkeypatch):
     assert dlg2.get_metadata_value("setup", "medium") == "CellCarrierB"
 
     # 2. Compress and check (just to be sure)
-    paths_compressed, invalid = mw.on_task_compress()
+    paths_compressed, invalid = mw.on_task_compress().wait()
     assert len(invalid) == 0
     assert len(paths_compressed) == 1
     with dclab.new_dataset(paths_compressed[0]) as ds:
@@ -178,7 +180,7 @@ def test_integrity_with_medium(qtbot, monkeypatch):
     mw = DCKit()
     qtbot.addWidget(mw)
     mw.append_paths([path])
-    assert mw.tableWidget.rowCount() == 1, "sanity check"
+    assert mw.table_model.rowCount() == 1, "sanity check"
     # Now edit the medium (create dialog manually)
     dlg = IntegrityCheckDialog(mw, path)
     assert dlg.get_metadata_value("setup", "medium") is None
@@ -200,7 +202,7 @@ def test_integrity_with_medium(qtbot, monkeypatch):
     assert wid2.currentText() == "CellCarrier"
 
     # 3. Convert and check
-    paths_converted, invalid, errors = mw.on_task_tdms2rtdc()
+    paths_converted, invalid, errors = mw.on_task_tdms2rtdc().wait()
     assert len(errors) == 0
     assert len(invalid) == 0
     assert len(paths_converted) == 1
@@ -279,7 +281,7 @@ def test_online_contour_no_absdiff(qtbot, monkeypatch, with_online_contour):
     assert wid2.currentData()
 
     # 3. Convert and check
-    paths_converted, invalid, errors = mw.on_task_tdms2rtdc()
+    paths_converted, invalid, errors = mw.on_task_tdms2rtdc().wait()
     assert len(errors) == 0
     assert len(invalid) == 0
     assert len(paths_converted) == 1
@@ -329,3 +331,65 @@ def test_online_contour_no_absdiff_remove(qtbot, monkeypatch,
     # 2. Make sure the combobox is set correctly
     wid3 = dlg3.user_widgets["online_contour"]["no absdiff"]
     assert wid3.currentData() == "no selection"
+
+
+def test_integrity_all_headless(qtbot, monkeypatch):
+    """Checking all datasets must not create any dialogs"""
+    path1 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = retrieve_data("rtdc_data_traces_video.zip")
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([path1, path2])
+    IntegrityCheckDialog.default_metadata["setup"] = {"medium": "water"}
+    try:
+        # reference: confirm the dialog without any edits
+        dlg = IntegrityCheckDialog(mw, path2)
+        dlg.done(True)
+        ref_state = dlg.state
+        ref_metadata = copy.deepcopy(
+            IntegrityCheckDialog.user_metadata[path2])
+        IntegrityCheckDialog.user_metadata.pop(path2)
+        IntegrityCheckDialog.editable_metadata.pop(path2)
+
+        def no_dialog(*args, **kwargs):
+            raise AssertionError("No dialog should be created")
+
+        monkeypatch.setattr(IntegrityCheckDialog, "__init__", no_dialog)
+        job = mw.on_task_integrity_all()
+        states = job.wait()
+    finally:
+        IntegrityCheckDialog.default_metadata.clear()
+    rec1 = mw.registry.get_by_path(path1)
+    rec2 = mw.registry.get_by_path(path2)
+    assert states[rec2.dckit_id] == ref_state
+    assert rec2.integrity == ref_state
+    assert rec1.integrity == states[rec1.dckit_id]
+    assert rec1.integrity in ["passed", "tolerable", "failed"]
+    assert IntegrityCheckDialog.user_metadata[path2] == ref_metadata
+    assert ref_metadata["setup"]["medium"] == "water"
+    assert "medium" in IntegrityCheckDialog.editable_metadata[path2]["setup"]
+    # the metadata for the tasks are available without a dialog
+    assert IntegrityCheckDialog.metadata_from_path(path2)["setup"][
+        "medium"] == "water"
+
+
+def test_integrity_prefilled_from_cache(qtbot, monkeypatch):
+    """Datasets that were checked before show their state when added"""
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    mw = DCKit()
+    qtbot.addWidget(mw)
+    mw.append_paths([path])
+    assert mw.registry[0].integrity == "unchecked"
+    states = mw.on_task_integrity_all().wait()
+    # start a new "session"
+    mw.on_action_clear_measurements()
+    IntegrityCheckDialog.user_metadata.pop(path)
+    IntegrityCheckDialog.editable_metadata.pop(path)
+
+    def no_check(*args, **kwargs):
+        raise AssertionError("Dataset should not be checked")
+
+    monkeypatch.setattr(integrity, "_check_dataset", no_check)
+    mw.append_paths([path])
+    assert mw.registry[0].integrity == states[0]
+    assert path in IntegrityCheckDialog.editable_metadata
@@ -0,0 +1,97 @@
+import shutil
+import threading
+
+from dckit import jobs, tasks
+from dckit.main import join_task
+
+from helper_methods import retrieve_data
+
+
+def slow_task(inputs, progress=None, control=None, event=None):
+    """Task that waits for `event` before processing each file"""
+    def func(item):
+        event.wait(5)
+        return tasks.TaskResult(path=item.path, status="success")
+    return tasks._run_per_file(func, inputs, progress, control=control)
+
+
+def test_job_queue_cancel(qtbot):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    event = threading.Event()
+    queue = jobs.JobQueue()
+    inputs = [tasks.TaskInput(path=path) for _ in range(3)]
+    job1 = queue.submit(jobs.Job("job 1", slow_task, inputs, event=event))
+    job2 = queue.submit(jobs.Job("job 2", slow_task, inputs, event=event))
+    assert job1.state == "running"
+    assert job2.state == "queued"
+    queue.cancel_all()
+    event.set()
+    job1.wait()
+    assert job2.state == "done"
+    assert [r.status for r in job2.results] == ["cancelled"] * 3
+    # at most the first file of the first job was processed
+    assert job1.results[1].status == "cancelled"
+    assert job1.results[2].status == "cancelled"
+    queue.shutdown()
+
+
+def test_job_queue_progress(qtbot):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    queue = jobs.JobQueue()
+    panel = jobs.JobPanel(queue)
+    qtbot.addWidget(panel)
+    event = threading.Event()
+    event.set()
+    inputs = [tasks.TaskInput(path=path) for _ in range(2)]
+    job = jobs.Job("job", slow_task, inputs,
+                   on_done=lambda results: len(results),
+                   event=event)
+    with qtbot.waitSignal(queue.job_finished, timeout=5000):
+        queue.submit(job)
+    assert job.wait() == 2
+    assert panel.progressBar.value() == 2
+    assert panel.label.text().startswith("job: 2/2 files")
+    assert panel.isHidden()
+
+
+def test_job_queue_progress_join(qtbot, tmp_path):
+    """The joined output file accounts for the bytes of all inputs"""
+    path1 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = path1.with_name("other.rtdc")
+    shutil.copy2(path1, path2)
+    queue = jobs.JobQueue()
+    progress = []
+    queue.job_progress.connect(
+        lambda job, done, total, nbytes: progress.append(
+            (done, total, nbytes)))
+    inputs = [tasks.TaskInput(path=path1), tasks.TaskInput(path=path2)]
+    job = jobs.Job("join", join_task, inputs,
+                   path_out=tmp_path / "joined.rtdc",
+                   sample="peter")
+    with qtbot.waitSignal(queue.job_finished, timeout=20000):
+        queue.submit(job)
+    assert job.results[0].status == "success"
+    assert progress == [(2, 2, 2 * path1.stat().st_size)]
+    queue.shutdown()
+
+
+def test_task_control_pause():
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    control = tasks.TaskControl()
+    control.pause()
+    processed = []
+
+    def func(item):
+        processed.append(item)
+        return tasks.TaskResult(path=item.path, status="success")
+
+    thread = threading.Thread(
+        target=tasks._run_per_file,
+        args=(func, [tasks.TaskInput(path=path)], None),
+        kwargs={"control": control})
+    thread.start()
+    thread.join(.3)
+    assert not processed, "task is paused"
+    control.resume()
+    thread.join(5)
+    assert len(processed) == 1
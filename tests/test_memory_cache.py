@@ -0,0 +1,106 @@
+"""Test fingerprint-keyed in-memory cache"""
+import os
+
+import h5py
+from dclab.rtdc_dataset import feat_temp
+
+from dckit import integrity, memory_cache, meta_tool
+
+from helper_methods import retrieve_data
+
+
+def touch(path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+
+
+def test_entries_are_invalidated(tmp_path):
+    cache = memory_cache.MemoryCache()
+    path1 = tmp_path / "data1.txt"
+    path1.write_text("peter")
+    path2 = tmp_path / "data2.txt"
+    path2.write_text("pan")
+    cache.set("probe", path1, {"golem": 1})
+    cache.set("probe", path2, {"golem": 2})
+    cache.set("config", path1, {"golem": 3}, args=("hans",))
+    assert cache.get("probe", path1) == {"golem": 1}
+    assert cache.get("config", path1) is None
+    assert cache.get("config", path1, args=("hans",)) == {"golem": 3}
+    info = cache.info("probe")
+    assert info.hits == 1
+    assert info.misses == 0
+    assert info.size == 2
+
+    # modifying a file only invalidates its own entries
+    touch(path1)
+    assert cache.get("probe", path1) is None
+    assert cache.get("probe", path2) == {"golem": 2}
+    assert cache.info("probe").invalidations == 1
+
+    # explicit invalidation
+    cache.set("probe", path1, {"golem": 1})
+    cache.invalidate(path1)
+    assert cache.get("probe", path1) is None
+    assert cache.get("config", path1, args=("hans",)) is None
+    assert cache.get("probe", path2) == {"golem": 2}
+    assert cache.info() == {
+        "probe": memory_cache.CacheInfo(hits=3, misses=2, invalidations=2,
+                                        size=1, maxsize=1000),
+        "config": memory_cache.CacheInfo(hits=1, misses=2, invalidations=1,
+                                         size=0, maxsize=1000),
+    }
+
+
+def test_maxsize(tmp_path):
+    cache = memory_cache.MemoryCache()
+    cache.set_maxsize("probe", 2)
+    paths = []
+    for ii in range(3):
+        pp = tmp_path / f"data{ii}.txt"
+        pp.write_text("peter")
+        paths.append(pp)
+    cache.set("probe", paths[0], 0)
+    cache.set("probe", paths[1], 1)
+    # the first entry is used most recently
+    assert cache.get("probe", paths[0]) == 0
+    cache.set("probe", paths[2], 2)
+    assert cache.get("probe", paths[1]) is None
+    assert cache.get("probe", paths[0]) == 0
+    assert cache.get("probe", paths[2]) == 2
+    assert cache.info("probe").size == 2
+
+
+def test_external_modification_detected():
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    assert meta_tool.get_rtdc_config(path)["experiment"]["sample"] != "Pan"
+    info = meta_tool._get_rtdc_meta.cache_info()
+    meta_tool.get_rtdc_config(path)
+    assert meta_tool._get_rtdc_config.cache_info().hits >= 1
+    # modify the file behind DCKit's back
+    with h5py.File(path, "a") as h5:
+        h5.attrs["experiment:sample"] = "Pan"
+    touch(path)
+    assert meta_tool.get_rtdc_config(path)["experiment"]["sample"] == "Pan"
+    assert meta_tool._get_rtdc_meta.cache_info().misses == info.misses + 1
+
+
+def test_temporary_features_do_not_clear_cache(monkeypatch):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    cues = integrity.check_dataset(path, "{}", False)
+    try:
+        feat_temp.register_temporary_feature("peter_golem")
+        cues_temp = integrity.check_dataset(path, "{}", False)
+    finally:
+        feat_temp.deregister_all()
+
+    def no_check(*args, **kwargs):
+        raise AssertionError("Dataset should not be checked")
+
+    monkeypatch.setattr(integrity.disk_cache, "get_cache", no_check)
+    # both results are still in the memory cache
+    assert integrity.check_dataset(path, "{}", False) is cues
+    try:
+        feat_temp.register_temporary_feature("peter_golem")
+        assert integrity.check_dataset(path, "{}", False) is cues_temp
+    finally:
+        feat_temp.deregister_all()
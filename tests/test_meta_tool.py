@@ -0,0 +1,137 @@
+"""Test metadata retrieval"""
+import dclab
+import h5py
+import nptdms
+
+from dckit import memory_cache, meta_tool, sidecar
+
+from helper_methods import retrieve_data
+
+
+def test_probe_rtdc():
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    info = meta_tool.probe(path)
+    with h5py.File(path, "r") as h5:
+        assert info.sample == h5.attrs["experiment:sample"]
+        assert info.run_index == h5.attrs["experiment:run index"]
+        assert info.event_count == h5.attrs["experiment:event count"]
+        assert info.flow_rate == h5.attrs["setup:flow rate"]
+        assert info.chip_region == h5.attrs["setup:chip region"]
+        assert info.date == h5.attrs["experiment:date"]
+    # getters are served from the probe
+    assert meta_tool.get_sample_name(path) == info.sample
+    assert meta_tool.get_run_index(str(path)) == info.run_index
+    assert meta_tool.get_event_count(path) == info.event_count
+    assert meta_tool.get_flow_rate(path) == info.flow_rate
+    assert meta_tool.get_chip_region(path) == info.chip_region
+    assert meta_tool.get_date(path) == info.date
+
+
+def test_probe_tdms():
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    info = meta_tool.probe(path)
+    assert info.run_index == 1
+    assert info.chip_region == "channel"
+    assert info.date is None
+    with dclab.new_dataset(path) as ds:
+        assert info.flow_rate == ds.config["setup"]["flow rate"]
+        assert meta_tool.get_event_count(path) == len(ds)
+        # date is taken from the full configuration
+        assert meta_tool.get_date(path) == ds.config["experiment"]["date"]
+
+
+def test_find_data(tmp_path):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # create a directory tree with measurements with different run index
+    for name, run_index in [["a/x1.rtdc", 3],
+                            ["a/x2.rtdc", 1],
+                            ["a/x3.rtdc", 2],
+                            ["a/b/c/x4.rtdc", 1],
+                            ["d/x5.rtdc", 1],
+                            ]:
+        pp = tmp_path / name
+        pp.parent.mkdir(parents=True, exist_ok=True)
+        pp.write_bytes(path.read_bytes())
+        with h5py.File(pp, "a") as h5:
+            h5.attrs["experiment:run index"] = run_index
+    (tmp_path / "d" / "M1_data_traces.tdms").write_text("not data")
+    files = meta_tool.find_data(tmp_path)
+    assert [ff.name for ff in files] == [
+        "x2.rtdc", "x3.rtdc", "x1.rtdc", "x4.rtdc", "x5.rtdc"]
+    # depth limit
+    files = meta_tool.find_data(tmp_path, max_depth=1)
+    assert [ff.name for ff in files] == [
+        "x2.rtdc", "x3.rtdc", "x1.rtdc", "x5.rtdc"]
+    # ignore patterns
+    files = meta_tool.find_data(tmp_path, ignore=["c", "x3.*", "d"])
+    assert [ff.name for ff in files] == ["x2.rtdc", "x1.rtdc"]
+
+
+def test_tdms_event_count(monkeypatch):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    assert meta_tool.get_tdms_event_count(path) == 44
+
+    def no_file_access(*args, **kwargs):
+        raise AssertionError("File should not be accessed")
+
+    # the event count is taken from the disk cache
+    monkeypatch.setattr(nptdms.TdmsFile, "read_metadata", no_file_access)
+    assert meta_tool.get_tdms_event_count(path) == 44
+
+
+def test_sidecar_cached_and_invalidated():
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    sc1 = sidecar.get_sidecar(path)
+    assert sc1["para"]["general"]["flow rate [ul/s]"] == 0.16
+    assert sc1["events"] is None
+    assert sc1["software settings"] is None
+    # parsed only once
+    assert sidecar.get_sidecar(path) is sc1
+    # adding a companion file invalidates the cache
+    path.with_name("M1_log.ini").write_text("[EVENT LOG]\nEvents: 12\n")
+    sc2 = sidecar.get_sidecar(path)
+    assert sc2["fingerprint"] != sc1["fingerprint"]
+    assert sc2["events"] == 12
+    # the probe uses the new companion files
+    assert meta_tool.probe(path).event_count == 12
+    # stored in the memory cache
+    cache = memory_cache.get_cache()
+    assert cache.info("sidecar").size >= 1
+    assert cache.info("sidecar").maxsize == 10000
+    memory_cache.invalidate(path)
+    assert sidecar.get_sidecar(path) is not sc2
+
+
+def test_config_invalidated_by_companion_files():
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    assert meta_tool.get_rtdc_config(path)["setup"]["flow rate"] == 0.16
+    assert meta_tool.probe(path).flow_rate == 0.16
+    para = path.with_name("M1_para.ini")
+    para.write_text(para.read_text().replace("0.16", "0.32"))
+    assert meta_tool.get_rtdc_config(path)["setup"]["flow rate"] == 0.32
+    assert meta_tool.probe(path).flow_rate == 0.32
+    # also in a new session (disk cache)
+    meta_tool.clear_cache()
+    assert meta_tool.get_rtdc_config(path)["setup"]["flow rate"] == 0.32
+    assert meta_tool.probe(path).flow_rate == 0.32
+
+
+def test_sidecar_sample_name(monkeypatch):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    para = path.with_name("M1_para.ini")
+    para.write_text(para.read_text().replace(
+        "[General]\n", "[General]\nSample Name = Peter Pan\n"))
+    opened = []
+    open_orig = sidecar.pathlib.Path.open
+
+    def open_count(self, *args, **kwargs):
+        opened.append(self.name)
+        return open_orig(self, *args, **kwargs)
+
+    monkeypatch.setattr(sidecar.pathlib.Path, "open", open_count)
+    assert sidecar.get_sidecar(path)["sample"] == "Peter Pan"
+    # Mx_para.ini is read only once
+    assert opened.count("M1_para.ini") == 1
+    monkeypatch.undo()
+    para.write_text(para.read_text().replace("Peter Pan", "12"))
+    assert sidecar.get_sidecar(path)["sample"] == "12"
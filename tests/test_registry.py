@@ -0,0 +1,46 @@
+import pathlib
+
+from dckit import meta_tool, registry
+
+
+def make_info(sample="beads"):
+    return meta_tool.ProbeInfo(sample=sample,
+                               run_index=1,
+                               event_count=100,
+                               flow_rate=0.04,
+                               chip_region="channel",
+                               date="2023-01-01")
+
+
+def test_lookup():
+    reg = registry.DatasetRegistry()
+    recs = reg.add_many([(f"/data/M{ii}_data.rtdc", make_info())
+                         for ii in range(1000)])
+    assert len(reg) == 1000
+    assert recs[10] is reg[10]
+    assert reg[500].dckit_id == 500
+    rec = reg.get_by_path(pathlib.Path("/data/M734_data.rtdc"))
+    assert rec.dckit_id == 734
+    assert reg.get_by_path("/data/M1234_data.rtdc") is None
+    reg.clear()
+    assert len(reg) == 0
+    assert reg.get_by_path("/data/M734_data.rtdc") is None
+
+
+def test_record_sample():
+    reg = registry.DatasetRegistry()
+    rec = reg.add("/data/M1_data.rtdc", make_info())
+    rec.sample = "Peter Pan"
+    assert rec.info.sample == "Peter Pan"
+    assert rec.info.run_index == 1
+
+
+def test_user_metadata_shared():
+    shared = {}
+    reg = registry.DatasetRegistry(user_metadata=shared)
+    rec = reg.add("/data/M1_data.rtdc", make_info())
+    rec.user_metadata["setup"] = {"medium": "water"}
+    assert shared[rec.path]["setup"]["medium"] == "water"
+    reg.reset_user_metadata(rec.path)
+    assert rec.path not in shared
+    assert rec.user_metadata == {}
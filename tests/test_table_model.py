@@ -0,0 +1,36 @@
+import pathlib
+
+from dckit import meta_tool, table_model
+
+from helper_methods import retrieve_data
+
+
+def test_append_many_rows(qtbot):
+    model = table_model.DatasetTableModel()
+    info = meta_tool.ProbeInfo(sample="beads",
+                               run_index=1,
+                               event_count=100,
+                               flow_rate=0.04,
+                               chip_region="channel",
+                               date="2023-01-01")
+    rows = [(pathlib.Path(f"/data/M{ii}_data.rtdc"), info)
+            for ii in range(100000)]
+    model.append_rows(rows)
+    assert model.rowCount() == 100000
+    assert model.get_path(54321).name == "M54321_data.rtdc"
+    index = model.index(12, table_model.COLUMN_INDEX["flow rate"])
+    assert model.data(index) == "0.04000"
+    model.clear()
+    assert model.rowCount() == 0
+
+
+def test_reset_sample_name(qtbot):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    model = table_model.DatasetTableModel()
+    model.append_rows([(path, meta_tool.probe(path))])
+    index = model.index(0, table_model.COLUMN_INDEX["sample"])
+    assert model.setData(index, "Peter Pan")
+    assert model.get_sample(0) == "Peter Pan"
+    # empty sample names are reset
+    assert model.setData(index, "")
+    assert model.get_sample(0) == "calibration_beads"
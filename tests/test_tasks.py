@@ -0,0 +1,292 @@
+import hashlib
+
+import dclab
+import h5py
+import numpy as np
+import pytest
+
+from dckit import history, tasks
+
+from helper_methods import retrieve_data
+
+
+def test_compress(tmp_path):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    inputs = [tasks.TaskInput(path=path,
+                              metadata={"experiment": {"sample": "Peter"}})]
+    progress = []
+    results = tasks.compress(inputs,
+                             path_out=tmp_path,
+                             progress=lambda *args: progress.append(args))
+    assert len(results) == 1
+    res = results[0]
+    assert res.status == "success"
+    assert res.path == path
+    assert len(progress) == 1
+    assert progress[0][:2] == (1, 1)
+    with dclab.new_dataset(res.paths_out[0]) as ds:
+        assert ds.config["experiment"]["sample"] == "Peter"
+    hist = history.read_history(res.paths_out[0])
+    assert hist[0]["task"]["name"] == "compress HDF5 data"
+    assert hist[1]["task"]["name"] == "update metadata"
+
+
+def test_compress_checksum_manifest(tmp_path):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # existing entries of other files are kept
+    (tmp_path / "SHA256SUMS").write_text("abc  other.rtdc\n")
+    res, = tasks.compress([tasks.TaskInput(path=path)],
+                          path_out=tmp_path,
+                          checksums=True)
+    path_out = res.paths_out[0]
+    digest = hashlib.sha256(path_out.read_bytes()).hexdigest()
+    assert res.checksums == {str(path_out): digest}
+    assert tasks.read_checksum_manifest(tmp_path / "SHA256SUMS") == {
+        "other.rtdc": "abc",
+        path_out.name: digest}
+
+
+@pytest.mark.parametrize("repack", [False, True])
+def test_tdms2rtdc_checksum_manifest_logs(tmp_path, repack):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    res, = tasks.tdms2rtdc([tasks.TaskInput(path=path)],
+                           path_out=tmp_path,
+                           checksums=True,
+                           repack=repack)
+    plog, = tmp_path.glob("*warnings.log")
+    # the warning logs are not output datasets
+    assert plog not in res.paths_out
+    sums = tasks.read_checksum_manifest(tmp_path / "SHA256SUMS")
+    assert sorted(sums) == sorted([res.paths_out[0].name, plog.name])
+    assert sums[plog.name] == hashlib.sha256(plog.read_bytes()).hexdigest()
+
+
+def test_compress_repack_single_pass(tmp_path, monkeypatch):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # the output file must not be written a second time
+    monkeypatch.setattr(tasks, "repack_file", None)
+    inputs = [tasks.TaskInput(path=path,
+                              metadata={"experiment": {"sample": "Peter"}})]
+    res, = tasks.compress(inputs, path_out=tmp_path, repack=True)
+    assert res.status == "success"
+    assert sorted(tmp_path.glob("*.rtdc*")) == res.paths_out
+    with dclab.new_dataset(res.paths_out[0]) as ds, \
+            dclab.new_dataset(path) as ds0:
+        assert len(ds.logs) == 0
+        assert ds.config["experiment"]["sample"] == "Peter"
+        assert len(ds) == len(ds0)
+        for feat in ds0.features_scalar:
+            assert np.all(ds[feat] == ds0[feat])
+
+
+def test_tdms2rtdc_repack_single_pass(tmp_path):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    inputs = [tasks.TaskInput(path=path,
+                              metadata={"experiment": {"sample": "Peter"}})]
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    res, = tasks.tdms2rtdc(inputs, path_out=tmp_path / "a", repack=True)
+    assert res.status == "success"
+    # same data as the regular conversion
+    res0, = tasks.tdms2rtdc(inputs, path_out=tmp_path / "b")
+    with dclab.new_dataset(res.paths_out[0]) as ds, \
+            dclab.new_dataset(res0.paths_out[0]) as ds0:
+        assert len(ds.logs) == 0
+        assert ds.config["experiment"]["sample"] == "Peter"
+        assert len(ds) == len(ds0)
+        assert np.all(ds["deform"] == ds0["deform"])
+
+
+@pytest.mark.parametrize("name,task", [
+    ("rtdc_data_hdf5_rtfdc.zip", tasks.compress),
+    ("rtdc_data_traces_video.zip", tasks.tdms2rtdc)])
+def test_repack_single_pass_metadata(tmp_path, name, task):
+    """Single-pass and two-pass repacking write the same metadata"""
+    path = retrieve_data(name)
+    inputs = [tasks.TaskInput(path=path,
+                              metadata={"experiment": {"sample": "Peter"}})]
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+    res, = task(inputs, path_out=tmp_path / "a", repack=True)
+    # two passes (repacking after writing the output file)
+    res0, = task(inputs, path_out=tmp_path / "b")
+    tasks.repack_file(res0.paths_out[0])
+    with h5py.File(res.paths_out[0]) as h5, \
+            h5py.File(res0.paths_out[0]) as h50:
+        attrs = dict(h5.attrs)
+        attrs0 = dict(h50.attrs)
+        # random for .tdms files
+        attrs.pop("experiment:run identifier", None)
+        attrs0.pop("experiment:run identifier", None)
+        assert attrs == attrs0
+        assert h5.attrs["setup:software version"].count(
+            f"dclab {dclab.__version__}") == 1
+
+
+def test_compress_ignore_tdms(tmp_path):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    results = tasks.compress([tasks.TaskInput(path=path)], path_out=tmp_path)
+    assert results[0].status == "ignored"
+    assert not results[0].paths_out
+
+
+def test_finalize_output_single_session(tmp_path, monkeypatch):
+    path_in = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path = tmp_path / "out.rtdc"
+    dclab.cli.compress(path_in=path_in, path_out=path)
+    opened = []
+
+    class CountingFile(h5py.File):
+        def __init__(self, name, *args, **kwargs):
+            opened.append(name)
+            super(CountingFile, self).__init__(name, *args, **kwargs)
+
+    monkeypatch.setattr(h5py, "File", CountingFile)
+    tasks.finalize_output(path,
+                          task_dict={"name": "test"},
+                          metadata={"experiment": {"sample": "Peter"}})
+    monkeypatch.undo()
+    assert len(opened) == 1
+    with h5py.File(path) as h5:
+        assert h5.attrs["experiment:sample"] == b"Peter"
+    hist = history.read_history(path)
+    assert [h["task"]["name"] for h in hist] == ["test", "update metadata"]
+
+
+def test_split_error(tmp_path):
+    path = tmp_path / "invalid.rtdc"
+    path.write_text("no hdf5 data")
+    results = tasks.split([tasks.TaskInput(path=path)],
+                          path_out=tmp_path,
+                          split_events=3)
+    assert results[0].status == "error"
+    assert results[0].message.count("Traceback")
+
+
+def test_update_metadata():
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    item = tasks.TaskInput(path=path,
+                           metadata={"experiment": {"sample": "Peter"}})
+    res1, = tasks.update_metadata([item])
+    assert res1.status == "success"
+    with h5py.File(path) as h5:
+        assert h5.attrs["experiment:sample"] == b"Peter"
+    # nothing to do
+    res2, = tasks.update_metadata([item])
+    assert res2.status == "unchanged"
+
+
+def test_tdms2rtdc_parallel(tmp_path):
+    path1 = retrieve_data("rtdc_data_traces_video.zip")
+    path2 = retrieve_data("rtdc_data_traces_video.zip")
+    path_bad = path2.with_name("M2_data.tdms")
+    path_bad.write_text("no tdms data")
+    inputs = [
+        tasks.TaskInput(path=path1,
+                        metadata={"experiment": {"sample": "one"}}),
+        tasks.TaskInput(path=path_bad),
+        tasks.TaskInput(path=path2,
+                        metadata={"experiment": {"sample": "two"}}),
+    ]
+    results = tasks.tdms2rtdc(inputs, path_out=tmp_path, num_workers=3)
+    assert [r.status for r in results] == ["success", "error", "success"]
+    # the broken file does not leave any output behind
+    assert sorted(tmp_path.glob("*.rtdc")) == sorted(
+        results[0].paths_out + results[2].paths_out)
+    with dclab.new_dataset(results[2].paths_out[0]) as ds:
+        assert ds.config["experiment"]["sample"] == "two"
+
+
+def test_tdms2rtdc_workers_memory_limit(monkeypatch):
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    inputs = [tasks.TaskInput(path=path)] * 8
+    overhead = tasks.TDMS2RTDC_MEMORY_OVERHEAD
+    monkeypatch.setattr(tasks, "get_available_memory",
+                        lambda: 3.5 * overhead)
+    assert tasks.get_tdms2rtdc_workers(inputs, num_workers=8) == 3
+    monkeypatch.setattr(tasks, "get_available_memory", lambda: 0)
+    assert tasks.get_tdms2rtdc_workers(inputs, num_workers=8) == 1
+    monkeypatch.setattr(tasks, "get_available_memory", lambda: None)
+    assert tasks.get_tdms2rtdc_workers(inputs, num_workers=8) == 8
+
+
+def test_split_slices_size_and_time():
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    # 7 events, ~30kB per event
+    size_mb = path.stat().st_size / 7 * 3.5 / 1024**2
+    assert tasks.get_split_slices(path, split_size=size_mb) == [
+        (0, 3), (3, 6), (6, 7)]
+    # time: [0.208, 0.336, 0.347, 0.493, 0.496, 0.601, 0.676]
+    assert tasks.get_split_slices(path, split_time=0.1) == [
+        (0, 1), (1, 3), (3, 5), (5, 6), (6, 7)]
+    assert tasks.get_split_slices(path, split_events=5) == [(0, 5), (5, 7)]
+
+
+@pytest.mark.parametrize("kwargs", [{"split_events": 5},
+                                    {"split_size": 1.0},
+                                    {"split_time": 0.1}])
+def test_split_empty_dataset(tmp_path, kwargs):
+    path = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    with h5py.File(path, "a") as h5:
+        for feat in list(h5["events"]):
+            del h5["events"][feat]
+        for feat in ["deform", "time"]:
+            h5["events"].create_dataset(feat, data=np.zeros(0))
+        h5.attrs["experiment:event count"] = 0
+    assert tasks.get_split_slices(path, **kwargs) == []
+    results = tasks.split([tasks.TaskInput(path=path)], path_out=tmp_path,
+                          num_workers=1, **kwargs)
+    assert results[0].status == "unchanged"
+    assert not list(tmp_path.glob("*.rtdc"))
+
+
+def test_split_time_parallel(tmp_path):
+    path1 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = retrieve_data("rtdc_data_hdf5_rtfdc.zip")
+    path2 = path2.rename(path2.with_name("other.rtdc"))
+    progress = []
+    results = tasks.split([tasks.TaskInput(path=path1),
+                           tasks.TaskInput(path=path2)],
+                          path_out=tmp_path,
+                          split_time=0.2,
+                          repack=True,
+                          checksums=True,
+                          num_workers=2,
+                          progress=lambda *args: progress.append(args))
+    assert [r.status for r in results] == ["success", "success"]
+    assert len(progress) == 2
+    assert progress[-1][:2] == (2, 2)
+    sizes = []
+    for pp in results[0].paths_out:
+        with dclab.new_dataset(pp) as ds:
+            sizes.append(len(ds))
+            assert len(ds.logs) == 0
+            assert ds.config["experiment"]["sample"].endswith(
+                "/{}".format(len(results[0].paths_out)))
+    assert sum(sizes) == 7
+    assert len(results[1].paths_out) == len(results[0].paths_out)
+    manifest = tasks.read_checksum_manifest(tmp_path / "SHA256SUMS")
+    assert sorted(manifest) == sorted(
+        [pp.name for res in results for pp in res.paths_out])
+    for pp in results[1].paths_out:
+        assert manifest[pp.name] == results[1].checksums[str(pp)]
+
+
+def test_integrity_check_complete_metadata():
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    inputs = [tasks.TaskInput(path=path),
+              tasks.TaskInput(path=path,
+                              metadata={"setup": {"medium": "CellCarrier"}})]
+    results = tasks.integrity_check(
+        inputs,
+        num_workers=2,
+        default_metadata={"setup": {"medium": "water"}})
+    for res in results:
+        assert res.status == "success"
+        assert res.details["state"] == res.message.split("\n")[0]
+        assert "medium" in res.details["editable"]["setup"]
+    # defaults are used for editable keys that are not set by the user
+    assert results[0].details["user metadata"] == {
+        "setup": {"medium": "water"}}
+    assert results[1].details["user metadata"] == {
+        "setup": {"medium": "CellCarrier"}}